@@ -1,11 +1,20 @@
 #import the necessary moduloes for web routing, form handling, database hyandling, and secure password handling
-from flask import Flask, render_template, redirect, url_for, request, flash
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, Response, stream_with_context, make_response
+from flask.cli import AppGroup
+import click
 #from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate 
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 import os
+import json
 import secrets
-from rag_handler import RAGSystem, analyze_sentiment, detect_emotion
+import time
+from rag_handler import RAGSystem, MODEL_TASKS
+import metrics
+from inference_backend import BACKENDS, backend_for, convert
+from review_pipeline import create_review_queue, backfill_review_labels
+from review_analytics import rebuild_review_stats, summarize
+from review_themes import refresh_themes, hotel_themes, llm_labels
 from models import db # Import only the db instance first
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_limiter import Limiter
@@ -29,7 +38,7 @@ db.init_app(app)
 #initialize Migrate with our app and db.
 migrate = Migrate(app,db)
 # Now import the rest of our models
-from models import User, Hotel, FAQ, Review, HotelAmenity, Room, RoomAmenity, Booking, BookingDetail, Itinerary, Place, CustomerPreference, APICache
+from models import User, Hotel, FAQ, Review, HotelAmenity, Room, RoomAmenity, Booking, BookingDetail, Itinerary, Place, CustomerPreference, APICache, HotelReviewStats
 
 login_manager=LoginManager(app)
 login_manager.login_view='login'
@@ -48,9 +57,30 @@ Talisman(app, content_security_policy={
     'style-src': ["'self'", "cdn.jsdelivr.net"],
     'script-src': ["'self'", "cdn.jsdelivr.net"]})
 
-#Initialize RAG system within app context
+#Initialize RAG system within app context. Models load lazily on first use,
+#set RAG_WARM_UP=1 for production workers to load everything up front instead.
 with app.app_context():
     rag=RAGSystem(db)
+    rag.init_app(app)
+    rag.sync.register_events() #committed FAQ/review inserts, edits and deletes reach the vector store
+    if os.getenv('RAG_WARM_UP') == '1':
+        rag.warm_up()
+
+#sentiment/emotion analysis and indexing of new reviews run in the background
+review_queue = create_review_queue(app, rag)
+
+#per-request stage breakdown: with RAG_DEBUG_HEADER=1, query requests sending `X-RAG-Debug: 1`
+#get it back as Server-Timing (shown by browser dev tools) and X-RAG-Debug (JSON) headers
+RAG_DEBUG_HEADER = os.getenv('RAG_DEBUG_HEADER') == '1'
+
+def wants_rag_debug():
+    return RAG_DEBUG_HEADER and request.headers.get('X-RAG-Debug') == '1'
+
+def with_rag_debug(response, trace):
+    if wants_rag_debug():
+        response.headers['Server-Timing'] = trace.server_timing()
+        response.headers['X-RAG-Debug'] = json.dumps(trace.summary())
+    return response
 
 #Flask login loader
 @login_manager.user_loader
@@ -69,6 +99,16 @@ def hotel_details(hotel_id):
     reviews=Review.query.filter_by(hotel_id=hotel_id).order_by(Review.created_at.desc()).all()
     return render_template('hotel_details.html', hotel=hotel, reviews=reviews)
 
+def query_hotel_scope():
+    """Hotels a query may draw context from: owners only ever see their own properties
+    (narrowed to the current hotel page when they own it), customers asking from a
+    hotel page get that hotel only, otherwise every hotel is searched."""
+    hotel_id = request.form.get('hotel_id', type=int)
+    if current_user.role == 'property_owner':
+        owned = [hotel.id for hotel in Hotel.query.with_entities(Hotel.id).filter_by(user_id=current_user.id)]
+        return [hotel_id] if hotel_id in owned else owned
+    return [hotel_id] if hotel_id else None
+
 @app.route('/query', methods=['POST'])
 @login_required
 @limiter.limit("10/minute")
@@ -78,13 +118,56 @@ def handle_query():
         flash("Please enter a meaningful question of at least 5 characters","warning")
         return redirect(request.referrer or url_for('home')) #redirect back to where the query form was or home.
     try:
-        result = rag.query_system(question=question.strip(), role=current_user.role)
-        return render_template('query_results.html', answer=result.get('answer','No answer generated'), sources=result.get('sources',[]), query=question)
+        #sync on purpose: under WSGI an async view still holds its worker thread for the whole
+        #request, so it adds no concurrency. aquery_system is for callers running an event loop
+        with metrics.trace('query') as trace:
+            result = rag.query_system(question=question.strip(), role=current_user.role, hotel_ids=query_hotel_scope())
+        response = make_response(render_template('query_results.html', answer=result.get('answer','No answer generated'), sources=result.get('sources',[]), query=question))
+        return with_rag_debug(response, trace)
     except Exception as e:
         flash(f"Error processing query: {str(e)}", 'danger')
         app.logger.error(f"Query processing error for user{current_user.id}:{e}", exc_info=True) #log the error for debugging purposes.
         return redirect(url_for('home'))
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+#Streaming variant of /query used by static/js/query_stream.js, the plain form post above
+#stays as the fallback. Sources are sent first, then answer tokens as they are generated.
+@app.route('/query/stream', methods=['POST'])
+@login_required
+@limiter.limit("10/minute")
+def stream_query():
+    question = (request.form.get('query') or '').strip()
+    if len(question)<5:
+        return jsonify(error="Please enter a meaningful question of at least 5 characters"), 400
+    role, hotel_ids, user_id = current_user.role, query_hotel_scope(), current_user.id
+    debug = wants_rag_debug()
+    start = time.perf_counter()
+
+    def generate():
+        first_token_at = None
+        try:
+            with metrics.trace('stream_query') as trace:
+                for event, data in rag.stream_query(question=question, role=role, hotel_ids=hotel_ids):
+                    if event == 'token' and first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield sse_event(event, data)
+        except Exception as e:
+            app.logger.error(f"Streaming query error for user{user_id}:{e}", exc_info=True)
+            yield sse_event('error', "Sorry, an error occured while processing your request.")
+            return
+        total_ms = round((time.perf_counter() - start) * 1000, 1)
+        ttfb_ms = round((first_token_at - start) * 1000, 1) if first_token_at else None
+        app.logger.info(f"Streamed query: first token after {ttfb_ms} ms, complete after {total_ms} ms")
+        done = {"ttfb_ms": ttfb_ms, "total_ms": total_ms}
+        if debug: #headers are long gone by now, the breakdown rides on the final event
+            done["debug"] = trace.summary()
+        yield sse_event('done', done)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}) #no proxy buffering
+
 @app.route('/login', methods=['GET', 'POST'])
 @limiter.limit("10/minute") #limit login attempts
 def login():
@@ -228,19 +311,13 @@ def submit_review():
         except ValueError:
             app.logger.error(f"Invalid rating format received: {rating_str} for hotel{hotel_id}", exc_info=True)
 
-    
-    #Analyze sentiment and emotion
-    sentiment = analyze_sentiment(content)
-    emotion = detect_emotion(content)
-    
-    
-    # create and save the new review
-    new_review=Review(user_id=current_user.id, hotel_id=hotel_id, content=content, sentiment=sentiment, emotion=emotion, rating=rating_value, ip_address=request.remote_addr)
+    # create and save the new review, sentiment and emotion are filled in by the review queue workers
+    new_review=Review(user_id=current_user.id, hotel_id=hotel_id, content=content, rating=rating_value, ip_address=request.remote_addr)
     try:
         db.session.add(new_review)
         db.session.commit()
-        # incremental update for the new review
-        rag.add_review_to_vectorstore(new_review) #update vectorstore with the new review.
+        # analysis and incremental vector store update happen off the request thread
+        review_queue.enqueue(new_review.id)
         flash('Review submitted successfully! Thank you for your feedback', 'success')
     except Exception as e:
         db.session.rollback() #rollback in case of an error.
@@ -280,9 +357,7 @@ def submit_faq():
     new_faq=FAQ(hotel_id=hotel_id, question=question, answer=answer)
     try:
         db.session.add(new_faq)
-        db.session.commit()
-        # incremental update for the new FAQ in the vector store.
-        rag.add_faq_to_vectorstore(new_faq) #update vectorstore with the new faq.
+        db.session.commit() #the commit hook queues the new FAQ for the vector store
         flash('FAQ submitted successfully!', 'success')
     except Exception as e:
         db .session.rollback()
@@ -290,6 +365,139 @@ def submit_faq():
         app.logger.error(f"FAQ submission error for hotel{hotel_id} by user{current_user.id}:{e}", exc_info=True)
     return redirect(url_for('hotel_details', hotel_id=hotel_id))
 
+#operational endpoints (/metrics, /review_queue/stats) need `Authorization: Bearer $METRICS_TOKEN`
+#(the scraper's bearer_token), without a token set they are off
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+def metrics_token_error():
+    """Error response for a request without the metrics bearer token, None when it may proceed"""
+    if not METRICS_TOKEN:
+        return Response('Not Found', status=404)
+    supplied = request.headers.get('Authorization', '')
+    if not secrets.compare_digest(supplied.encode(), f'Bearer {METRICS_TOKEN}'.encode()):
+        return Response('Unauthorized', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return None
+
+@app.route('/metrics')
+@limiter.limit("30/minute") #a scrape every 15s fits, the default per-hour limits would not
+def prometheus_metrics():
+    """RAG latency histograms and counters in the Prometheus text format (per worker process)."""
+    return metrics_token_error() or Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/hotel/<int:hotel_id>/insights')
+@login_required
+def hotel_insights(hotel_id):
+    """Review statistics and themes of an owned hotel for the owner dashboard, read from the precomputed tables."""
+    hotel = Hotel.query.get_or_404(hotel_id)
+    if hotel.user_id != current_user.id:
+        return jsonify({'error': 'Only the hotel owner can view review insights.'}), 403
+    stats = db.session.get(HotelReviewStats, hotel_id)
+    return jsonify({
+        'hotel_id': hotel_id,
+        'summary': summarize(stats, hotel.name) if stats else None,
+        'review_count': stats.review_count if stats else 0,
+        'sentiment_counts': stats.sentiment_counts if stats else {},
+        'emotion_counts': stats.emotion_counts if stats else {},
+        'themes': [{'label': theme.label, 'terms': theme.terms, 'review_count': theme.review_count,
+                    'share': theme.share, 'sentiment_counts': theme.sentiment_counts,
+                    'avg_rating': theme.avg_rating, 'example_review_ids': theme.example_review_ids}
+                   for theme in hotel_themes(db.session, [hotel_id]).get(hotel_id, [])],
+    })
+
+@app.route('/review_queue/stats')
+@limiter.limit("30/minute")
+def review_queue_stats():
+    """Depth, lag, worker counters and dead-lettered review ids of the background review queue."""
+    return metrics_token_error() or jsonify(review_queue.stats())
+
+#CLI commands for RAG maintenance, run with `flask rag <command>`
+rag_cli = AppGroup('rag', help='RAG system maintenance commands.')
+
+@rag_cli.command('warm-up')
+def rag_warm_up():
+    """Load every model, open the vector store and print per-model load stats."""
+    for name, stat in rag.warm_up().items():
+        if stat.get('load_error'):
+            click.echo(f"{name}: load failed ({stat['load_error']}), retried in the background")
+        else:
+            click.echo(f"{name}: loaded in {stat['load_s']}s, +{stat['rss_delta_mb']} MB RSS")
+
+@rag_cli.command('reindex')
+def rag_reindex():
+    """Rebuild the vector store from SQL, reusing stored embeddings where content is unchanged."""
+    rag.rebuild_index()
+    click.echo(f"Vector store now holds {rag.vector_store._collection.count()} documents.")
+
+@rag_cli.command('convert-models')
+@click.option('--backend', type=click.Choice(BACKENDS), default=None, help='Backend to convert for (default: each model\'s configured backend).')
+@click.option('--model', 'models', multiple=True, type=click.Choice(list(MODEL_TASKS)), help='Model(s) to convert, default all.')
+@click.option('--force', is_flag=True, help='Re-export even if a cached artifact exists.')
+def rag_convert_models(backend, models, force):
+    """Export ONNX (and ONNX int8) artifacts into MODEL_ARTIFACT_DIR once, ahead of deployment."""
+    for name in models or MODEL_TASKS:
+        model_id, task = MODEL_TASKS[name]
+        target_backend = backend or backend_for(name)
+        path = convert(model_id, task, target_backend, force=force)
+        click.echo(f"{name}: {target_backend} -> {path}")
+
+@rag_cli.command('cache-stats')
+def rag_cache_stats():
+    """Print hit rates of the answer and embedding caches and re-ranker stats for this process."""
+    for name, stats in rag.cache_stats().items():
+        click.echo(f"{name}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+
+@rag_cli.command('reconcile')
+def rag_reconcile():
+    """Sync the vector store with SQL: upsert changed/missing rows, delete orphans. Safe to run from cron."""
+    for source, stats in rag.sync.reconcile().items():
+        click.echo(f"{source}: {stats['checked']} checked, {stats['upserted']} upserted "
+                   f"({stats['embedded']} re-embedded), {stats['deleted']} deleted")
+
+@rag_cli.command('cluster-themes')
+@click.option('--hotel', 'hotel_ids', multiple=True, type=int, help='Hotel(s) to cluster, default all.')
+@click.option('--force', is_flag=True, help='Re-cluster even hotels without new reviews since the last run.')
+@click.option('--llm-labels', 'use_llm', is_flag=True, help='Name each theme with one flan-t5 call instead of its top terms.')
+def rag_cluster_themes(hotel_ids, force, use_llm):
+    """Cluster review embeddings per hotel into themes. Incremental, only hotels with changed reviews are redone."""
+    rag.ensure_index() #vectors come from the collection, a fresh deployment loads it first
+    refreshed = refresh_themes(db.session, rag.vector_store._collection, list(hotel_ids) or None,
+                               force=force, label_fn=llm_labels if use_llm else None)
+    if refreshed:
+        rag.cache.bump_stats_version(refreshed) #owner answers quote the themes
+    click.echo(f"Themes refreshed for {len(refreshed)} hotels.")
+
+app.cli.add_command(rag_cli)
+
+reviews_cli = AppGroup('reviews', help='Review processing commands.')
+
+@reviews_cli.command('worker')
+def reviews_worker():
+    """Drain the out-of-process review queue (REVIEW_QUEUE_BACKEND=redis)."""
+    if not hasattr(review_queue, 'run_worker'):
+        raise click.ClickException('The in-process review queue runs inside the web workers, set REVIEW_QUEUE_BACKEND=redis.')
+    review_queue.run_worker()
+
+@reviews_cli.command('backfill')
+@click.option('--chunk-size', default=256, show_default=True, help='Reviews classified per batch.')
+@click.option('--all', 'reprocess_all', is_flag=True, help='Re-classify every review, not only those missing labels.')
+def reviews_backfill(chunk_size, reprocess_all):
+    """Fill Review.sentiment/emotion for existing rows using the batched classifiers."""
+    start = time.perf_counter()
+    done = 0
+    for done in backfill_review_labels(chunk_size=chunk_size, only_missing=not reprocess_all):
+        click.echo(f"{done} reviews classified ({done / (time.perf_counter() - start):.1f} reviews/s)")
+    click.echo(f"Backfill complete, {done} reviews updated.")
+
+@reviews_cli.command('rebuild-stats')
+@click.option('--hotel', 'hotel_ids', multiple=True, type=int, help='Hotel(s) to rebuild, default all.')
+def reviews_rebuild_stats(hotel_ids):
+    """Recompute the per-hotel review stats from the reviews table (first fill, or after edits/deletes)."""
+    count = rebuild_review_stats(db.session, list(hotel_ids) or None)
+    rag.cache.bump_stats_version(list(hotel_ids) or [row.id for row in db.session.query(Hotel.id)])
+    click.echo(f"Review stats rebuilt for {count} hotels.")
+
+app.cli.add_command(reviews_cli)
+
 #Initialize Database
 #with app.app_context():
     #db.create_all()
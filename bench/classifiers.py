@@ -0,0 +1,54 @@
+"""Benchmark: reviews/second for single vs batched sentiment and emotion calls on CPU.
+
+Usage: python -m bench.classifiers [--reviews 256] [--batch-size 32]
+"""
+import argparse
+import json
+import random
+import time
+
+from model_registry import registry
+from rag_handler import analyze_sentiment, detect_emotion
+
+PHRASES = [
+    "The room was spotless and the staff were incredibly friendly.",
+    "Breakfast was cold and the coffee machine was broken every morning.",
+    "Great location, a short walk from the beach and plenty of restaurants nearby.",
+    "Check-in took over an hour and nobody apologised for the wait.",
+    "The pool area was lovely but it got very crowded in the afternoon.",
+    "Parking was expensive and hard to find, I would not drive here again.",
+    "Wi-Fi worked well in the lobby but kept dropping in the rooms.",
+]
+
+
+def synthetic_reviews(count, seed=13):
+    #varied lengths so length-sorted bucketing has something to do
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def _rate(fn, reviews):
+    start = time.perf_counter()
+    fn(reviews)
+    return round(len(reviews) / (time.perf_counter() - start), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    reviews = synthetic_reviews(args.reviews)
+    registry.warm_up(["sentiment", "emotion"]) #keep model loading out of the timings
+    results = {}
+    for name, classify in (("sentiment", analyze_sentiment), ("emotion", detect_emotion)):
+        results[name] = {
+            "single_reviews_per_s": _rate(lambda texts: [classify(text) for text in texts], reviews),
+            "batched_reviews_per_s": _rate(lambda texts: classify(texts, batch_size=args.batch_size), reviews),
+        }
+        results[name]["speedup"] = round(results[name]["batched_reviews_per_s"] / results[name]["single_reviews_per_s"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
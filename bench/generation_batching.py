@@ -0,0 +1,97 @@
+"""Load test: per-request flan-t5 generation vs the micro-batching scheduler.
+
+Fires `--requests` prompts from `--concurrency` threads, half deterministic and
+half sampled like the two roles, and reports throughput (queries per second) and
+p50/p99 latency for both paths. `--fake` swaps flan-t5 for a model that costs a
+fixed overhead per generate call plus a smaller cost per prompt and holds a lock
+while "running", which is how batch size 1 behaves on a busy CPU.
+
+Usage: python -m bench.generation_batching [--concurrency 8] [--requests 64] [--fake]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_batcher import GenerationBatcher, generate_batch
+from rag_handler import DETERMINISTIC_GENERATION_KWARGS, STOCHASTIC_GENERATION_KWARGS
+
+PROMPTS = [
+    "Answer the question based on the context. Context: The airport shuttle leaves every 30 minutes. Question: How often does the shuttle run?",
+    "Summarize the guest feedback. Context: Staff were friendly. The room was spotless. Breakfast was cold. Question: What do guests say?",
+    "Answer the question based on the context. Context: Check-in starts at 2pm. Question: When can I check in?",
+    "Summarize the guest feedback. Context: Street noise kept us awake. Ask for a courtyard room. Question: Is the hotel quiet?",
+]
+
+
+class FakeModel:
+    """Simulated CPU generation: one call at a time, fixed overhead plus per-prompt cost"""
+
+    def __init__(self, call_ms: float = 60.0, per_prompt_ms: float = 8.0):
+        self.call_ms = call_ms
+        self.per_prompt_ms = per_prompt_ms
+        self._cpu = threading.Lock()
+
+    def generate(self, prompts, generation_kwargs):
+        with self._cpu:
+            time.sleep((self.call_ms + self.per_prompt_ms * len(prompts)) / 1000)
+        return [f"answer to: {prompt[-30:]}" for prompt in prompts]
+
+
+def _real_generate():
+    from rag_handler import _load_llm
+    llm = _load_llm()
+    return lambda prompts, kwargs: generate_batch(llm, prompts, kwargs)
+
+
+def _run(call, concurrency: int, requests: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+
+    def one(i):
+        kwargs = DETERMINISTIC_GENERATION_KWARGS if i % 2 else STOCHASTIC_GENERATION_KWARGS
+        start = time.perf_counter()
+        call(PROMPTS[i % len(PROMPTS)], kwargs)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "qps": round(requests / elapsed, 2),
+        "p50_ms": round(statistics.median(ms), 1),
+        "p99_ms": round(ms[min(len(ms) - 1, int(0.99 * len(ms)))], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--fake", action="store_true", help="simulated model, no flan-t5 download")
+    args = parser.parse_args()
+    generate = FakeModel().generate if args.fake else _real_generate()
+    generate([PROMPTS[0]], DETERMINISTIC_GENERATION_KWARGS) #warm up outside the timings
+
+    per_request = _run(lambda prompt, kwargs: generate([prompt], kwargs)[0], args.concurrency, args.requests)
+    batcher = GenerationBatcher(generate, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    batched = _run(lambda prompt, kwargs: batcher.submit(prompt, kwargs).result(), args.concurrency, args.requests)
+    batched["scheduler"] = batcher.stats()
+    batcher.shutdown()
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "per_request": per_request,
+        "batched": batched,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Recall and per-stage latency of vector-only, lexical-only and hybrid retrieval.
+
+Indexes a small hotel corpus into a temporary Chroma collection and runs a labeled
+query set (exact-term questions such as "airport shuttle" or "Wi-Fi password" next
+to paraphrased ones). Recall@k counts a query as a hit when its labeled FAQ/review
+is among the top k documents.
+
+Usage: python -m bench.hybrid_retrieval [--k 3] [--fake-embeddings]
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import rag_handler
+from lexical import reciprocal_rank_fusion
+from model_registry import registry
+from rag_handler import RAGSystem
+
+FAQS = [
+    ("Is there an airport shuttle?", "Yes, the airport shuttle leaves every 30 minutes from 5am."),
+    ("What is the Wi-Fi password?", "The Wi-Fi password is printed on your key card sleeve."),
+    ("What time is check-in?", "Check-in starts at 2pm, early check-in depends on availability."),
+    ("Is parking available?", "We have a covered car park, parking costs 15 per night."),
+    ("Do you allow pets?", "Dogs and cats under 10kg are welcome for a small fee."),
+    ("Is breakfast included?", "A continental breakfast buffet is included in every rate."),
+    ("Do you have a gym?", "The fitness room on floor 2 is open 24 hours."),
+    ("Can I store luggage after check-out?", "Yes, the concierge keeps bags until midnight."),
+]
+REVIEWS = [
+    "The rooftop pool was freezing but the view made up for it.",
+    "Staff were friendly and the room was spotless.",
+    "Street noise kept us awake, ask for a courtyard room.",
+    "The minibar prices are outrageous.",
+    "Housekeeping forgot our towels twice.",
+    "Great location next to the old town and the tram stop.",
+]
+#(question, labeled parent id)
+QUERIES = [
+    ("airport shuttle", "faq_0"),
+    ("wifi password", "faq_1"),
+    ("Wi-Fi password", "faq_1"),
+    ("How do I get from the airport to the hotel?", "faq_0"),
+    ("When can I get into my room?", "faq_2"),
+    ("Where do I leave my car?", "faq_3"),
+    ("Can I bring my dog?", "faq_4"),
+    ("Is the morning meal free?", "faq_5"),
+    ("fitness room hours", "faq_6"),
+    ("minibar prices", "review_3"),
+    ("Was it noisy at night?", "review_2"),
+    ("courtyard room", "review_2"),
+]
+
+
+def _make_rag(fake_embeddings: bool):
+    if fake_embeddings:
+        registry.register("embedder", lambda: DeterministicFakeEmbedding(size=384))
+        rag_handler.EMBEDDING_CACHE_PATH = "" #keep fake vectors out of the persistent cache
+    rag = RAGSystem(None, persist_directory=tempfile.mkdtemp(), collection_name="bench_hybrid")
+    texts, metadatas, ids = [], [], []
+    for i, (question, answer) in enumerate(FAQS):
+        texts.append(f"Question: {question}\nAnswer: {answer}")
+        metadatas.append({"source": "faq", "db_id": i, "hotel_id": 1, "parent_id": f"faq_{i}", "chunk": 0})
+        ids.append(f"faq_{i}#0")
+    for i, content in enumerate(REVIEWS):
+        texts.append(f"Review: {content}")
+        metadatas.append({"source": "review", "db_id": i, "hotel_id": 1, "parent_id": f"review_{i}", "chunk": 0})
+        ids.append(f"review_{i}#0")
+    rag.vector_store._collection.upsert(ids=ids, documents=texts, metadatas=metadatas,
+                                        embeddings=rag.embeddings.embed_documents(texts))
+    return rag
+
+
+def _recall(search, k: int) -> float:
+    hits = 0
+    for question, expected in QUERIES:
+        hits += any(doc.metadata.get("parent_id") == expected for doc in search(question)[:k])
+    return round(hits / len(QUERIES), 3)
+
+
+def _percentiles(samples: list) -> dict:
+    ms = sorted(sample * 1000 for sample in samples)
+    return {"mean_ms": round(statistics.mean(ms), 2), "p95_ms": round(ms[int(0.95 * (len(ms) - 1))], 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fake-embeddings", action="store_true", help="skip the MiniLM download, vector recall becomes meaningless")
+    args = parser.parse_args()
+    rag_handler.RETRIEVER_PARAMS = dict(rag_handler.RETRIEVER_PARAMS, customer={"k": args.k, "score_threshold": None})
+    rag = _make_rag(args.fake_embeddings)
+    rag.hybrid_search("warm up") #first call builds the BM25 index and opens the executor
+
+    pool = rag_handler.HYBRID_CANDIDATES
+    vector = rag.get_retriever(k=args.k, score_threshold=None)
+    stage_timings = {}
+    def hybrid(question):
+        docs, timings = rag.hybrid_search(question, "customer")
+        for stage, seconds in timings.items():
+            stage_timings.setdefault(stage, []).append(seconds)
+        return docs
+
+    start = time.perf_counter()
+    results = {
+        "queries": len(QUERIES),
+        "k": args.k,
+        "recall": {
+            "vector": _recall(vector.invoke, args.k),
+            "bm25": _recall(lambda question: reciprocal_rank_fusion(rag._lexical_search(question, "customer", None, pool)), args.k),
+            "hybrid": _recall(hybrid, args.k),
+        },
+    }
+    results["hybrid_stage_latency"] = {stage: _percentiles(samples) for stage, samples in stage_timings.items()}
+    results["bench_s"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Latency, memory and fp32 parity of the inference backends for every model.
+
+Each (model, backend) pair is loaded in a fresh subprocess so load time and RSS are
+not polluted by other models. Outputs on a fixed input set are compared with the
+fp32 torch run: minimum cosine similarity for the embedder, top-label agreement and
+largest score difference for the classifiers, exact-match rate of greedy answers
+for flan-t5.
+
+Usage: python -m bench.inference_backends [--backends torch,int8,onnx] [--models embedder,llm]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+TEXTS = [
+    "Absolutely loved our stay, the staff went above and beyond.",
+    "Dirty bathroom, rude reception and the air conditioning never worked.",
+    "Is there an airport shuttle from the hotel?",
+    "We were surprised by a free upgrade to a sea view room!",
+    "The breakfast was fine, nothing special.",
+    "What is the Wi-Fi password?",
+]
+PROMPTS = [
+    "Answer the question. Context: The airport shuttle leaves every 30 minutes. Question: How often does the shuttle run?",
+    "Answer the question. Context: Check-in starts at 2pm. Question: When can I check in?",
+    "Summarize: Staff were friendly. The room was spotless. Breakfast was cold.",
+]
+
+
+def _outputs(name, model):
+    from rag_handler import DETERMINISTIC_GENERATION_KWARGS
+    if name == "embedder":
+        return model.embed_documents(TEXTS)
+    if name == "llm":
+        return [model.invoke(prompt, pipeline_kwargs=DETERMINISTIC_GENERATION_KWARGS) for prompt in PROMPTS]
+    return model(TEXTS, top_k=None)
+
+
+def _child(name, repeats):
+    from model_registry import registry
+    import rag_handler  #registers the loaders
+    model = registry.get(name)
+    outputs = _outputs(name, model) #first call also warms up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _outputs(name, model)
+        timings.append((time.perf_counter() - start) * 1000)
+    stats = registry.stats()[name]
+    return {"load_s": stats["load_s"], "rss_delta_mb": stats["rss_delta_mb"],
+            "latency_ms": round(statistics.median(timings), 1), "outputs": outputs}
+
+
+def _parity(name, reference, candidate):
+    if name == "embedder":
+        ref, cand = np.asarray(reference), np.asarray(candidate)
+        cosine = (ref * cand).sum(axis=1) / (np.linalg.norm(ref, axis=1) * np.linalg.norm(cand, axis=1))
+        return {"min_cosine": round(float(cosine.min()), 4)}
+    if name == "llm":
+        return {"exact_match": round(sum(a == b for a, b in zip(reference, candidate)) / len(reference), 3)}
+    agree, max_diff = 0, 0.0
+    for ref, cand in zip(reference, candidate):
+        ref_scores = {item["label"]: item["score"] for item in ref}
+        cand_scores = {item["label"]: item["score"] for item in cand}
+        agree += max(ref_scores, key=ref_scores.get) == max(cand_scores, key=cand_scores.get)
+        max_diff = max(max_diff, max(abs(ref_scores[label] - cand_scores.get(label, 0.0)) for label in ref_scores))
+    return {"label_agreement": round(agree / len(reference), 3), "max_score_diff": round(max_diff, 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,int8,onnx,onnx-int8")
+    parser.add_argument("--models", default="embedder,sentiment,emotion,llm")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--child", nargs=2, metavar=("MODEL", "BACKEND"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_child(args.child[0], args.repeats)))
+        return
+
+    backends = args.backends.split(",")
+    if "torch" not in backends:
+        backends.insert(0, "torch") #the fp32 reference
+    results = {}
+    for name in args.models.split(","):
+        results[name] = {}
+        reference = None
+        for backend in backends:
+            env = dict(os.environ, **{f"INFERENCE_BACKEND_{name.upper()}": backend})
+            out = subprocess.run([sys.executable, "-m", "bench.inference_backends", "--child", name, backend,
+                                  "--repeats", str(args.repeats)], capture_output=True, text=True, env=env)
+            if out.returncode != 0:
+                results[name][backend] = {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+                continue
+            run = json.loads(out.stdout.strip().splitlines()[-1])
+            outputs = run.pop("outputs")
+            if backend == "torch":
+                reference = outputs
+            elif reference is not None:
+                run["parity"] = _parity(name, reference, outputs)
+            results[name][backend] = run
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
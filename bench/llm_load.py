@@ -0,0 +1,59 @@
+"""Startup benchmark for the flan-t5 generation model.
+
+Compares the old layout (one model instance per role) against a single shared
+instance with per-call sampling settings. Each mode runs in a fresh
+subprocess so load time and peak RSS are not polluted by the other mode.
+
+Usage: python -m bench.llm_load
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+MODEL_ID = "google/flan-t5-base"
+
+
+def _peak_rss_mb():
+    #ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _load(instances):
+    from langchain_community.llms import HuggingFacePipeline
+    baseline_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    llms = [
+        HuggingFacePipeline.from_model_id(
+            model_id=MODEL_ID,
+            task="text2text-generation",
+            model_kwargs={"device_map": "auto"},
+            pipeline_kwargs={"max_length": 512},
+        )
+        for _ in range(instances)
+    ]
+    load_s = time.perf_counter() - start
+    #make sure both roles can still generate from what was loaded
+    llms[0].invoke("Where is the Eiffel tower?", pipeline_kwargs={"do_sample": False})
+    llms[-1].invoke("Where is the Eiffel tower?", pipeline_kwargs={"do_sample": True, "temperature": 0.2})
+    return {"instances": instances, "load_s": round(load_s, 2),
+            "rss_delta_mb": round(_peak_rss_mb() - baseline_rss, 1)}
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        print(json.dumps(_load(int(sys.argv[2]))))
+        return
+    results = {}
+    for label, instances in (("per_role", 2), ("shared", 1)):
+        out = subprocess.run([sys.executable, "-m", "bench.llm_load", "--child", str(instances)],
+                             capture_output=True, text=True, check=True)
+        results[label] = json.loads(out.stdout.strip().splitlines()[-1])
+    results["load_s_saved"] = round(results["per_role"]["load_s"] - results["shared"]["load_s"], 2)
+    results["rss_saved_mb"] = round(results["per_role"]["rss_delta_mb"] - results["shared"]["rss_delta_mb"], 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
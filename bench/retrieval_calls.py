@@ -0,0 +1,94 @@
+"""Micro-benchmark: embedding and vector search calls per query.
+
+Runs the old per-request chain layout (retriever executed twice) next to the
+prebuilt RAGSystem chain against an in-memory Chroma collection with counting
+fake embeddings and a fake LLM, so no model downloads are needed.
+
+Usage: python -m bench.retrieval_calls
+"""
+import json
+import tempfile
+import time
+from operator import itemgetter
+
+from langchain_community.llms.fake import FakeListLLM
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain.prompts import PromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain.schema.runnable import RunnableParallel, RunnablePassthrough
+
+import rag_handler
+from model_registry import registry
+from rag_handler import PROMPT_TEMPLATES, RETRIEVER_PARAMS, RAGSystem, format_docs
+
+QUESTIONS = ["What time is check-in?", "Is there free parking?", "Do you have an airport shuttle?"]
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embed_calls: int = 0
+
+    def embed_query(self, text):
+        self.embed_calls += 1
+        return super().embed_query(text)
+
+
+EMBEDDER = CountingEmbeddings(size=384)
+SEARCH_CALLS = {"count": 0}
+
+
+def _make_rag():
+    #swap the real models for fakes, only the chain layout is measured
+    registry.register("embedder", lambda: EMBEDDER)
+    registry.register("llm", lambda: FakeListLLM(responses=["ok"] * 1000))
+    #no embedding cache, every query must reach the counting embedder
+    rag_handler.EMBEDDING_CACHE_PATH = ""
+    rag_handler.EMBEDDING_CACHE_MEMORY = 0
+    rag = RAGSystem(None, persist_directory=tempfile.mkdtemp(), collection_name="bench_retrieval_calls")
+    rag.vector_store.add_texts(
+        [f"Question: {q}\nAnswer: sample answer" for q in QUESTIONS],
+        metadatas=[{"source": "faq", "db_id": i, "hotel_id": 1} for i in range(len(QUESTIONS))],
+    )
+    search = rag.vector_store.similarity_search_with_relevance_scores
+
+    def counting_search(*args, **kwargs):
+        SEARCH_CALLS["count"] += 1
+        return search(*args, **kwargs)
+    rag.vector_store.similarity_search_with_relevance_scores = counting_search
+    return rag
+
+
+def _legacy_chain(rag):
+    retriever = rag.get_retriever(**RETRIEVER_PARAMS["customer"])
+    prompt = PromptTemplate(template=PROMPT_TEMPLATES["customer"], input_variables=["context", "question"])
+    #same layout as before, the question is picked out of the parallel step's dict for the second retrieval
+    core = ({"context": itemgetter("question") | retriever | format_docs, "question": itemgetter("question")}
+            | prompt | rag.llm_stochastic | StrOutputParser())
+    return RunnableParallel({"docs": retriever, "question": RunnablePassthrough()}) | RunnableParallel(
+        {"answer": core, "documents": lambda x: x["docs"]})
+
+
+def _measure(chain, make_input):
+    EMBEDDER.embed_calls = 0
+    SEARCH_CALLS["count"] = 0
+    start = time.perf_counter()
+    for question in QUESTIONS:
+        chain.invoke(make_input(question))
+    elapsed = time.perf_counter() - start
+    return {
+        "embed_calls_per_query": EMBEDDER.embed_calls / len(QUESTIONS),
+        "search_calls_per_query": SEARCH_CALLS["count"] / len(QUESTIONS),
+        "ms_per_query": round(elapsed * 1000 / len(QUESTIONS), 2),
+    }
+
+
+def main():
+    rag = _make_rag()
+    results = {
+        "legacy": _measure(_legacy_chain(rag), lambda question: question),
+        "prebuilt": _measure(rag._build_chain("customer"), lambda question: {"question": question, "hotel_ids": None}),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
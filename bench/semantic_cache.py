@@ -0,0 +1,101 @@
+"""Hit rate and false-hit rate of the semantic answer cache on a paraphrase set.
+
+The cache is seeded with one answered question per intent. Paraphrases of those
+questions should be served from the cache, near misses (same words, different
+intent such as check-in vs check-out) must not be. For each threshold:
+
+  hit_rate        paraphrases answered from the cache with the right intent
+  false_hit_rate  lookups answered from the cache with the wrong intent
+
+Usage: python -m bench.semantic_cache [--thresholds 0.85,0.9,0.92,0.95]
+"""
+import argparse
+import json
+
+import rag_handler  #registers the loaders
+from model_registry import registry
+from rag_cache import SemanticAnswerCache
+
+#intent -> question the cache is seeded with
+SEEDS = {
+    "checkin": "What time is check-in?",
+    "checkout": "What time is check-out?",
+    "shuttle": "Is there an airport shuttle?",
+    "wifi": "What is the Wi-Fi password?",
+    "parking": "Is parking available?",
+    "pets": "Do you allow pets?",
+    "breakfast": "Is breakfast included?",
+    "pool": "Is the pool heated?",
+}
+#(question, intent it should be answered as)
+PARAPHRASES = [
+    ("When can I check in?", "checkin"),
+    ("what time does check in start", "checkin"),
+    ("When do I have to check out?", "checkout"),
+    ("What is the latest check-out time?", "checkout"),
+    ("Do you have a shuttle from the airport?", "shuttle"),
+    ("Is there a shuttle bus to the airport?", "shuttle"),
+    ("What's the wifi password?", "wifi"),
+    ("How do I get the Wi-Fi password?", "wifi"),
+    ("Do you have parking?", "parking"),
+    ("Is there a car park at the hotel?", "parking"),
+    ("Are pets allowed?", "pets"),
+    ("Can I bring my dog?", "pets"),
+    ("Is breakfast included in the price?", "breakfast"),
+    ("Do I get free breakfast?", "breakfast"),
+    ("Is the swimming pool heated?", "pool"),
+    ("Is the pool warm?", "pool"),
+]
+#questions no seed answers, a served answer is always wrong
+NEAR_MISSES = [
+    "What time does breakfast end?",
+    "Is the gym open 24 hours?",
+    "Is there a train from the airport?",
+    "Is parking free for motorbikes?",
+    "Do you allow smoking?",
+    "Is the pool open at night?",
+    "Can I get a late check-in after midnight?",
+    "Is dinner included?",
+    "What is the password for the safe?",
+    "Are children allowed?",
+]
+
+
+def _run(embedder, threshold: float) -> dict:
+    cache = SemanticAnswerCache(threshold=threshold)
+    for intent, question in SEEDS.items():
+        cache.set(embedder.embed_query(question), "customer", [1], 0, {"answer": intent, "sources": []})
+    hits = false_hits = 0
+    lookups = [(question, intent) for question, intent in PARAPHRASES] + [(question, None) for question in NEAR_MISSES]
+    for question, intent in lookups:
+        result = cache.get(embedder.embed_query(question), "customer", [1], 0)
+        if result is None:
+            continue
+        if result["answer"] == intent:
+            hits += 1
+        else:
+            false_hits += 1
+    return {
+        "threshold": threshold,
+        "hit_rate": round(hits / len(PARAPHRASES), 3),
+        "false_hit_rate": round(false_hits / len(lookups), 3),
+        "false_hits": false_hits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--thresholds", default="0.8,0.85,0.9,0.92,0.95")
+    args = parser.parse_args()
+    embedder = registry.get("embedder")
+    results = [_run(embedder, float(threshold)) for threshold in args.thresholds.split(",")]
+    print(json.dumps({
+        "paraphrases": len(PARAPHRASES),
+        "near_misses": len(NEAR_MISSES),
+        "configured_threshold": rag_handler.SEMANTIC_CACHE_THRESHOLD,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
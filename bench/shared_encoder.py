@@ -0,0 +1,57 @@
+"""Compare the two-model classifier setup with the shared emotion-encoder mode.
+
+Reports CPU time per review for each mode, and how often the shared mode's
+sentiment and emotion labels agree with the current two-model output.
+
+Usage: python -m bench.shared_encoder [--reviews 256]
+"""
+import argparse
+import json
+import time
+
+import rag_handler
+from bench.classifiers import synthetic_reviews
+from model_registry import registry
+
+FIXED_REVIEWS = [
+    "Absolutely loved our stay, the staff went above and beyond.",
+    "Dirty bathroom, rude reception and the air conditioning never worked.",
+    "The hotel is located near the station.",
+    "I was scared walking back at night, the street is badly lit.",
+    "We were surprised by a free upgrade to a sea view room!",
+    "Disgusting breakfast, I could not eat any of it.",
+    "It was fine, nothing special.",
+]
+
+
+def _run(mode, reviews):
+    rag_handler.CLASSIFIER_MODE = mode
+    start = time.process_time()
+    sentiments, emotions = rag_handler.analyze_review(reviews)
+    return sentiments, emotions, (time.process_time() - start) * 1000 / len(reviews)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=256)
+    args = parser.parse_args()
+    reviews = FIXED_REVIEWS + synthetic_reviews(args.reviews)
+    registry.warm_up(["sentiment", "emotion"]) #keep model loading out of the timings
+    sep_sentiments, sep_emotions, sep_ms = _run("separate", reviews)
+    shared_sentiments, shared_emotions, shared_ms = _run("shared", reviews)
+    agree = sum(a == b for a, b in zip(sep_sentiments, shared_sentiments))
+    print(json.dumps({
+        "reviews": len(reviews),
+        "separate_cpu_ms_per_review": round(sep_ms, 2),
+        "shared_cpu_ms_per_review": round(shared_ms, 2),
+        "sentiment_agreement": round(agree / len(reviews), 3),
+        "emotion_agreement": round(sum(a == b for a, b in zip(sep_emotions, shared_emotions)) / len(reviews), 3),
+        "disagreements": [
+            {"review": review[:80], "separate": a, "shared": b}
+            for review, a, b in zip(reviews, sep_sentiments, shared_sentiments) if a != b
+        ][:10],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Reproducible offline benchmark suite: ingest, query latency, classifiers, cold start.
+
+Seeds a temporary SQLite database through the app's models with deterministic
+synthetic hotels, FAQs and reviews (`--scale` reviews, a tenth as many FAQs, one
+hotel per 100 reviews), indexes it into a temporary Chroma collection and measures:
+
+  ingest_docs_per_s              bulk load of every FAQ and review (rebuild_index)
+  query_<role>_p50/p95/p99_ms    uncached query_system latency per role
+  sentiment/emotion_reviews_per_s  batched classifier throughput
+  cold_start_s                   fresh process: import, open the index, first answer
+
+Results are written as JSON together with the retrieval/chunking config they were
+measured under. `--baseline` compares against an earlier result file and flags every
+metric that got worse by more than `--tolerance` (exit code 1 with --fail-on-regression).
+`--fake` swaps every model for a cheap stand-in, which checks the harness and the
+non-model overhead without any downloads.
+
+Usage: python -m bench.suite [--scale 1k|10k|100k] [--fake] [--output bench_output.json]
+                             [--baseline bench/baseline.json] [--tolerance 0.1]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+SEED = 13
+
+CITIES = ["Lisbon", "Porto", "Seville", "Valencia", "Nice", "Florence", "Split", "Athens"]
+FAQ_TOPICS = [
+    ("What time is check-in?", "Check-in starts at {hour}pm, early check-in depends on availability."),
+    ("Is there an airport shuttle?", "The shuttle leaves every {minutes} minutes from the main entrance."),
+    ("Is parking available?", "Covered parking costs {price} per night, book it in advance."),
+    ("Do you allow pets?", "Pets under {weight}kg are welcome for a small fee."),
+    ("Is breakfast included?", "A buffet breakfast is served until {hour}am and included in most rates."),
+    ("What is the Wi-Fi password?", "The Wi-Fi password is printed on the key card sleeve."),
+    ("Is the pool heated?", "The rooftop pool is heated to {degrees} degrees from May to October."),
+]
+REVIEW_PHRASES = [
+    "The room was spotless and the staff were incredibly friendly.",
+    "Breakfast was cold and the coffee machine was broken every morning.",
+    "Great location, a short walk from the beach and plenty of restaurants nearby.",
+    "Check-in took over an hour and nobody apologised for the wait.",
+    "The pool area was lovely but it got very crowded in the afternoon.",
+    "Parking was expensive and hard to find, I would not drive here again.",
+    "Wi-Fi worked well in the lobby but kept dropping in the rooms.",
+    "Street noise kept us awake, ask for a courtyard room.",
+    "Housekeeping forgot our towels twice.",
+    "The airport shuttle was punctual and the driver helpful.",
+]
+QUESTIONS = {
+    "customer": ["What time is check-in?", "Is there a shuttle from the airport?", "Can I bring my dog?",
+                 "Is breakfast included?", "Is the pool heated?", "Where can I park my car?",
+                 "Is the hotel quiet at night?", "Is the Wi-Fi good?"],
+    "property_owner": ["What do guests complain about?", "How do guests rate breakfast?",
+                       "What do guests say about the staff?", "Are there complaints about noise?",
+                       "What should we improve first?", "How is the Wi-Fi rated?"],
+}
+SENTIMENTS = ["positive", "negative", "neutral"]
+EMOTIONS = ["joy", "sadness", "anger", "surprise", "neutral", "disgust", "fear"]
+
+
+def synthetic_rows(reviews: int, seed: int = SEED) -> dict:
+    """Deterministic users, hotels, FAQs and reviews as plain dicts ready for bulk inserts"""
+    rng = random.Random(seed)
+    hotels = max(1, reviews // 100)
+    faqs = max(1, reviews // 10)
+    customers = max(10, reviews // 20)
+    owners = max(1, hotels // 5)
+    users = [{"id": i + 1, "username": f"owner{i}", "email": f"owner{i}@bench.local", "contact_number": "0",
+              "password_hash": "x", "role": "property_owner"} for i in range(owners)]
+    users += [{"id": owners + i + 1, "username": f"guest{i}", "email": f"guest{i}@bench.local", "contact_number": "0",
+               "password_hash": "x", "role": "customer"} for i in range(customers)]
+    hotel_rows = [{"id": i + 1, "user_id": i % owners + 1, "name": f"Hotel {i}", "location": rng.choice(CITIES),
+                   "price": rng.randint(60, 400)} for i in range(hotels)]
+    faq_rows = []
+    for i in range(faqs):
+        question, answer = rng.choice(FAQ_TOPICS)
+        faq_rows.append({"id": i + 1, "hotel_id": rng.randint(1, hotels), "question": question,
+                         "answer": answer.format(hour=rng.randint(1, 4), minutes=rng.choice([15, 20, 30]),
+                                                 price=rng.randint(5, 30), weight=rng.choice([5, 10, 20]),
+                                                 degrees=rng.randint(24, 30))})
+    start = datetime(2024, 1, 1)
+    review_rows = []
+    for i in range(reviews):
+        rating = rng.randint(1, 5)
+        review_rows.append({
+            "id": i + 1, "user_id": owners + rng.randint(1, customers), "hotel_id": rng.randint(1, hotels),
+            "content": " ".join(rng.choice(REVIEW_PHRASES) for _ in range(rng.randint(1, 6))),
+            "rating": rating, "sentiment": SENTIMENTS[0 if rating >= 4 else 1 if rating <= 2 else 2],
+            "emotion": rng.choice(EMOTIONS), "created_at": start + timedelta(minutes=rng.randint(0, 60 * 24 * 730)),
+        })
+    return {"users": users, "hotels": hotel_rows, "faqs": faq_rows, "reviews": review_rows}
+
+
+def make_app(database_path: str):
+    from flask import Flask
+    from models import db
+    app = Flask("bench")
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def seed(app, rows: dict, chunk: int = 5000):
+    from sqlalchemy import insert
+    from models import db, User, Hotel, FAQ, Review
+    with app.app_context():
+        db.create_all()
+        for model, key in ((User, "users"), (Hotel, "hotels"), (FAQ, "faqs"), (Review, "reviews")):
+            for start in range(0, len(rows[key]), chunk):
+                db.session.execute(insert(model), rows[key][start:start + chunk])
+            db.session.commit()
+
+
+class WhitespaceTokenizer:
+    """Stand-in for the HF tokenizers in --fake mode, one token per whitespace separated word"""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        offsets = [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]
+        encoded = {"input_ids": list(range(len(offsets)))}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = offsets
+        return encoded
+
+
+def _fake_classifier(labels):
+    def classify(texts, top_k=None, **kwargs):
+        scored = [{"label": label, "score": 1.0 / len(labels)} for label in labels]
+        scored[len(texts) % len(labels)]["score"] = 0.9
+        return [list(scored) if top_k is None else max(scored, key=lambda item: item["score"]) for _ in texts]
+    return classify
+
+
+def register_fakes():
+    from langchain_community.llms.fake import FakeListLLM
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from model_registry import registry
+    registry.register("embedder", lambda: DeterministicFakeEmbedding(size=384))
+    registry.register("llm", lambda: FakeListLLM(responses=["benchmark answer"]))
+    registry.register("embedding_tokenizer", WhitespaceTokenizer)
+    registry.register("llm_tokenizer", WhitespaceTokenizer)
+    registry.register("sentiment", lambda: _fake_classifier(["POSITIVE", "NEGATIVE"]))
+    registry.register("emotion", lambda: _fake_classifier(EMOTIONS))
+
+
+def _configure(fake: bool):
+    """Import rag_handler for a benchmark run: no persistent caches, every query answered from scratch"""
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    import rag_handler
+    rag_handler.CACHE_PATH = tempfile.mktemp(suffix=".db")
+    rag_handler.CACHE_TTL = -1 #every cached answer is already expired
+    rag_handler.EMBEDDING_CACHE_PATH = ""
+    rag_handler.SEMANTIC_CACHE_ENABLED = False
+    if fake:
+        register_fakes()
+    return rag_handler
+
+
+def _percentiles(ms: list) -> dict:
+    ms = sorted(ms)
+    pick = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 1)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def measure_ingest(rag, docs: int) -> dict:
+    start = time.perf_counter()
+    rag.rebuild_index()
+    elapsed = time.perf_counter() - start
+    return {"ingest_s": round(elapsed, 2), "ingest_docs_per_s": round(docs / elapsed, 1)}
+
+
+def measure_queries(rag, rows: dict, queries: int) -> dict:
+    rng = random.Random(SEED)
+    hotel_ids = [hotel["id"] for hotel in rows["hotels"]]
+    owned = {}
+    for hotel in rows["hotels"]:
+        owned.setdefault(hotel["user_id"], []).append(hotel["id"])
+    results = {}
+    for role, questions in QUESTIONS.items():
+        rag.query_system(questions[0], role=role) #first call builds the chain, not part of the timings
+        latencies = []
+        for i in range(queries):
+            scope = [rng.choice(hotel_ids)] if role == "customer" else owned[rng.choice(list(owned))]
+            start = time.perf_counter()
+            rag.query_system(questions[i % len(questions)], role=role, hotel_ids=scope)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.update({f"query_{role}_{name}": value for name, value in _percentiles(latencies).items()})
+    return results
+
+
+def measure_classifiers(rag_handler, rows: dict, count: int) -> dict:
+    texts = [review["content"] for review in rows["reviews"][:count]]
+    results = {}
+    for name, fn in (("sentiment", rag_handler.analyze_sentiment), ("emotion", rag_handler.detect_emotion)):
+        fn(texts[:2]) #load the model outside the timing
+        start = time.perf_counter()
+        fn(texts)
+        results[f"{name}_reviews_per_s"] = round(len(texts) / (time.perf_counter() - start), 1)
+    return results
+
+
+def cold_start_child(database_path: str, persist_directory: str, fake: bool) -> dict:
+    """Runs in a fresh interpreter: time to the first answered query on an existing index"""
+    start = time.perf_counter()
+    rag_handler = _configure(fake)
+    imported = time.perf_counter()
+    app = make_app(database_path)
+    with app.app_context():
+        from models import db
+        rag = rag_handler.RAGSystem(db, persist_directory=persist_directory, collection_name="bench_suite")
+        rag.init_app(app)
+        rag.query_system(QUESTIONS["customer"][0])
+    done = time.perf_counter()
+    return {"cold_start_s": round(done - start, 2), "cold_start_import_s": round(imported - start, 2),
+            "cold_start_first_query_s": round(done - imported, 2)}
+
+
+def measure_cold_start(database_path: str, persist_directory: str, fake: bool) -> dict:
+    command = [sys.executable, "-m", "bench.suite", "--child-cold-start", database_path, persist_directory]
+    if fake:
+        command.append("--fake")
+    out = subprocess.run(command, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"cold start run failed: {out.stderr.strip()[-500:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def config_snapshot(rag_handler) -> dict:
+    """Settings a result depends on, kept next to the numbers so runs stay comparable"""
+    from inference_backend import backend_for
+    return {
+        "retriever_params": rag_handler.RETRIEVER_PARAMS,
+        "chunk_settings": rag_handler.CHUNK_SETTINGS,
+        "retrieval_mode": rag_handler.RETRIEVAL_MODE,
+        "hybrid_candidates": rag_handler.HYBRID_CANDIDATES,
+        "rerank": rag_handler.RERANK_ENABLED,
+        "classifier_mode": rag_handler.CLASSIFIER_MODE,
+        "classifier_batch_size": rag_handler.CLASSIFIER_BATCH_SIZE,
+        "generation_batching": rag_handler.GENERATION_BATCHING,
+        "backends": {name: backend_for(name) for name in rag_handler.MODEL_TASKS},
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """One row per metric present in both runs. *_per_s is better when higher, times when lower."""
+    rows = []
+    for name, value in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if not base:
+            continue
+        change = (value - base) / base
+        higher_is_better = name.endswith("_per_s")
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        rows.append({"metric": name, "baseline": base, "current": value,
+                     "change_pct": round(change * 100, 1), "regression": regressed})
+    return rows
+
+
+def run(args) -> dict:
+    rag_handler = _configure(args.fake)
+    reviews = SCALES[args.scale]
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    database_path = os.path.join(workdir, "bench.db")
+    persist_directory = os.path.join(workdir, "chroma")
+    rows = synthetic_rows(reviews)
+    app = make_app(database_path)
+    start = time.perf_counter()
+    seed(app, rows)
+    metrics = {"seed_s": round(time.perf_counter() - start, 2)}
+    with app.app_context():
+        from models import db
+        rag = rag_handler.RAGSystem(db, persist_directory=persist_directory, collection_name="bench_suite")
+        rag.init_app(app)
+        metrics.update(measure_ingest(rag, len(rows["faqs"]) + len(rows["reviews"])))
+        metrics.update(measure_queries(rag, rows, args.queries))
+    metrics.update(measure_classifiers(rag_handler, rows, min(args.classify, reviews)))
+    metrics.update(measure_cold_start(database_path, persist_directory, args.fake))
+    return {
+        "meta": {
+            "scale": args.scale, "fake_models": args.fake, "queries_per_role": args.queries,
+            "hotels": len(rows["hotels"]), "faqs": len(rows["faqs"]), "reviews": len(rows["reviews"]),
+            "python": platform.python_version(), "machine": platform.machine(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "config": config_snapshot(rag_handler),
+        "metrics": metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", choices=list(SCALES), default="1k")
+    parser.add_argument("--queries", type=int, default=50, help="timed queries per role")
+    parser.add_argument("--classify", type=int, default=512, help="reviews per classifier run")
+    parser.add_argument("--fake", action="store_true", help="stand-in models, no downloads")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--child-cold-start", nargs=2, metavar=("DATABASE", "CHROMA_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child_cold_start:
+        print(json.dumps(cold_start_child(*args.child_cold_start, args.fake)))
+        return
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("scale") != args.scale or baseline.get("meta", {}).get("fake_models") != args.fake:
+            print("warning: baseline was measured at a different scale or with different models", file=sys.stderr)
+        if baseline.get("config") != json.loads(json.dumps(result["config"])): #tuples come back as lists
+            print("note: config differs from the baseline", file=sys.stderr)
+        result["comparison"] = compare(result, baseline, args.tolerance)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    regressions = [row for row in result.get("comparison", []) if row["regression"]]
+    for row in regressions:
+        print(f"REGRESSION {row['metric']}: {row['baseline']} -> {row['current']} ({row['change_pct']:+}%)", file=sys.stderr)
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+NO_CONTEXT = "No relevant documents found."
+
+
+def _token_offsets(text: str, tokenizer) -> list:
+    """(start, end) character offsets of every token in text, special tokens excluded"""
+    return tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+
+
+def count_tokens(text: str, tokenizer) -> int:
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def chunk_text(text: str, tokenizer, chunk_size: int, overlap: int) -> list[str]:
+    """Split text into windows of at most `chunk_size` tokens, consecutive windows sharing
+    `overlap` tokens. Chunks are slices of the original text so nothing is re-worded."""
+    offsets = _token_offsets(text, tokenizer)
+    if len(offsets) <= chunk_size:
+        return [text]
+    step = max(chunk_size - overlap, 1)
+    chunks = []
+    for start in range(0, len(offsets), step):
+        window = offsets[start:start + chunk_size]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + chunk_size >= len(offsets):
+            break
+    return chunks
+
+
+def truncate_to_tokens(text: str, tokenizer, max_tokens: int) -> str:
+    offsets = _token_offsets(text, tokenizer)
+    if len(offsets) <= max_tokens:
+        return text
+    return text[:offsets[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+
+def pack_context(docs, prompt_overhead: int, tokenizer, max_tokens: int, min_partial_tokens: int = 32) -> str:
+    """Fill the prompt context with retrieved docs in rank order until the model's input
+    limit is reached. `prompt_overhead` is the token count of the prompt without context.
+    Duplicate chunks are skipped and the last doc that does not fit whole is cut at a
+    token boundary (if enough room is left), so nothing is sent that would be truncated anyway."""
+    budget = max_tokens - prompt_overhead
+    parts = []
+    seen = set()
+    for doc in docs:
+        text = doc.page_content
+        if text in seen:
+            continue
+        seen.add(text)
+        cost = count_tokens(text, tokenizer) + (2 if parts else 0) #the blank line separator
+        if cost <= budget:
+            parts.append(text)
+            budget -= cost
+            continue
+        if budget >= min_partial_tokens:
+            parts.append(truncate_to_tokens(text, tokenizer, budget - 2))
+        break
+    return "\n\n".join(parts) if parts else NO_CONTEXT
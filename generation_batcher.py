@@ -0,0 +1,157 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+logger = logging.getLogger(__name__)
+
+
+def generate_batch(llm, prompts: list[str], generation_kwargs: dict) -> list[str]:
+    """One padded `generate` call for a list of prompts on a HuggingFacePipeline. Other
+    LLMs (fakes in tests and benches) fall back to their own batch()."""
+    pipeline = getattr(llm, "pipeline", None)
+    if pipeline is None:
+        return llm.batch(prompts, pipeline_kwargs=generation_kwargs)
+    import torch
+    tokenizer = pipeline.tokenizer
+    inputs = tokenizer(prompts, padding=True, truncation=True, max_length=tokenizer.model_max_length,
+                       return_tensors="pt").to(pipeline.model.device)
+    with torch.no_grad():
+        outputs = pipeline.model.generate(**inputs, **generation_kwargs)
+    return tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+
+def _resolve(future: Future, result=None, error: Exception = None):
+    """Set a future's outcome unless it is already resolved or was cancelled by its caller"""
+    if future.done():
+        return
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError: #cancelled in between
+        pass
+
+
+class GenerationBatcher:
+    """Micro-batching scheduler in front of the generation model.
+
+    Request threads submit a prompt plus its generation kwargs and get a Future back.
+    A single scheduler thread waits for the first prompt, keeps collecting for up to
+    `max_wait_ms` or until `max_batch` prompts are queued, then runs one padded
+    generate call per distinct set of generation kwargs (so deterministic and sampled
+    requests are never mixed) and resolves the futures.
+    """
+
+    def __init__(self, generate_fn, max_batch: int = 8, max_wait_ms: float = 10.0):
+        self.generate_fn = generate_fn #(prompts, generation_kwargs) -> list of texts
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "batches": 0, "failed": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def submit(self, prompt: str, generation_kwargs: dict = None) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((prompt, dict(generation_kwargs or {}), future))
+        return future
+
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) #stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for prompt, kwargs, future in batch:
+                groups.setdefault(json.dumps(kwargs, sort_keys=True), (kwargs, []))[1].append((prompt, future))
+            for kwargs, items in groups.values():
+                try:
+                    texts = list(self.generate_fn([prompt for prompt, _ in items], kwargs))
+                    if len(texts) != len(items):
+                        #zip would leave the callers of the missing texts waiting forever
+                        raise ValueError(f"generate_fn returned {len(texts)} texts for {len(items)} prompts")
+                    for (_, future), text in zip(items, texts):
+                        _resolve(future, result=text)
+                except Exception as e:
+                    logger.error("Generation batch of %d failed: %s", len(items), e, exc_info=True)
+                    for _, future in items:
+                        _resolve(future, error=e) #futures resolved before the failure keep their result
+                    with self._lock:
+                        self._counters["failed"] += len(items)
+                with self._lock:
+                    self._counters["requests"] += len(items)
+                    self._counters["batches"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters["avg_batch_size"] = round(counters["requests"] / counters["batches"], 2) if counters["batches"] else 0.0
+        counters["queued"] = self._queue.qsize()
+        return counters
+
+    def shutdown(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=30)
+
+
+class BatchedLLM(LLM):
+    """LangChain LLM that routes invoke() through a GenerationBatcher. pipeline_kwargs
+    (bound per role) become the batch's generation kwargs. Streaming bypasses the
+    batcher and streams from `stream_llm` directly, one request per generate call."""
+
+    batcher: Any
+    stream_llm: Any = None #callable returning the LLM used for .stream()
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched_generation"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.batcher.submit(prompt, kwargs.get("pipeline_kwargs")).result()
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        try:
+            yield from self.stream_llm()._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+        except NotImplementedError:
+            #the underlying LLM cannot stream, answer in one piece
+            yield GenerationChunk(text=self._call(prompt, stop=stop, **kwargs))
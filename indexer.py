@@ -0,0 +1,344 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import metrics
+from models import FAQ, Review
+
+logger = logging.getLogger(__name__)
+
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 256))
+WRITE_BEHIND_MAX_DOCS = int(os.getenv("WRITE_BEHIND_MAX_DOCS", 64))
+WRITE_BEHIND_MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_DELAY", 0.5)) #seconds
+#a failed flush keeps its rows and retries with backoff, rows failing this often are dropped for reconcile to repair
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", 5))
+WRITE_BEHIND_MAX_BACKOFF = 60.0
+EMBEDDING_STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32") #or float16 to halve the column size
+
+
+#Stored embeddings are the raw buffer of the row's chunk vectors prefixed with the numpy
+#dtype char ('f' float32, 'e' float16) so rows written with either setting stay readable.
+def encode_embedding(vectors, dtype: str = EMBEDDING_STORE_DTYPE) -> bytes:
+    array = np.asarray(vectors, dtype=dtype)
+    return array.dtype.char.encode("ascii") + array.tobytes()
+
+def decode_embedding(blob: bytes, chunks: int = 1) -> list:
+    """One vector per chunk, the chunk count comes from re-chunking the row's text"""
+    array = np.frombuffer(blob[1:], dtype=blob[:1].decode("ascii")).astype(np.float32)
+    return array.reshape(chunks, -1).tolist()
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+#Document text, ids and metadata for each source. These accept ORM objects as
+#well as plain column rows, so the bulk indexer never has to load full entities.
+def faq_document(faq) -> str:
+    return f"Question: {faq.question}\nAnswer: {faq.answer}"
+
+def faq_metadata(faq) -> dict:
+    return {"source": "faq", "db_id": faq.id, "hotel_id": faq.hotel_id}
+
+def review_document(review) -> str:
+    return f"Review: {review.content}"
+
+def review_metadata(review) -> dict:
+    return {"source": "review", "db_id": review.id, "user_id": review.user_id, "hotel_id": review.hotel_id}
+
+
+#source name -> (model, columns to select, document builder, metadata builder)
+INDEX_SOURCES = {
+    "faq": (FAQ, (FAQ.id, FAQ.hotel_id, FAQ.question, FAQ.answer,
+                  FAQ.embedding, FAQ.embedding_model, FAQ.embedding_hash), faq_document, faq_metadata),
+    "review": (Review, (Review.id, Review.user_id, Review.hotel_id, Review.content,
+                        Review.embedding, Review.embedding_model, Review.embedding_hash), review_document, review_metadata),
+}
+
+
+class BulkIndexer:
+    """Streams SQL rows into the Chroma collection in keyset-paginated batches.
+
+    Each batch is read as plain column rows (`id > last_id ORDER BY id LIMIT n`),
+    embedded with one batched encode call and upserted, so memory stays flat
+    however large the table is. The last indexed id per source is written to a
+    checkpoint file after every batch, an interrupted load resumes from there.
+
+    Every row is split into chunks by `chunker(source, text)` and stored as documents
+    `<source>_<id>#<n>` carrying a `parent_id` of `<source>_<id>`, so re-indexing a row
+    replaces all of its chunks.
+
+    Embeddings are persisted in the rows' embedding column, tagged with the model
+    name and a hash of the chunked text. Rows whose tag still matches are indexed
+    from SQL without any model inference, only new or changed rows are embedded.
+    Chunks carry the model tag in their metadata too, see model_mismatch().
+    """
+
+    def __init__(self, session, vector_store, embeddings, checkpoint_path: str,
+                 model_name: str, chunker, batch_size: int = INDEX_BATCH_SIZE):
+        self.session = session
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.checkpoint_path = checkpoint_path
+        self.model_name = model_name
+        self.chunker = chunker
+        self.batch_size = batch_size
+
+    def load_checkpoint(self) -> dict:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_checkpoint(self, checkpoint: dict):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path) #atomic so a crash never leaves half a checkpoint
+
+    def reset_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def pending_sources(self) -> list:
+        """Sources still to load when a previous load was interrupted (empty if no load is in progress)"""
+        checkpoint = self.load_checkpoint()
+        if not checkpoint:
+            return []
+        return [source for source in INDEX_SOURCES if not checkpoint.get(source, {}).get("done")]
+
+    def model_mismatch(self) -> bool:
+        """True when the collection holds vectors from another model or backend (or from before
+        chunks were tagged), querying those with our query vectors would compare unlike numerics"""
+        collection = self.vector_store._collection
+        sample = collection.get(limit=1, include=["metadatas"])
+        if not sample["ids"]:
+            return False
+        if sample["metadatas"][0].get("embedding_model") != self.model_name:
+            return True
+        return bool(collection.get(where={"embedding_model": {"$ne": self.model_name}}, limit=1, include=[])["ids"])
+
+    def _effective_batch_size(self) -> int:
+        #never exceed the largest batch the chroma client accepts in a single call
+        client = getattr(self.vector_store, "_client", None)
+        max_batch = getattr(client, "max_batch_size", None) or getattr(client, "get_max_batch_size", lambda: None)()
+        return min(self.batch_size, max_batch) if max_batch else self.batch_size
+
+    def index(self, source: str, resume: bool = True) -> int:
+        """Index every row of `source` ('faq' or 'review'), returns the number of documents written"""
+        model, columns, to_document, to_metadata = INDEX_SOURCES[source]
+        checkpoint = self.load_checkpoint() if resume else {}
+        last_id = checkpoint.get(source, {}).get("last_id", 0)
+        batch_size = self._effective_batch_size()
+        indexed = 0
+        start = time.perf_counter()
+        if last_id:
+            logger.info("Resuming %s index after id %s", source, last_id)
+        while True:
+            rows = (self.session.query(*columns)
+                    .filter(model.id > last_id)
+                    .order_by(model.id)
+                    .limit(batch_size)
+                    .all())
+            if not rows:
+                break
+            self.index_rows(source, rows)
+            last_id = rows[-1].id
+            indexed += len(rows)
+            checkpoint[source] = {"last_id": last_id, "done": False}
+            self.save_checkpoint(checkpoint)
+            elapsed = time.perf_counter() - start
+            logger.info("Indexed %d %s documents (%.1f docs/s)", indexed, source, indexed / elapsed if elapsed else 0.0)
+        checkpoint[source] = {"last_id": last_id, "done": True}
+        self.save_checkpoint(checkpoint)
+        return indexed
+
+    def delete_parents(self, parent_ids: list):
+        """Remove every chunk of the given rows (plus pre-chunking documents stored under the bare row id)"""
+        if not parent_ids:
+            return
+        self.vector_store._collection.delete(where={"parent_id": {"$in": list(parent_ids)}})
+        self.vector_store._collection.delete(ids=list(parent_ids))
+
+    def delete_stale_chunks(self, parent_ids: list, current_ids: set):
+        """Remove chunks of the given rows that are not in `current_ids`, i.e. the trailing
+        chunks of a row that shrank and pre-chunking documents stored under the bare row id"""
+        collection = self.vector_store._collection
+        existing = collection.get(where={"parent_id": {"$in": list(parent_ids)}}, include=[])["ids"]
+        existing += collection.get(ids=list(parent_ids), include=[])["ids"]
+        stale = [chunk_id for chunk_id in existing if chunk_id not in current_ids]
+        if stale:
+            collection.delete(ids=stale)
+
+    def chunk_rows(self, source: str, rows):
+        """Chunks and content hash per row. The hash covers the chunk boundaries too,
+        so changing chunk settings counts as a content change."""
+        to_document = INDEX_SOURCES[source][2]
+        chunked = [self.chunker(source, to_document(row)) for row in rows]
+        return chunked, [content_hash("\x1f".join(chunks)) for chunks in chunked]
+
+    def index_rows(self, source: str, rows, chunked=None, hashes=None) -> int:
+        """Upsert one batch of rows (ORM objects or column rows), returns how many needed a fresh embedding"""
+        #reading expired ORM rows must not flush the caller's unrelated pending changes
+        with self.session.no_autoflush:
+            return self._index_rows(source, rows, chunked, hashes)
+
+    def _index_rows(self, source: str, rows, chunked, hashes) -> int:
+        model, _, _, to_metadata = INDEX_SOURCES[source]
+        if chunked is None:
+            with metrics.span("chunk"):
+                chunked, hashes = self.chunk_rows(source, rows)
+        vectors = [
+            decode_embedding(row.embedding, len(chunks))
+            if row.embedding and row.embedding_model == self.model_name and row.embedding_hash == doc_hash
+            else None
+            for row, chunks, doc_hash in zip(rows, chunked, hashes)
+        ]
+        stale = [i for i, row_vectors in enumerate(vectors) if row_vectors is None]
+        if stale:
+            fresh = self.embeddings.embed_documents([chunk for i in stale for chunk in chunked[i]])
+            position = 0
+            for i in stale:
+                vectors[i] = fresh[position:position + len(chunked[i])]
+                position += len(chunked[i])
+            #write the new embeddings back in one bulk UPDATE so the next rebuild can skip them. Own
+            #session: on the read-your-writes path self.session is the request's, with its own pending state
+            with metrics.span("store_embeddings"), Session(self.session.get_bind()) as writer:
+                writer.execute(update(model), [
+                    {"id": rows[i].id, "embedding": encode_embedding(vectors[i]),
+                     "embedding_model": self.model_name, "embedding_hash": hashes[i]}
+                    for i in stale
+                ])
+                writer.commit()
+        parent_ids = [f"{source}_{row.id}" for row in rows]
+        ids, documents, metadatas, embeddings = [], [], [], []
+        for row, parent_id, chunks, doc_hash, row_vectors in zip(rows, parent_ids, chunked, hashes, vectors):
+            for n, (chunk, vector) in enumerate(zip(chunks, row_vectors)):
+                ids.append(f"{parent_id}#{n}")
+                documents.append(chunk)
+                embeddings.append(vector)
+                metadatas.append(dict(to_metadata(row), content_hash=doc_hash, embedding_model=self.model_name,
+                                      parent_id=parent_id, chunk=n))
+        with metrics.span("upsert"):
+            self.vector_store._collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+        #only after the upsert, so a re-indexed row is never briefly without chunks
+        self.delete_stale_chunks(parent_ids, set(ids))
+        metrics.INDEXED_ROWS.inc(len(rows), source=source)
+        return len(stale)
+
+
+class WriteBehindBuffer:
+    """Coalesces incremental vector store writes.
+
+    add() only records which rows changed. A background thread hands everything pending
+    to `flush_fn({source: [ids]})` once `max_docs` rows are buffered or `max_delay`
+    seconds have passed since the oldest pending write, so a burst of submissions costs
+    one batched embed + upsert instead of one per row. Writes to the same row coalesce,
+    flush() forces a synchronous flush (read-your-writes) and the buffer is flushed on
+    shutdown. A failed flush puts its rows back (merged with newer writes) and is retried
+    with exponential backoff, rows still failing after `max_retries` flushes are dropped
+    and left to reconciliation.
+    """
+
+    def __init__(self, flush_fn, max_docs: int = WRITE_BEHIND_MAX_DOCS, max_delay: float = WRITE_BEHIND_MAX_DELAY,
+                 max_retries: int = WRITE_BEHIND_MAX_RETRIES):
+        self.flush_fn = flush_fn
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self._pending = {} #(source, id) -> failed flushes so far, insertion ordered
+        self._oldest = None
+        self._retry_at = 0.0 #monotonic time before which a failed flush is not retried
+        self._failures = 0 #consecutive failed flushes, drives the backoff
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="vector-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def add(self, source: str, row_id: int):
+        with self._cond:
+            self._ensure_started()
+            if not self._pending:
+                self._oldest = time.monotonic()
+            self._pending[(source, row_id)] = 0
+            if len(self._pending) >= self.max_docs:
+                self._cond.notify()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._pending:
+                        now = time.monotonic()
+                        wait = self._oldest + self.max_delay - now
+                        if now >= self._retry_at and (len(self._pending) >= self.max_docs or wait <= 0):
+                            break
+                        self._cond.wait(max(wait, self._retry_at - now, 0.01))
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+            self.flush()
+
+    def flush(self) -> int:
+        """Flush everything buffered now, waits for a flush already in progress. Returns rows flushed."""
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            by_source = {}
+            for source, row_id in pending:
+                by_source.setdefault(source, []).append(row_id)
+            try:
+                self.flush_fn(by_source)
+            except Exception as e:
+                logger.error("Write-behind flush of %d rows failed: %s", len(pending), e, exc_info=True)
+                self._requeue(pending)
+                return 0
+            with self._cond:
+                self._failures = 0
+                self._retry_at = 0.0
+            return len(pending)
+
+    def _requeue(self, pending: dict):
+        """Put the rows of a failed flush back in front of anything buffered since"""
+        retry = {key: failures + 1 for key, failures in pending.items() if failures + 1 < self.max_retries}
+        if len(retry) < len(pending):
+            logger.error("Dropping %d rows after %d failed flushes, reconcile will repair them",
+                         len(pending) - len(retry), self.max_retries)
+        with self._cond:
+            for key in self._pending: #a newer write of the same row restarts its count
+                retry.pop(key, None)
+            self._pending = {**retry, **self._pending}
+            if self._pending:
+                self._failures += 1
+                delay = min(self.max_delay * 2 ** self._failures, WRITE_BEHIND_MAX_BACKOFF)
+                self._oldest = time.monotonic()
+                self._retry_at = self._oldest + delay
+                self._cond.notify()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.flush()
@@ -0,0 +1,153 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+#"torch" is plain fp32 PyTorch, "int8" applies dynamic int8 quantization to the Linear layers
+#at load time, "onnx" / "onnx-int8" run an exported (and quantized) ONNX Runtime graph.
+#The ONNX backends need the optional `optimum[onnxruntime]` package.
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", "./model_artifacts")
+
+#transformers / optimum model classes per task
+TORCH_CLASSES = {
+    "feature-extraction": "AutoModel",
+    "text-classification": "AutoModelForSequenceClassification",
+    "text2text-generation": "AutoModelForSeq2SeqLM",
+}
+ORT_CLASSES = {
+    "feature-extraction": "ORTModelForFeatureExtraction",
+    "text-classification": "ORTModelForSequenceClassification",
+    "text2text-generation": "ORTModelForSeq2SeqLM",
+}
+
+
+def backend_for(name: str) -> str:
+    """Backend for a registry model name, INFERENCE_BACKEND_<NAME> overrides the global setting.
+    An unknown value is logged and falls back to torch, this runs at import time for the
+    embedding tag and must not take every flask command (db upgrade included) down with it."""
+    backend = os.getenv(f"INFERENCE_BACKEND_{name.upper()}", INFERENCE_BACKEND)
+    if backend not in BACKENDS:
+        logger.error("Unknown inference backend '%s' for %s, expected one of %s, using torch", backend, name, BACKENDS)
+        return "torch"
+    return backend
+
+
+def model_tag(model_id: str, backend: str) -> str:
+    """Identifies the numerics a model produces, stored embeddings are only reused under the same tag"""
+    return model_id if backend == "torch" else f"{model_id}@{backend}"
+
+
+def artifact_path(model_id: str, backend: str) -> str:
+    return os.path.join(MODEL_ARTIFACT_DIR, backend, model_id.replace("/", "--"))
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every Linear layer (weights int8, activations quantized on the fly)"""
+    import torch
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _ort_class(task: str):
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("The onnx backends need `pip install optimum[onnxruntime]`") from e
+    return getattr(ort, ORT_CLASSES[task])
+
+
+def convert(model_id: str, task: str, backend: str, force: bool = False) -> str:
+    """One-time export of an ONNX backend into the artifact cache, returns the artifact directory.
+    torch and int8 need no artifact (int8 quantizes in memory at load) and return the model id."""
+    if backend in ("torch", "int8"):
+        return model_id
+    from transformers import AutoTokenizer
+    target = artifact_path(model_id, backend)
+    if os.path.isdir(target) and not force:
+        return target
+    ort_class = _ort_class(task)
+    #build in a scratch dir and move into place, an interrupted export never looks complete
+    os.makedirs(MODEL_ARTIFACT_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix=".export-", dir=MODEL_ARTIFACT_DIR)
+    try:
+        exported = os.path.join(scratch, "fp32")
+        logger.info("Exporting %s to ONNX", model_id)
+        ort_class.from_pretrained(model_id, export=True).save_pretrained(exported)
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(exported)
+        result = exported
+        if backend == "onnx-int8":
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            result = os.path.join(scratch, "int8")
+            config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            #seq2seq exports hold several graphs (encoder, decoder, decoder with past), quantize each
+            for file_name in sorted(f for f in os.listdir(exported) if f.endswith(".onnx")):
+                logger.info("Quantizing %s/%s to int8", model_id, file_name)
+                ORTQuantizer.from_pretrained(exported, file_name=file_name).quantize(
+                    save_dir=result, quantization_config=config)
+            for file_name in os.listdir(exported):
+                if not file_name.endswith(".onnx") and not os.path.exists(os.path.join(result, file_name)):
+                    shutil.copy(os.path.join(exported, file_name), result)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(result, target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return target
+
+
+def load_model(model_id: str, task: str, backend: str):
+    """(model, tokenizer) for a task on the given backend. ONNX artifacts are converted on first use."""
+    from transformers import AutoTokenizer
+    if backend in ("onnx", "onnx-int8"):
+        path = convert(model_id, task, backend)
+        ort_class = _ort_class(task)
+        #quantized exports are saved with a `_quantized` suffix, pick those up explicitly
+        suffix = "_quantized" if backend == "onnx-int8" else ""
+        if task == "text2text-generation":
+            model = ort_class.from_pretrained(
+                path, encoder_file_name=f"encoder_model{suffix}.onnx",
+                decoder_file_name=f"decoder_model{suffix}.onnx",
+                decoder_with_past_file_name=f"decoder_with_past_model{suffix}.onnx")
+        else:
+            model = ort_class.from_pretrained(path, file_name=f"model{suffix}.onnx")
+        return model, AutoTokenizer.from_pretrained(path)
+    import transformers
+    model = getattr(transformers, TORCH_CLASSES[task]).from_pretrained(model_id)
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model, AutoTokenizer.from_pretrained(model_id)
+
+
+class TransformerEmbeddings(Embeddings):
+    """Sentence embeddings from a bare transformer (int8 or ONNX backend): mean pooling over
+    the attention mask plus L2 normalisation, the same head all-MiniLM-L6-v2 ships with."""
+
+    def __init__(self, model, tokenizer, max_length: int = 256, batch_size: int = 32):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        import torch
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="pt")
+            with torch.no_grad():
+                hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors.extend(torch.nn.functional.normalize(pooled, p=2, dim=1).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,167 @@
+import math
+import re
+import threading
+from collections import Counter
+
+from langchain.docstore.document import Document
+from sqlalchemy.dialects.mysql import match
+
+from models import Review
+
+TOKEN_RE = re.compile(r"\w+")
+RRF_K = 60 #standard damping constant for reciprocal rank fusion
+#share of the question's term weight (sum of idf) a chunk has to match to count as a lexical hit
+BM25_MIN_MATCH = 0.3
+
+#english function words, they match nearly every chunk and would let any document into the fusion
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each even ever every few for from further get got
+had has have having he her here hers him his how i if in into is it its itself just like me more most
+much my no nor not now of off on once only or other our ours out over own really same she should so
+some still such than that the their them then there these they this those through to too under until
+up us very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    #"Wi-Fi" -> ["wi", "fi"], the same split is applied to questions and documents
+    return TOKEN_RE.findall(text.lower())
+
+def content_terms(text: str) -> list[str]:
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+def matches_filter(metadata: dict, where: dict = None) -> bool:
+    """Evaluate the subset of Chroma `where` syntax build_filter produces ($and, $in, equality)"""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if "$in" in condition and metadata.get(key) not in condition["$in"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def doc_key(doc: Document) -> str:
+    """Stable identity of a chunk across retrievers, so fusion can tell the same chunk apart"""
+    parent_id = doc.metadata.get("parent_id")
+    if parent_id is None:
+        return doc.page_content
+    return f"{parent_id}#{doc.metadata.get('chunk', 0)}"
+
+
+def reciprocal_rank_fusion(result_lists, k: int = RRF_K) -> list[Document]:
+    """Merge ranked document lists, each doc scores sum(1 / (k + rank)) over the lists it appears in"""
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class BM25Index:
+    """In-memory Okapi BM25 over the collection's chunk documents.
+
+    Used for lexical search where no database full-text index is available (SQLite
+    dev/test setups, FAQs). Built from (ids, documents, metadatas) and kept current with
+    add()/remove() as rows are flushed, idf comes from running document frequencies at
+    query time. Stopwords are not indexed.
+    """
+
+    def __init__(self, ids: list[str], documents: list[str], metadatas: list[dict], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {} #chunk id -> (text, metadata, term freqs, length)
+        self.parents = {} #parent_id -> chunk ids, for remove()
+        self.postings = {} #term -> chunk ids containing it, a query only scores those
+        self.doc_freqs = Counter()
+        self.total_len = 0
+        self._lock = threading.Lock()
+        self.add(ids, documents, metadatas)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _discard(self, chunk_id: str):
+        _, metadata, tf, length = self.docs.pop(chunk_id)
+        self.total_len -= length
+        for term in tf:
+            self.doc_freqs[term] -= 1
+            self.postings[term].discard(chunk_id)
+            if not self.doc_freqs[term]:
+                del self.doc_freqs[term], self.postings[term]
+        parent = self.parents.get(metadata.get("parent_id", chunk_id))
+        if parent is not None:
+            parent.discard(chunk_id)
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict]):
+        """Insert or replace chunks"""
+        with self._lock:
+            for chunk_id, text, metadata in zip(ids, documents, metadatas):
+                if chunk_id in self.docs:
+                    self._discard(chunk_id)
+                tf = Counter(content_terms(text))
+                length = sum(tf.values())
+                self.docs[chunk_id] = (text, metadata, tf, length)
+                self.total_len += length
+                for term in tf:
+                    self.doc_freqs[term] += 1
+                    self.postings.setdefault(term, set()).add(chunk_id)
+                self.parents.setdefault(metadata.get("parent_id", chunk_id), set()).add(chunk_id)
+
+    def remove(self, parent_ids):
+        """Drop every chunk of the given rows"""
+        with self._lock:
+            for parent_id in parent_ids:
+                for chunk_id in self.parents.pop(parent_id, ()):
+                    if chunk_id in self.docs:
+                        self._discard(chunk_id)
+
+    def _idf(self, term: str) -> float:
+        df = self.doc_freqs.get(term, 0)
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int, where: dict = None, min_match: float = BM25_MIN_MATCH) -> list[Document]:
+        """Top k chunks for the query. A chunk scoring below `min_match` times the summed idf of
+        the query terms (roughly: matching less than that share of the question's weight) is not
+        a hit, so a single common word does not make a chunk relevant."""
+        terms = set(content_terms(query))
+        with self._lock:
+            if not terms or not self.docs:
+                return []
+            avg_len = self.total_len / len(self.docs) or 1.0
+            scores = {}
+            for term in terms:
+                idf = self._idf(term)
+                for chunk_id in self.postings.get(term, ()):
+                    _, _, tf, length = self.docs[chunk_id]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_len)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+            floor = min_match * sum(self._idf(term) for term in terms)
+            ranked = sorted((chunk_id for chunk_id, score in scores.items() if score >= floor),
+                            key=lambda chunk_id: (-scores[chunk_id], chunk_id))
+            hits = []
+            for chunk_id in ranked:
+                text, metadata, _, _ = self.docs[chunk_id]
+                if matches_filter(metadata, where):
+                    hits.append(Document(page_content=text, metadata=metadata))
+                    if len(hits) == k:
+                        break
+        return hits
+
+
+def fulltext_review_ids(session, question: str, k: int, hotel_ids: list = None) -> list[int]:
+    """Review ids ranked by the MySQL FULLTEXT index idx_review_content (natural language mode)"""
+    score = match(Review.content, against=question)
+    query = session.query(Review.id).filter(score > 0)
+    if hotel_ids:
+        query = query.filter(Review.hotel_id.in_(hotel_ids))
+    return [row.id for row in query.order_by(score.desc()).limit(k).all()]
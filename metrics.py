@@ -0,0 +1,244 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+#latency buckets in seconds, from cache hits up to full flan-t5 generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets, one series per label combination"""
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {} #label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Counter:
+    """Prometheus counter, one series per label combination"""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for key, value in sorted(series.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text format. Every gunicorn worker
+    keeps its own values, Prometheus sums them across scrape targets."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+#shared metrics for the whole app, exposed on /metrics
+metrics = MetricsRegistry()
+OPERATION_SECONDS = metrics.histogram("rag_operation_seconds", "End to end time of a RAG operation.", ["operation"])
+STAGE_SECONDS = metrics.histogram("rag_stage_seconds", "Time spent per stage of a RAG operation.", ["operation", "stage"])
+TOKENS = metrics.histogram("rag_llm_tokens", "Prompt (in) and answer (out) tokens per generation.",
+                           ["operation", "direction"], buckets=TOKEN_BUCKETS)
+RETRIEVED_DOCS = metrics.histogram("rag_retrieved_documents", "Documents retrieved per query.", ["role"], buckets=COUNT_BUCKETS)
+CACHE_LOOKUPS = metrics.counter("rag_cache_lookups_total", "Answer cache lookups by cache and result.", ["cache", "result"])
+CLASSIFIED_TEXTS = metrics.counter("rag_classified_texts_total", "Texts run through the review classifiers.", ["model"])
+INDEXED_ROWS = metrics.counter("rag_indexed_rows_total", "FAQ/review rows written to the vector store.", ["source"])
+ERRORS = metrics.counter("rag_errors_total", "Failed RAG operations.", ["operation"])
+
+def render() -> str:
+    return metrics.render()
+
+
+class Trace:
+    """Per-request breakdown: seconds per stage plus counters such as tokens and documents"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages = {}
+        self.attributes = {}
+        self.total_s = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock() #stages may finish on worker threads
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def set(self, name: str, value):
+        with self._lock:
+            self.attributes[name] = value
+
+    def elapsed(self) -> float:
+        return self.total_s if self.total_s is not None else time.perf_counter() - self._start
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+            attributes = dict(self.attributes)
+        return {"operation": self.operation, "total_ms": round(self.elapsed() * 1000, 2),
+                "stages_ms": stages, **attributes}
+
+    def server_timing(self) -> str:
+        """Stage breakdown as a Server-Timing header value, shown by browser dev tools"""
+        parts = [f"{stage};dur={ms}" for stage, ms in self.summary()["stages_ms"].items()]
+        return ", ".join(parts + [f"total;dur={round(self.elapsed() * 1000, 2)}"])
+
+
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def trace(operation: str):
+    """Collect the stages of one operation. Nested calls join the outer trace, so the
+    view and the RAG method it calls can both open one."""
+    active = _current_trace.get()
+    if active is not None:
+        yield active
+        return
+    active = Trace(operation)
+    token = _current_trace.set(active)
+    try:
+        yield active
+    finally:
+        active.total_s = time.perf_counter() - active._start
+        OPERATION_SECONDS.observe(active.total_s, operation=operation)
+        try:
+            _current_trace.reset(token)
+        except ValueError: #a generator finished in a different context than it started in
+            _current_trace.set(None)
+
+def record_stage(stage: str, seconds: float, operation: str = None):
+    active = _current_trace.get()
+    if active is not None:
+        active.add_stage(stage, seconds)
+    STAGE_SECONDS.observe(seconds, operation=operation or (active.operation if active else "background"), stage=stage)
+
+@contextmanager
+def span(stage: str, operation: str = None):
+    """Time a block as `stage` of the current operation (histogram plus the active trace)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, operation)
+
+def set_attribute(name: str, value):
+    active = _current_trace.get()
+    if active is not None:
+        active.set(name, value)
+
+def in_context(fn):
+    """Bind fn to a copy of the caller's context, so work handed to our own thread pools
+    still reports into the request's trace"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class GenerationMetrics(BaseCallbackHandler):
+    """LangChain callback timing every LLM run as the `generate` stage and counting
+    prompt and answer tokens with `count_tokens(text)`"""
+
+    def __init__(self, count_tokens):
+        self.count_tokens = count_tokens
+        self._runs = {}
+
+    def _operation(self) -> str:
+        active = _current_trace.get()
+        return active.operation if active else "background"
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._runs[run_id] = time.perf_counter()
+        tokens_in = sum(self.count_tokens(prompt) for prompt in prompts)
+        TOKENS.observe(tokens_in, operation=self._operation(), direction="in")
+        set_attribute("tokens_in", tokens_in)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._runs.pop(run_id, None)
+        if start is not None:
+            record_stage("generate", time.perf_counter() - start)
+        tokens_out = sum(self.count_tokens(generation.text) for generations in response.generations
+                         for generation in generations)
+        TOKENS.observe(tokens_out, operation=self._operation(), direction="out")
+        set_attribute("tokens_out", tokens_out)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._runs.pop(run_id, None)
+        if start is not None:
+            record_stage("generate", time.perf_counter() - start)
+        ERRORS.inc(operation="generate")
@@ -0,0 +1,80 @@
+import logging
+import resource
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (falls back to peak RSS off linux)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModelRegistry:
+    """Loads models lazily and thread-safely on first use.
+
+    Loaders are registered by name and only run when `get` is first called for that
+    name (or from `warm_up`), so importing the app, running migrations or flask CLI
+    commands does not pay for transformer models it never touches.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._locks = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader):
+        """Register (or replace) the zero-argument loader for a model name"""
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+            self._models.pop(name, None)
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self._loaders:
+            raise KeyError(f"No model registered under '{name}'")
+        #per-model lock so two different models can load concurrently but one model never loads twice.
+        with self._locks[name]:
+            model = self._models.get(name)
+            if model is None:
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                model = self._loaders[name]()
+                self._stats[name] = {
+                    "load_s": round(time.perf_counter() - start, 3),
+                    "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+                }
+                self._models[name] = model
+                logger.info("Loaded model %s in %.2fs (+%.1f MB RSS)", name,
+                            self._stats[name]["load_s"], self._stats[name]["rss_delta_mb"])
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warm_up(self, names=None):
+        """Load the given models (default: every registered model) up front, e.g. in production workers"""
+        for name in names or list(self._loaders):
+            self.get(name)
+        return self.stats()
+
+    def stats(self) -> dict:
+        """Per-model load time and memory for every model loaded so far"""
+        return {name: dict(stat) for name, stat in self._stats.items()}
+
+
+#shared registry for the whole app
+registry = ModelRegistry()
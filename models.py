@@ -36,7 +36,7 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(100), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False) #renamed from password.
     role = db.Column(user_role_enum, default='customer') #this added role will also help for RAG differentiation.
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     last_login = db.Column(db.DateTime)
     #Relationships
     hotels=db.relationship('Hotel', backref='owner', lazy=True) # One user can own multiple hotels
@@ -85,8 +85,8 @@ class Room(db.Model):
     home_type = db.Column(home_type_enum, nullable=False) #type of home
     bed_count = db.Column(db.Integer, nullable=False)
     summary=db.Column(db.Text) #description of the room.
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  # Timestamp when the room was added
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))  # Timestamp updated on each modification
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # Timestamp when the room was added
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))  # Timestamp updated on each modification
     #Relationships
     amenities = db.relationship('RoomAmenity', backref='room', lazy=True) #A room has multiple amenities
     booking_details = db.relationship('BookingDetail', backref='room', lazy=True) # A room can be part of many booking details.
@@ -105,7 +105,7 @@ class Booking(db.Model):
     end_date = db.Column(db.Date, nullable=False)
     total_price = db.Column(db.Numeric(10, 2), nullable=False)  # Total price for the booking period
     status = db.Column(booking_status_enum, default='Pending')
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     #Relationship
     booking_details = db.relationship('BookingDetail', backref='booking', lazy=True) # a booking can have multiple detailed entries
     
@@ -126,6 +126,8 @@ class FAQ(db.Model):
     question = db.Column(db.Text, nullable=False)
     answer = db.Column(db.Text, nullable=False)
     embedding = db.Column(db.LargeBinary)#store vector embedding for RAG search.
+    embedding_model = db.Column(db.String(100)) #model that produced the stored embedding
+    embedding_hash = db.Column(db.String(64)) #sha256 of the embedded text, stale when content changes
 
 class Review(db.Model):
     __tablename__ = 'reviews'
@@ -140,11 +142,54 @@ class Review(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False) #links review to the user.
     hotel_id = db.Column(db.Integer, db.ForeignKey('hotels.id'), nullable=False) #links review to the hotel being reviewed
     embedding = db.Column(db.LargeBinary)#store vector embedding for RAG.
+    embedding_model = db.Column(db.String(100)) #model that produced the stored embedding
+    embedding_hash = db.Column(db.String(64)) #sha256 of the embedded text, stale when content changes
     sentiment= db.Column(db.String(20)) # field to store sentiment analysis result(positive, negative, neutral)
     emotion = db.Column(db.String(20)) #field to store emotion tone of the customer/reviewer
     rating = db.Column(db.Numeric(2,1)) # Numeric rating by user.
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc)) #timestamp when the review was created.
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc)) #timestamp when the review was created.
     ip_address = db.Column(db.String(45))
+    stats_counted = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) #included in hotel_review_stats
+
+class HotelReviewStats(db.Model):
+    """Running per-hotel aggregate over every labelled review, see review_analytics.py"""
+    __tablename__ = 'hotel_review_stats'
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotels.id'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_count = db.Column(db.Integer, nullable=False, default=0) #rating is optional on reviews
+    rating_sum = db.Column(db.Float, nullable=False, default=0.0)
+    sentiment_counts = db.Column(db.JSON, nullable=False, default=dict) #{"positive": n, ...}
+    emotion_counts = db.Column(db.JSON, nullable=False, default=dict) #{"joy": n, ...}
+    rating_counts = db.Column(db.JSON, nullable=False, default=dict) #{"4.5": n, ...}
+    monthly = db.Column(db.JSON, nullable=False, default=dict) #{"2025-03": {"reviews": n, "rating_sum": x, ...}}
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class HotelReviewTheme(db.Model):
+    """One cluster of a hotel's review embeddings, written by the offline job in review_themes.py"""
+    __tablename__ = 'hotel_review_themes'
+    __table_args__=(
+        db.Index('idx_review_themes_hotel','hotel_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotels.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False) #0 is the largest theme of the hotel
+    label = db.Column(db.String(200), nullable=False)
+    terms = db.Column(db.JSON, nullable=False, default=list) #top terms, most distinctive first
+    review_count = db.Column(db.Integer, nullable=False)
+    share = db.Column(db.Float, nullable=False) #fraction of the hotel's clustered reviews
+    sentiment_counts = db.Column(db.JSON, nullable=False, default=dict)
+    avg_rating = db.Column(db.Float)
+    example_review_ids = db.Column(db.JSON, nullable=False, default=list) #closest to the centroid first
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class HotelThemeRun(db.Model):
+    """Fingerprint of the reviews each hotel was last clustered at, re-runs skip unchanged hotels"""
+    __tablename__ = 'hotel_theme_runs'
+    hotel_id = db.Column(db.Integer, db.ForeignKey('hotels.id'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False)
+    max_review_id = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64)) #sha256 over the reviews' ids and embedding hashes, see review_themes.review_fingerprints
+    clustered_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 class Itinerary(db.Model):
     __tablename__ = 'itineraries'
@@ -152,7 +197,7 @@ class Itinerary(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 class Place(db.Model):
     __tablename__='places' 
@@ -165,7 +210,7 @@ class Place(db.Model):
     description = db.Column(db.Text) #detailed description of the place.
     hotel_id = db.Column(db.Integer, db.ForeignKey('hotels.id'))
     api_source = db.Column(db.String(50)) #source api for the place data
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
 class CustomerPreference(db.Model):
     __tablename__ = 'customer_preferences'
@@ -182,7 +227,7 @@ class APICache(db.Model):
     parameters = db.Column(db.Text, nullable=False) #parameters used in the API request(stored as text)
     response = db.Column(db.JSON, nullable=False) #the JSON response from the API stored for caching
     expires_at = db.Column(db.DateTime, nullable=False)  # Expiration timestamp for the cached API response
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc)) #Timestamp when the cache record was created
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc)) #Timestamp when the cache record was created
 
 
 
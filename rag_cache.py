@@ -0,0 +1,386 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, strip punctuation and collapse whitespace so trivial variations share a key"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def prune_lru(conn, table: str, max_entries: int):
+    """Delete the least recently used rows of `table` (by its last_access column) beyond max_entries"""
+    overflow = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - max_entries
+    if overflow > 0:
+        conn.execute(f"DELETE FROM {table} WHERE rowid IN "
+                     f"(SELECT rowid FROM {table} ORDER BY last_access ASC LIMIT ?)", (overflow,))
+
+
+class AnswerCache:
+    """Persistent answer cache for query_system backed by SQLite.
+
+    Entries expire after `ttl` seconds and the table is trimmed to
+    `max_entries` rows, evicting the least recently used answers first.
+    Every key includes the version of the content the answer can depend on (see
+    scope_version): an answer scoped to some hotels only goes stale when those hotels
+    change, unscoped answers on any change. Unreachable answers age out through eviction.
+    """
+
+    def __init__(self, database_path: str, ttl: int = 3600, max_entries: int = 5000):
+        self.database_path = database_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rag_answer_cache ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, sources TEXT NOT NULL, "
+                "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rag_answer_cache_access ON rag_answer_cache(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS rag_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO rag_cache_meta(name, value) VALUES ('content_version', 0)")
+            conn.execute("INSERT OR IGNORE INTO rag_cache_meta(name, value) VALUES ('epoch', 0)")
+            conn.execute("INSERT OR IGNORE INTO rag_cache_meta(name, value) VALUES ('index_version', 0)")
+
+    def _connect(self):
+        #one short lived connection per call keeps this safe across threads and gunicorn workers.
+        return sqlite3.connect(self.database_path, timeout=5)
+
+    def content_version(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM rag_cache_meta WHERE name='content_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, hotel_ids=None):
+        """Called whenever the vector store content changes. hotel_ids names the hotels whose
+        content changed, only unscoped answers and answers scoped to those hotels go stale.
+        None means the change may touch any hotel and invalidates every answer."""
+        with self._connect() as conn:
+            conn.execute("UPDATE rag_cache_meta SET value = value + 1 WHERE name='content_version'")
+            if hotel_ids is None:
+                conn.execute("UPDATE rag_cache_meta SET value = value + 1 WHERE name='epoch'")
+                return
+            conn.executemany(
+                "INSERT INTO rag_cache_meta(name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                [(f"hotel:{hotel_id}",) for hotel_id in set(hotel_ids)],
+            )
+
+    def bump_stats_version(self, hotel_ids):
+        """Invalidate only the answers that quote these hotels' review statistics or themes
+        (property owner answers, see scope_version). The vector store did not change, so
+        content_version and every other cached answer stay as they are."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO rag_cache_meta(name, value) VALUES (?, 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                [(f"stats:{hotel_id}",) for hotel_id in set(hotel_ids)],
+            )
+
+    def index_version(self) -> int:
+        """Counter of collection writes shared by every worker, in-memory lexical indexes
+        built at an older value are stale. Separate from the answer versions."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM rag_cache_meta WHERE name='index_version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_index_version(self) -> int:
+        """Record a collection write, returns the new version"""
+        with self._connect() as conn:
+            conn.execute("UPDATE rag_cache_meta SET value = value + 1 WHERE name='index_version'")
+            return conn.execute("SELECT value FROM rag_cache_meta WHERE name='index_version'").fetchone()[0]
+
+    def scope_version(self, hotel_ids=None, with_stats: bool = False):
+        """Version of the content an answer scoped to `hotel_ids` can depend on. Unscoped
+        answers follow every change, scoped ones only changes to their own hotels.
+        with_stats adds the hotels' review statistics versions (bump_stats_version)."""
+        with self._connect() as conn:
+            if not hotel_ids: #an empty scope filters nothing, it searches every hotel
+                return ("all", conn.execute("SELECT value FROM rag_cache_meta WHERE name='content_version'").fetchone()[0])
+            names = ["epoch"] + [f"hotel:{hotel_id}" for hotel_id in hotel_ids]
+            if with_stats:
+                names += [f"stats:{hotel_id}" for hotel_id in hotel_ids]
+            values = dict(conn.execute(
+                f"SELECT name, value FROM rag_cache_meta WHERE name IN ({','.join('?' * len(names))})", names
+            ).fetchall())
+        return tuple(values.get(name, 0) for name in names)
+
+    def make_key(self, question: str, role: str, retriever_params: dict, version) -> str:
+        #version: scope_version of the hotels the answer is scoped to
+        payload = json.dumps({
+            "question": normalize_question(question),
+            "role": role,
+            "retriever": retriever_params,
+            "version": version,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer, sources, created_at FROM rag_answer_cache WHERE key=?", (key,)
+            ).fetchone()
+            if row is None or now - row[2] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM rag_answer_cache WHERE key=?", (key,))
+                with self._lock:
+                    self.misses += 1
+                return None
+            conn.execute("UPDATE rag_answer_cache SET last_access=? WHERE key=?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return {"answer": row[0], "sources": json.loads(row[1])}
+
+    def set(self, key: str, result: dict):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO rag_answer_cache(key, answer, sources, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, result["answer"], json.dumps(result["sources"]), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM rag_answer_cache WHERE created_at < ?", (now - self.ttl,))
+        prune_lru(conn, "rag_answer_cache", self.max_entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+class SemanticAnswerCache:
+    """In-memory answer cache matched on question embeddings instead of exact text.
+
+    Entries are (question vector, role, hotel scope, content version, answer, sources),
+    held in preallocated arrays of `max_entries` slots. A lookup scores the question's
+    vector against every live entry of the same role and hotel scope with one matrix
+    product and returns the closest answer when its cosine similarity reaches
+    `threshold`. Entries expire after `ttl` seconds, the least recently used one is
+    overwritten when all slots are taken, and an entry whose scope version (see
+    AnswerCache.scope_version) moved on since it was stored is dropped on sight.
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 2000, ttl: int = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None #(max_entries, dim) unit vectors, allocated on the first set
+        self._scopes = np.full(max_entries, -1, dtype=np.int64) #scope id per slot, -1 is a free slot
+        self._versions = np.zeros(max_entries, dtype=np.int64) #version id per slot
+        self._created = np.zeros(max_entries)
+        self._used = np.zeros(max_entries, dtype=np.int64) #LRU clock value of the last hit or set
+        self._clock = 0
+        self._results = [None] * max_entries
+        self._ids = {} #("scope", scope) / ("version", version) -> id stored in the slot arrays
+
+    @staticmethod
+    def _scope(role: str, hotel_ids) -> tuple:
+        return role, tuple(hotel_ids) if hotel_ids is not None else None
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _id(self, key) -> int:
+        return self._ids.setdefault(key, len(self._ids))
+
+    def _clear(self):
+        self._scopes[:] = -1
+        self._results = [None] * self.max_entries
+        self._ids = {}
+
+    def get(self, vector, role: str, hotel_ids, version):
+        now = time.time()
+        with self._lock:
+            scope_id = self._ids.get(("scope", self._scope(role, hotel_ids)))
+            slots = np.flatnonzero(self._scopes == scope_id) if scope_id is not None else []
+            if len(slots):
+                stale = ((self._versions[slots] != self._ids.get(("version", version), -1))
+                         | (now - self._created[slots] > self.ttl))
+                self._scopes[slots[stale]] = -1
+                slots = slots[~stale]
+            if len(slots) == 0 or self._vectors.shape[1] != len(vector):
+                self.misses += 1
+                return None
+            scores = self._vectors[slots] @ self._unit(vector)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._used[slots[best]] = self._clock
+            return dict(self._results[slots[best]])
+
+    def set(self, vector, role: str, hotel_ids, version, result: dict):
+        vector = self._unit(vector)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                #first entry, or the embedder changed and the stored vectors are not comparable
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._clear()
+            elif len(self._ids) >= 4 * self.max_entries:
+                #ids of versions long gone pile up, start over rather than track which are still in use
+                self._clear()
+            scope_id, version_id = self._id(("scope", self._scope(role, hotel_ids))), self._id(("version", version))
+            free = np.flatnonzero(self._scopes < 0)
+            slot = int(free[0]) if len(free) else int(np.argmin(self._used))
+            self._clock += 1
+            self._vectors[slot] = vector
+            self._scopes[slot], self._versions[slot] = scope_id, version_id
+            self._created[slot], self._used[slot] = time.time(), self._clock
+            self._results[slot] = {"answer": result["answer"], "sources": result["sources"]}
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": int((self._scopes >= 0).sum()),
+            }
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace only, unlike questions the casing and punctuation of documents matter"""
+    return " ".join(text.split())
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an in-memory LRU in front of a persistent SQLite store.
+
+    Vectors are keyed by (model name, sha256 of the whitespace-normalized text) and
+    stored as float32. embed_documents looks every text up first and sends only the
+    misses to the wrapped model in one batch, so re-embedding unchanged text never
+    reaches the model. Only document vectors are written to disk, trimmed least recently
+    used first to `max_disk_entries`. Query vectors (user questions) stay in memory.
+    An empty `database_path` keeps the cache in memory only.
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str, database_path: str = "", max_memory_entries: int = 10000,
+                 max_disk_entries: int = 50000):
+        self.inner = inner
+        self.model_name = model_name
+        self.database_path = database_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if self.database_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                    "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                    "last_access REAL NOT NULL DEFAULT 0, PRIMARY KEY (model, hash))"
+                )
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(embedding_cache)")]
+                if "last_access" not in columns: #cache files written before the size cap
+                    conn.execute("ALTER TABLE embedding_cache ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_access ON embedding_cache(last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.database_path, timeout=5)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, keys: list) -> dict:
+        """key -> float32 vector for every key found in memory or on disk"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        missing = [key for key in keys if key not in found]
+        if missing and self.database_path:
+            with self._connect() as conn:
+                for start in range(0, len(missing), 500): #stay below sqlite's bound parameter limit
+                    batch = missing[start:start + 500]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = conn.execute(
+                        f"SELECT hash, vector FROM embedding_cache WHERE model=? AND hash IN ({placeholders})",
+                        [self.model_name] + batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, found[key])
+                    if rows:
+                        conn.execute(f"UPDATE embedding_cache SET last_access=? WHERE model=? AND hash IN ({placeholders})",
+                                     [time.time(), self.model_name] + batch)
+        return found
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, persist=True)
+
+    def _embed(self, texts: list[str], persist: bool) -> list[list[float]]:
+        normalized = [normalize_text(text) for text in texts]
+        keys = [hashlib.sha256(text.encode("utf-8")).hexdigest() for text in normalized]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        #each distinct missing text is embedded once, in a single batch
+        missing = {key: text for key, text in zip(keys, normalized) if key not in found}
+        with self._lock:
+            self.hits += len(keys) - sum(key in missing for key in keys)
+            self.misses += sum(key in missing for key in keys)
+        if missing:
+            vectors = self.inner.embed_documents(list(missing.values()))
+            fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)}
+            for key, vector in fresh.items():
+                self._remember(key, vector)
+            if self.database_path and persist:
+                now = time.time()
+                with self._connect() as conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embedding_cache(model, hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                        [(self.model_name, key, vector.tobytes(), now) for key, vector in fresh.items()],
+                    )
+                    prune_lru(conn, "embedding_cache", self.max_disk_entries)
+            found.update(fresh)
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        #the sentence-transformers models here embed queries and documents the same way,
+        #questions are looked up on disk too but only kept in memory
+        return self._embed([text], persist=False)[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
@@ -1,15 +1,28 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_community.llms import HuggingFacePipeline
-from langchain_community.cache import SQLiteCache #added this for caching query results
+from langchain_core.embeddings import Embeddings
 from langchain.prompts import PromptTemplate
-from langchain.schema.runnable import RunnablePassthrough, RunnableParallel
+from langchain.schema.runnable import RunnablePassthrough, RunnableLambda
 from langchain.schema.output_parser import StrOutputParser
 from langchain.docstore.document import Document
-import hashlib #for generating cache keys
-from transformers import pipeline
+from functools import partial
 from models import db, FAQ, Review
+from rag_cache import AnswerCache, CachedEmbeddings, SemanticAnswerCache
+from model_registry import registry
+from indexer import BulkIndexer, WriteBehindBuffer, INDEX_SOURCES, INDEX_BATCH_SIZE
+from vector_sync import VectorSync
+from chunking import NO_CONTEXT, chunk_text, count_tokens, pack_context, truncate_to_tokens
+from review_analytics import owner_review_summary
+from lexical import BM25Index, fulltext_review_ids, reciprocal_rank_fusion
+from rerank import CrossEncoderReranker
+from generation_batcher import BatchedLLM, GenerationBatcher, generate_batch
+from inference_backend import TransformerEmbeddings, backend_for, load_model, model_tag
+import metrics
 import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from flask import has_app_context
 import logging
 from dotenv import load_dotenv
 
@@ -17,194 +30,634 @@ from dotenv import load_dotenv
 load_dotenv()
 PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
 CACHE_PATH = os.getenv("RAG_CACHE_PATH", ".rag_cache.db")
+CACHE_TTL = int(os.getenv("RAG_CACHE_TTL", 3600)) #seconds
+CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", 5000))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embedding_cache.db") #empty keeps the cache in memory only
+EMBEDDING_CACHE_MEMORY = int(os.getenv("EMBEDDING_CACHE_MEMORY", 10000)) #vectors held in the in-process LRU
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 50000)) #document vectors kept on disk
+#answers for paraphrased questions are reused when the question embeddings are this similar.
+#off by default, short questions that differ in one word (check-in/check-out) can clear the threshold,
+#measure the false-hit rate with `python -m bench.semantic_cache` before turning it on
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 2000))
+#off by default, every worker would re-read and re-hash the corpus at once on deploy, run
+#`flask rag reconcile` from a single scheduled job instead
+RECONCILE_ON_WARM_UP = os.getenv("RAG_RECONCILE_ON_WARM_UP", "0") == "1"
 FAQ_CHUNK_SIZE = int(os.getenv("FAQ_CHUNK_SIZE", 500))
 FAQ_CHUNK_OVERLAP = int(os.getenv("FAQ_CHUNK_OVERLAP", 50))
 REVIEW_CHUNK_SIZE = int(os.getenv("REVIEW_CHUNK_SIZE", 500))
 REVIEW_CHUNK_OVERLAP = int(os.getenv("REVIEW_CHUNK_OVERLAP", 50))
+#chunk sizes and overlaps are in embedder tokens, capped at what MiniLM can see (256 incl. [CLS]/[SEP])
+EMBEDDING_MAX_TOKENS = 254
+CHUNK_SETTINGS = {
+    "faq": (min(FAQ_CHUNK_SIZE, EMBEDDING_MAX_TOKENS), FAQ_CHUNK_OVERLAP),
+    "review": (min(REVIEW_CHUNK_SIZE, EMBEDDING_MAX_TOKENS), REVIEW_CHUNK_OVERLAP),
+}
+#flan-t5 input window, the prompt context is packed up to this many tokens
+LLM_MAX_INPUT_TOKENS = 512
+#owner prompts lead with statistics and clustered themes over every review of the hotel
+#(see review_analytics.py and review_themes.py),
+#capped so the retrieved reviews still get most of the window
+OWNER_REVIEW_STATS = os.getenv("OWNER_REVIEW_STATS", "1") == "1"
+OWNER_REVIEW_STATS_MAX_TOKENS = int(os.getenv("OWNER_REVIEW_STATS_MAX_TOKENS", 224))
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LLM_MODEL = "google/flan-t5-base"
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+
+#batched classifier settings for sentiment/emotion
+CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", 32))
+CLASSIFIER_MAX_TOKENS = 512
+#"separate" runs the sentiment and emotion models, "shared" derives sentiment from the
+#emotion model's distribution so each review needs a single encoder pass and one model less.
+CLASSIFIER_MODE = os.getenv("CLASSIFIER_MODE", "separate")
+#emotion labels folded into sentiment polarity in shared mode
+EMOTION_TO_SENTIMENT = {
+    "joy": "positive", "surprise": "positive", "neutral": "neutral",
+    "anger": "negative", "disgust": "negative", "fear": "negative", "sadness": "negative",
+}
+
+#per-call generation settings for the shared flan-t5 model
+DETERMINISTIC_GENERATION_KWARGS = {"do_sample": False, "max_length": 512}
+STOCHASTIC_GENERATION_KWARGS = {"do_sample": True, "temperature": 0.2, "max_length": 512}
+
+#concurrent generations are collected for up to GENERATION_MAX_WAIT_MS (or GENERATION_MAX_BATCH
+#prompts) and run as one padded generate call, see generation_batcher.py
+GENERATION_BATCHING = os.getenv("GENERATION_BATCHING", "1") == "1"
+GENERATION_MAX_BATCH = int(os.getenv("GENERATION_MAX_BATCH", 8))
+GENERATION_MAX_WAIT_MS = float(os.getenv("GENERATION_MAX_WAIT_MS", 10))
+
+#async query path: retrieval and generation run on a dedicated thread pool, at most
+#MAX_CONCURRENT_GENERATIONS answers are generated at once and each query has a deadline
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 16))
+MAX_CONCURRENT_GENERATIONS = int(os.getenv("MAX_CONCURRENT_GENERATIONS", GENERATION_MAX_BATCH))
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", 60))
+
+#"hybrid" fuses vector search with lexical (BM25 / MySQL FULLTEXT) search, "vector" is similarity search only.
+#Lexical hits are only fused in when the vector side passed its score threshold, so unrelated
+#questions still end with "No relevant documents found"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+#"bm25" (in-memory), "fulltext" (MySQL idx_review_content for reviews) or "auto" by database dialect.
+#Every worker process holds its own BM25 copy of the indexed chunks (see cache-stats for the size),
+#on MySQL "fulltext" keeps the big review side in the database instead
+LEXICAL_BACKEND = os.getenv("LEXICAL_BACKEND", "auto")
+LEXICAL_MIN_MATCH = float(os.getenv("LEXICAL_MIN_MATCH", 0.3)) #BM25 score floor, see BM25Index.search
+LEXICAL_VERSION_CHECK_S = float(os.getenv("LEXICAL_VERSION_CHECK_S", 1.0)) #how often to look for other workers' writes
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20)) #per retriever, before fusion cuts to k
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", 4))
+#optional cross-encoder re-rank: fetch a bigger candidate pool, score it in one batch, keep the role's k
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 30))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 150))
+
+#retriever settings per role, owners focus on reviews only
+RETRIEVER_PARAMS = {
+    "property_owner": {"k": 5, "score_threshold": 0.7, "filter_dict": {"source": "review"}},
+    "customer": {"k": 3, "score_threshold": 0.7},
+}
+
+# Customize prompt based on user role
+PROMPT_TEMPLATES = {
+    "property_owner": """
+            You are an expert travel business advisor analyzing a query from a property owner. 
+            The review statistics below cover every customer review of your property, the context contains a sample of individual reviews.
+            Carefully analyze them to extract key feedback, recurring themes, and actionable insights that can help improve your property’s performance.
+            Use only the information provided in the statistics and the context to base your analysis.
+            
+            Review statistics: {review_stats}
+            
+            Context: {context}
+            
+            Question: {question}
+            
+            Answer:
+            """,
+    "customer": """
+            You are a friendly and knowledgeable travel assistant. 
+            The context provided below includes both frequently asked questions and customer reviews related to the query.
+            Based solely on this context, provide a clear, concise, and helpful answer that addresses the customer's question. 
+            Ensure your response is supportive and actionable, highlighting relevant details from the context.
+            
+            Context: {context}
+            
+            Question: {question}
+            
+            Helpful Answer:
+            """,
+}
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-#Load sentiment analysis model once
-sentiment_analyzer = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+#Model loaders. Nothing is loaded at import time, the registry runs each loader
+#once on first use (or from warm_up) so CLI commands and migrations start fast.
+#Each model runs on the backend picked by INFERENCE_BACKEND / INFERENCE_BACKEND_<NAME>
+#(torch, int8, onnx, onnx-int8), see inference_backend.py.
+def _classifier_pipeline(model_id: str, backend: str, **kwargs):
+    from transformers import pipeline
+    if backend == "torch":
+        return pipeline("text-classification", model=model_id, **kwargs)
+    model, tokenizer = load_model(model_id, "text-classification", backend)
+    return pipeline("text-classification", model=model, tokenizer=tokenizer, **kwargs)
+
+def _load_sentiment_model():
+    return _classifier_pipeline(SENTIMENT_MODEL, backend_for("sentiment"))
 
 #Added a multi-class emotion detection model for future use.
-emotion_analyzer = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base", top_k=1 )
+#Returns the full distribution over emotions so sentiment can be derived from it as well.
+def _load_emotion_model():
+    return _classifier_pipeline(EMOTION_MODEL, backend_for("emotion"), top_k=None)
+
+def _load_embedding_model():
+    backend = backend_for("embedder")
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    model, tokenizer = load_model(EMBEDDING_MODEL, "feature-extraction", backend)
+    return TransformerEmbeddings(model, tokenizer, max_length=EMBEDDING_MAX_TOKENS + 2)
+
+def _load_llm():
+    # Initialize LLM once. Both roles share the same flan-t5 weights, the
+    # sampling settings are applied per call through pipeline_kwargs.
+    from langchain_community.llms import HuggingFacePipeline
+    backend = backend_for("llm")
+    if backend == "torch":
+        return HuggingFacePipeline.from_model_id(
+            model_id=LLM_MODEL,
+            task="text2text-generation",
+            device = None,
+            model_kwargs={"device_map":"auto"}, #for automatic device placement
+            pipeline_kwargs={"max_length": 512}
+        )
+    from transformers import pipeline
+    model, tokenizer = load_model(LLM_MODEL, "text2text-generation", backend)
+    return HuggingFacePipeline(pipeline=pipeline("text2text-generation", model=model, tokenizer=tokenizer),
+                               model_id=LLM_MODEL, pipeline_kwargs={"max_length": 512})
+
+#registry name -> (model id, task), used by `flask rag convert-models` and bench/inference_backends.py
+MODEL_TASKS = {
+    "embedder": (EMBEDDING_MODEL, "feature-extraction"),
+    "sentiment": (SENTIMENT_MODEL, "text-classification"),
+    "emotion": (EMOTION_MODEL, "text-classification"),
+    "llm": (LLM_MODEL, "text2text-generation"),
+}
+#stored and cached embeddings are tagged with model and backend, switching backends re-embeds
+EMBEDDING_MODEL_TAG = model_tag(EMBEDDING_MODEL, backend_for("embedder"))
 
-def analyze_sentiment(text, threshold=0.7):
+def _load_embedding_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+
+def _load_llm_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(LLM_MODEL)
+
+def _load_reranker():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL, device="cpu", max_length=512)
+
+registry.register("sentiment", _load_sentiment_model)
+registry.register("emotion", _load_emotion_model)
+registry.register("embedder", _load_embedding_model)
+registry.register("llm", _load_llm)
+registry.register("embedding_tokenizer", _load_embedding_tokenizer)
+registry.register("llm_tokenizer", _load_llm_tokenizer)
+registry.register("reranker", _load_reranker)
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings proxy that resolves the registered embedding model on first use"""
+    def __init__(self, model_name: str = "embedder"):
+        self.model_name = model_name
+
+    #spans only cover model forward passes, embedding cache hits never get here
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with metrics.span("embed"):
+            return registry.get(self.model_name).embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        with metrics.span("embed"):
+            return registry.get(self.model_name).embed_query(text)
+
+def build_filter(base: dict = None, hotel_ids: list = None):
+    """Combine a metadata filter with a hotel scope into a Chroma `where` clause"""
+    clauses = [{key: value} for key, value in (base or {}).items()]
+    if hotel_ids:
+        clauses.append({"hotel_id": hotel_ids[0]} if len(hotel_ids) == 1 else {"hotel_id": {"$in": list(hotel_ids)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+#helper function to format retrieved documents into a single context string.
+def format_docs(docs: list[Document]) -> str:
+    if not docs:
+        return NO_CONTEXT
+    return "\n\n".join(doc.page_content for doc in docs)
+
+def _count_llm_tokens(text: str) -> int:
     try:
-        result = sentiment_analyzer(text[:512])[0]
-        label = result['label'].lower() #positive or negative
-        score = result['score']
+        return count_tokens(text, registry.get("llm_tokenizer"))
+    except Exception:
+        return len(text.split()) #rough count rather than failing the query over a metric
+
+def _classify(model_name, texts, batch_size):
+    """Run a classification pipeline over texts in length-sorted order so every padded batch
+    holds texts of similar length, results come back in input order"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    outputs = registry.get(model_name)(
+        [texts[i] for i in order], batch_size=batch_size,
+        truncation=True, max_length=CLASSIFIER_MAX_TOKENS #truncate on tokens, not characters
+    )
+    results = [None] * len(texts)
+    for i, output in zip(order, outputs):
+        results[i] = output
+    return results
 
-        if score < threshold:
-            return 'neutral' # confidence is too low bhai.
-        return label
+def _top_label(result):
+    #top_k pipelines return a list of {label, score} per text
+    return max(result, key=lambda item: item['score']) if isinstance(result, list) else result
+
+def _sentiment_from_emotions(result, threshold):
+    """Fold the full emotion distribution into positive/negative/neutral mass and keep the
+    usual threshold rule: the winning polarity needs at least `threshold` probability"""
+    mass = {"positive": 0.0, "negative": 0.0, "neutral": 0.0}
+    for item in result:
+        mass[EMOTION_TO_SENTIMENT.get(item['label'].lower(), 'neutral')] += item['score']
+    label = 'positive' if mass['positive'] >= mass['negative'] else 'negative'
+    return label if mass[label] >= threshold else 'neutral'
+
+def _emotion_label(result, threshold):
+    top = _top_label(result)
+    if top['score'] < threshold:
+        return 'neutral' # confidence is too low bhai.
+    return top['label'].lower()
+
+def analyze_sentiment(text, threshold=0.7, batch_size=CLASSIFIER_BATCH_SIZE):
+    """Sentiment label for one text, or a list of labels when given a list of texts.
+    None for every text when the classifier fails, so callers leave the review unlabelled."""
+    single = isinstance(text, str)
+    texts = [text] if single else list(text)
+    try:
+        with metrics.span("sentiment", operation="classify"):
+            if CLASSIFIER_MODE == "shared":
+                labels = [_sentiment_from_emotions(result, threshold) for result in _classify("emotion", texts, batch_size)]
+            else:
+                labels = []
+                for result in _classify("sentiment", texts, batch_size):
+                    result = _top_label(result)
+                    if result['score'] < threshold:
+                        labels.append('neutral') # confidence is too low bhai.
+                    else:
+                        labels.append(result['label'].lower()) #positive or negative
+        metrics.CLASSIFIED_TEXTS.inc(len(texts), model="sentiment")
     except Exception as e:
-        print(f"Sentiment analysis failed: {e}")
-        return 'neutral' #or we can return none/ raise a custom exception.
+        logger.error("Sentiment analysis failed: %s", e)
+        metrics.ERRORS.inc(operation="sentiment")
+        labels = [None] * len(texts) #not 'neutral', that would be stored as a real label
+    return labels[0] if single else labels
     
-def detect_emotion(text, threshold=0.5):
+def detect_emotion(text, threshold=0.5, batch_size=CLASSIFIER_BATCH_SIZE):
+    """Emotion label for one text, or a list of labels when given a list of texts, None when the classifier fails"""
+    single = isinstance(text, str)
+    texts = [text] if single else list(text)
     try:
-        result = emotion_analyzer(text[:512])[0][0]
-        emotion = result['label'].lower()
-        score = result['score']
-        if score < threshold:
-            return 'neutral' # confidence is too low bhai.
-        return emotion
+        with metrics.span("emotion", operation="classify"):
+            labels = [_emotion_label(result, threshold) for result in _classify("emotion", texts, batch_size)]
+        metrics.CLASSIFIED_TEXTS.inc(len(texts), model="emotion")
     except Exception as e:
-        print(f"Emotion Detection Error: {e}")
-        return 'neutral'
+        logger.error("Emotion Detection Error: %s", e)
+        metrics.ERRORS.inc(operation="emotion")
+        labels = [None] * len(texts)
+    return labels[0] if single else labels
+
+def analyze_review(texts, sentiment_threshold=0.7, emotion_threshold=0.5, batch_size=CLASSIFIER_BATCH_SIZE):
+    """(sentiments, emotions) for a list of texts. In shared mode both come out of a single
+    emotion-model pass, otherwise each model runs once over the whole batch. Labels of a
+    failed model are None."""
+    texts = list(texts)
+    if CLASSIFIER_MODE != "shared":
+        return (analyze_sentiment(texts, sentiment_threshold, batch_size),
+                detect_emotion(texts, emotion_threshold, batch_size))
+    try:
+        with metrics.span("shared", operation="classify"):
+            results = _classify("emotion", texts, batch_size)
+        metrics.CLASSIFIED_TEXTS.inc(len(texts), model="emotion")
+        return ([_sentiment_from_emotions(result, sentiment_threshold) for result in results],
+                [_emotion_label(result, emotion_threshold) for result in results])
+    except Exception as e:
+        logger.error("Review analysis failed: %s", e)
+        metrics.ERRORS.inc(operation="review_analysis")
+        return [None] * len(texts), [None] * len(texts)
 
 
 class RAGSystem:
-    def __init__(self, db_connection):
-        # Initialize embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+    def __init__(self, db_connection, persist_directory: str = PERSIST_DIR, collection_name: str = "travel_data"):
+        # Initialize embeddings, the model itself is loaded on first use.
+        # Queries and documents go through the embedding cache, only unseen text reaches the model.
+        self.embeddings = CachedEmbeddings(LazyEmbeddings(), model_name=EMBEDDING_MODEL_TAG,
+                                           database_path=EMBEDDING_CACHE_PATH, max_memory_entries=EMBEDDING_CACHE_MEMORY,
+                                           max_disk_entries=EMBEDDING_CACHE_MAX_ENTRIES)
         
-        #add caching- initialize SQLite cache
-        self.cache = SQLiteCache(database_path=".rag_cache.db")
-
-        # Initialize LLM 
-        self.llm_deterministic = HuggingFacePipeline.from_model_id(
-            model_id="google/flan-t5-base",
-            task="text2text-generation",
-            device = None,
-            model_kwargs={
-                "do_sample": False, 
-                "max_length": 512, 
-                "device_map":"auto"} #for automatic device placement
-        )
+        #answer cache for query_system, keyed on question, role, retriever params and content version
+        self.cache = AnswerCache(database_path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+        #second level for paraphrases, consulted on an exact-match miss
+        self.semantic_cache = SemanticAnswerCache(threshold=SEMANTIC_CACHE_THRESHOLD,
+                                                  max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
 
-        self.llm_stochastic = HuggingFacePipeline.from_model_id(
-            model_id="google/flan-t5-base",
-            task="text2text-generation",
-            device = None,
-            model_kwargs={
-                "do_sample": True,
-                "temperature": 0.2, 
-                "max_length": 512, 
-                "device_map":"auto"} #for automatic device placement
-        )
-        
-        # Connect to ChromaDB (persistent storage)
-        self.vector_store = Chroma(
-            collection_name="travel_data",
-            embedding_function=self.embeddings,
-            persist_directory="./chroma_db"
-        )
-        
         # Link with database connection(SQLAlchemy db object)
         self.db = db_connection
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
 
-        #Conditional data loading
-        #Check if the vector store collection seems empty before loading
-        try:
-            current_count = self.vector_store._collection.count()
-            print(f"Vector store current document count: {current_count}")
-            if current_count == 0:
-                print("Vector store appears empty. Performing initial data laod..")
-                self._load_faqs_into_vectorstore()
-                self._load_reviews_into_vectorstore()
-                print("Initial data loading complete.")
-            else:
-                print("Vector store already contains data. Skipping bulk load.")
-        except Exception as e:
-            print(f"Error checking vector store count or performing initial load: {e}")
-            print("Please ensure './chroma_db' is accessible and correctly initialized ")
-        print("RAG sustem intialized.")
+        #vector store, chains and the initial load are all created lazily, see warm_up.
+        self._vector_store = None
+        self._chains = None
+        self._index_ready = False
+        self._init_lock = threading.RLock()
+        #incremental upserts are coalesced and flushed in batches
+        self.write_buffer = WriteBehindBuffer(self._flush_writes)
+        #SQL -> collection sync: commit hooks plus the reconcile job
+        self.sync = VectorSync(self)
+        #lexical side of hybrid retrieval: source -> (index version it reflects, BM25Index). Our own
+        #flushes update it in place, other workers' writes trigger a background rebuild
+        self._bm25 = {}
+        self._bm25_lock = threading.Lock()
+        self._bm25_building = set()
+        self._index_version_seen = (0.0, None) #(monotonic time checked, shared index version)
+        self._executor = None
+        #async query path, see aquery_system
+        self._achains = None
+        self._query_executor = None
+        #a threading semaphore, every asyncio.run / async view has its own event loop. Waiters block
+        #in threads of their own pool (FIFO, no polling), ThreadPoolExecutor starts them on demand
+        self._generation_slots = threading.BoundedSemaphore(MAX_CONCURRENT_GENERATIONS)
+        self._slot_waiters = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="generation-wait")
+        self.reranker = CrossEncoderReranker("reranker", RERANK_BUDGET_MS)
+        self.generation_batcher = GenerationBatcher(
+            lambda prompts, kwargs: generate_batch(registry.get("llm"), prompts, kwargs),
+            max_batch=GENERATION_MAX_BATCH, max_wait_ms=GENERATION_MAX_WAIT_MS)
+        self._batched_llm = BatchedLLM(batcher=self.generation_batcher, stream_llm=lambda: registry.get("llm"))
+        #times every generation and counts its prompt/answer tokens, see metrics.py
+        self.generation_metrics = metrics.GenerationMetrics(_count_llm_tokens)
+        self.app = None
+        logger.info("RAG system initialized.")
 
-    def _load_faqs_into_vectorstore(self):
-        """Load FAQs from SQL database into Chroma vector store"""
-        try:
-            print("Attempting to load FAQs from database....")
-            faqs = self.db.session.query(FAQ).all() #database interaction
-            if not faqs:
-                print("No FAQs found in the database to load.")
+    def init_app(self, app):
+        """Remember the Flask app so background flushes can open an app context"""
+        self.app = app
+
+    @property
+    def llm(self):
+        if GENERATION_BATCHING:
+            return self._batched_llm
+        return registry.get("llm")
+
+    @property
+    def llm_deterministic(self):
+        return self.llm.bind(pipeline_kwargs=DETERMINISTIC_GENERATION_KWARGS)
+
+    @property
+    def llm_stochastic(self):
+        return self.llm.bind(pipeline_kwargs=STOCHASTIC_GENERATION_KWARGS)
+
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            with self._init_lock:
+                if self._vector_store is None:
+                    from langchain_chroma import Chroma
+                    # Connect to ChromaDB (persistent storage)
+                    self._vector_store = Chroma(
+                        collection_name=self.collection_name,
+                        embedding_function=self.embeddings,
+                        persist_directory=self.persist_directory
+                    )
+        return self._vector_store
+
+    @property
+    def chains(self):
+        """Prebuilt LCEL chains, one per role. Built on first use since they need the LLM."""
+        if self._chains is None:
+            with self._init_lock:
+                if self._chains is None:
+                    self._chains = {role: self._build_chain(role) for role in RETRIEVER_PARAMS}
+        return self._chains
+
+    @property
+    def achains(self):
+        """Chains for aquery_system: same layout as `chains`, with thread-pool retrieval
+        and generation bounded by the generation semaphore"""
+        if self._achains is None:
+            with self._init_lock:
+                if self._achains is None:
+                    self._achains = {role: self._build_chain(role, bounded=True) for role in RETRIEVER_PARAMS}
+        return self._achains
+
+    @property
+    def query_executor(self):
+        #separate from `executor`, retrieval running here submits its vector stage to that one
+        if self._query_executor is None:
+            with self._init_lock:
+                if self._query_executor is None:
+                    self._query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query")
+        return self._query_executor
+
+    def ensure_index(self):
+        """Run the initial data load once. Needs an app context for database access."""
+        if self._index_ready:
+            return
+        with self._init_lock:
+            if self._index_ready:
                 return
-            documents = [
-                f"Question: {faq.question}\nAnswer: {faq.answer}" 
-                for faq in faqs] #creates text documents for embedding
-            #generate unique ids for chromadb based on FAQ primary key.
-            ids=[f"faq_{faq.id}" for faq in faqs]
-            #Metadata generation which can helpful for filtering later.
-            metadatas = [
-                {
-                    "source": "faq", 
-                    "db_id": faq.id, 
-                    "hotel_id":faq.hotel_id
-                } 
-                for faq in faqs
-            ] 
-            if documents:
-                #Adding to Vector Store
-                self.vector_store.add_texts(texts=documents, metadatas=metadatas, ids=ids)
-                #save the changes to the persistent chromadb storage.
-                self.vector_store.persist()
-                print(f"Loaded {len(faqs)} FAQs into vector store.")
-            else:
-                print("No valid documents generated to load")
+            #Conditional data loading
+            #Check if the vector store collection seems empty before loading
+            try:
+                current_count = self.vector_store._collection.count()
+                logger.info("Vector store current document count: %d", current_count)
+                pending = self._bulk_indexer().pending_sources()
+                if current_count == 0:
+                    logger.info("Vector store appears empty. Performing initial data load..")
+                    self._bulk_indexer().reset_checkpoint() #a wiped collection makes any old checkpoint stale
+                    self._load_faqs_into_vectorstore()
+                    self._load_reviews_into_vectorstore()
+                    logger.info("Initial data loading complete.")
+                elif pending:
+                    logger.info("Resuming interrupted initial load for: %s", ", ".join(pending))
+                    if "faq" in pending:
+                        self._load_faqs_into_vectorstore()
+                    if "review" in pending:
+                        self._load_reviews_into_vectorstore()
+                elif self._bulk_indexer().model_mismatch():
+                    #vectors of another model or backend, re-index (stored embeddings of the current tag are reused)
+                    logger.warning("Vector store was embedded with another model than %s, re-indexing..", EMBEDDING_MODEL_TAG)
+                    self._bulk_indexer().reset_checkpoint()
+                    self._load_faqs_into_vectorstore(resume=False)
+                    self._load_reviews_into_vectorstore(resume=False)
+                    self.cache.bump_version()
+                else:
+                    logger.info("Vector store already contains data. Skipping bulk load.")
+                self._index_ready = True
+            except Exception as e:
+                logger.error("Error checking vector store count or performing initial load: %s", e, exc_info=True)
+                logger.error("Please ensure '%s' is accessible and correctly initialized", self.persist_directory)
+
+    def warm_up(self):
+        """Explicit warm-up hook for production workers: load every model, open the
+        vector store, build the chains, run the initial load, reconcile the collection
+        with SQL and start the BM25 builds. Returns per-model load stats."""
+        classifiers = ["emotion"] if CLASSIFIER_MODE == "shared" else ["sentiment", "emotion"]
+        stats = registry.warm_up(["embedder", "llm", "embedding_tokenizer", "llm_tokenizer"] + classifiers)
+        if RERANK_ENABLED:
+            #optional model, a failed load is reported in the stats instead of failing the worker
+            self.reranker.load()
+            stats["reranker"] = self.reranker.stats()
+        self.ensure_index()
+        if RECONCILE_ON_WARM_UP:
+            #ensure_index skips a non-empty collection, catch up on edits and deletes made while we were down
+            self.sync.reconcile()
+        self._warm_bm25()
+        self.chains
+        return stats
 
+    def cache_stats(self) -> dict:
+        """Hit rates of the answer cache and the embedding cache, re-ranker load and skip counters
+        and the chunk count of each in-memory BM25 index (None while the first build runs)"""
+        bm25 = {source: len(self._bm25[source][1]) if source in self._bm25 else None for source in INDEX_SOURCES}
+        return {"answers": self.cache.stats(), "semantic_answers": self.semantic_cache.stats(),
+                "embeddings": self.embeddings.stats(), "reranker": self.reranker.stats(), "bm25": bm25}
+
+    def _bulk_indexer(self):
+        return BulkIndexer(self.db.session, self.vector_store, self.embeddings,
+                           checkpoint_path=os.path.join(self.persist_directory, "index_checkpoint.json"),
+                           model_name=EMBEDDING_MODEL_TAG, chunker=self._chunk)
+
+    def _chunk(self, source: str, text: str) -> list[str]:
+        """Token-aware chunks of a FAQ/review document using the embedder's tokenizer"""
+        chunk_size, overlap = CHUNK_SETTINGS[source]
+        return chunk_text(text, registry.get("embedding_tokenizer"), chunk_size, overlap)
+
+    def _prompt_inputs(self, inputs: dict, role: str) -> dict:
+        """Prompt variables for a role: question and packed context, plus review statistics for owners"""
+        variables = {"question": inputs["question"]}
+        if role == "property_owner":
+            variables["review_stats"] = self._owner_review_stats(inputs.get("hotel_ids"))
+        variables["context"] = self._pack_context(inputs["docs"], variables, role)
+        return variables
+
+    def _owner_review_stats(self, hotel_ids: list) -> str:
+        """Aggregates over every review of the owner's hotels, constant cost however many reviews there are"""
+        if not OWNER_REVIEW_STATS or not hotel_ids or self.db is None:
+            return "Not available."
+        try:
+            with self._app_context(), metrics.span("review_stats"):
+                summary = owner_review_summary(self.db.session, hotel_ids)
+                return truncate_to_tokens(summary, registry.get("llm_tokenizer"), OWNER_REVIEW_STATS_MAX_TOKENS)
         except Exception as e:
-            print(f"Error loading FAQs into vector store:{e}")
-    def _load_reviews_into_vectorstore(self):
-        """Load all reviews from SQL database into ChromaDB"""
+            logger.warning("Review statistics unavailable: %s", e)
+            return "Not available."
+
+    def _pack_context(self, docs: list[Document], variables: dict, role: str) -> str:
+        """Context string filled up to flan-t5's input limit, see chunking.pack_context.
+        `variables` are the other prompt variables, they count against the limit."""
+        if not docs:
+            return format_docs(docs)
         try:
-            print("Attempting to load Reviews from database...")    
-            reviews = self.db.session.query(Review).all()
-            if not reviews:
-                print("No Reviews found in the database to load")
-                return
-            documents = [
-                f"Review: {review.content}"
-                for review in reviews
-            ]
-            #Generate unique ids for chromadb based Review Primary key.
-            ids = [f"review_{review.id}" for review in reviews]
-            metadatas = [
-                {
-                    "source": "review",
-                    "db_id" : review.id,
-                    "user_id": review.user_id,
-                    "hotel_id": review.hotel_id
-                }
-                for review in reviews
-            ]
-            if documents:       
-                self.vector_store.add_texts(texts=documents, metadatas=metadatas, ids=ids)
-                self.vector_store.persist()
-                print(f"Loaded {len(reviews)} Reviews into vector store.")
-            else:
-                print("No valid Review documents generated to load.")
+            with metrics.span("format_prompt"):
+                tokenizer = registry.get("llm_tokenizer")
+                overhead = count_tokens(PROMPT_TEMPLATES[role].format(**dict(variables, context="")), tokenizer)
+                return pack_context(docs, overhead, tokenizer, LLM_MAX_INPUT_TOKENS)
         except Exception as e:
-            print(f"Error loading Reviews into vector store: {e}") 
+            logger.warning("Context packing failed, sending unpacked context: %s", e)
+            return format_docs(docs)
 
-    def add_faq_to_vectorstore(self, faq:FAQ):
-        """Incrementally add a single faq to the vector store"""
+    def _load_faqs_into_vectorstore(self, resume: bool = True):
+        """Stream FAQs from SQL database into Chroma vector store in batches"""
         try:
-            document = f"Question: {faq.question}\nAnswer: {faq.answer}"
-            faq_id = f"faq_{faq.id}" #for consistent id format
-            metadata = {"source": "faq", "db_id": faq.id, "hotel_id":faq.hotel_id}
-            self.vector_store.add_texts(texts=[document], metadatas=[metadata], ids=[faq_id])
-            self.vector_store.persist()
-            print(f"Added/updated FAQ {faq.id} in vector store.")
+            logger.info("Attempting to load FAQs from database....")
+            with metrics.trace("bulk_load"):
+                count = self._bulk_indexer().index("faq", resume=resume)
+            self.cache.bump_index_version()
+            logger.info("Loaded %d FAQs into vector store.", count)
         except Exception as e:
-            print(f"Error adding FAQ {faq.id} to vector store: {e}")
+            logger.error("Error loading FAQs into vector store: %s", e, exc_info=True)
+            metrics.ERRORS.inc(operation="bulk_load")
 
-    def add_review_to_vectorstore(self, review):
-        """Incrementally add a single review to the vector store"""
+    def _load_reviews_into_vectorstore(self, resume: bool = True):
+        """Stream all reviews from SQL database into ChromaDB in batches"""
         try:
-            document = f"Review: {review.content}"
-            #use consistent id formatfor potential updates  
-            review_id = f"review_{review.id}"                             
-            metadata = {"source": "review", "db_id": review.id, "user_id": review.user_id, "hotel_id":review.hotel_id}
-            self.vector_store.add_texts(texts=[document], metadatas=[metadata], ids=[review_id])
-            self.vector_store.persist()
-            print(f"Added Review {review.id} in vector store.") 
+            logger.info("Attempting to load Reviews from database...")
+            with metrics.trace("bulk_load"):
+                count = self._bulk_indexer().index("review", resume=resume)
+            self.cache.bump_index_version()
+            logger.info("Loaded %d Reviews into vector store.", count)
         except Exception as e:
-            print(f"Error adding Review {review.id} to vector store: {e}")
+            logger.error("Error loading Reviews into vector store: %s", e, exc_info=True)
+            metrics.ERRORS.inc(operation="bulk_load")
+
+    def rebuild_index(self):
+        """Re-index every FAQ and review from SQL. Rows with an up to date stored
+        embedding are indexed without any model inference."""
+        self._bulk_indexer().reset_checkpoint()
+        self._load_faqs_into_vectorstore(resume=False)
+        self._load_reviews_into_vectorstore(resume=False)
+        self.cache.bump_version()
+        self._index_ready = True
+
+    def add_faq_to_vectorstore(self, faq:FAQ):
+        """Incrementally add a single faq to the vector store (buffered, see WriteBehindBuffer)"""
+        with metrics.span("enqueue", operation="ingest"):
+            self.write_buffer.add("faq", faq.id)
+        logger.info("Queued FAQ %s for the vector store.", faq.id)
+
+    def add_review_to_vectorstore(self, review):
+        """Incrementally add a single review to the vector store (buffered, see WriteBehindBuffer)"""
+        with metrics.span("enqueue", operation="ingest"):
+            self.write_buffer.add("review", review.id)
+        logger.info("Queued Review %s for the vector store.", review.id)
+
+    def add_reviews_to_vectorstore(self, reviews):
+        """Add a batch of reviews to the vector store, coalesced with any other pending writes"""
+        with metrics.span("enqueue", operation="ingest"):
+            for review in reviews:
+                self.write_buffer.add("review", review.id)
+        logger.info("Queued %d Reviews for the vector store.", len(reviews))
+
+    def _app_context(self):
+        #write-behind flushes run on their own thread, outside any request
+        if has_app_context() or self.app is None:
+            return nullcontext()
+        return self.app.app_context()
+
+    def _flush_writes(self, pending: dict):
+        """Write-behind flush: one batched embed + upsert per source for every buffered row.
+        Rows are re-read from SQL so the latest committed content wins, rows deleted in the
+        meantime are removed from the collection."""
+        with self._app_context(), metrics.trace("ingest"):
+            self.ensure_index()
+            indexer = self._bulk_indexer()
+            hotel_ids = set()
+            for source, ids in pending.items():
+                model = INDEX_SOURCES[source][0]
+                rows = self.db.session.query(model).filter(model.id.in_(ids)).all()
+                if rows:
+                    #embeds (and stores the embedding on the row) unless it is already up to date
+                    indexer.index_rows(source, rows)
+                found = {row.id for row in rows}
+                gone = [f"{source}_{row_id}" for row_id in ids if row_id not in found]
+                hotel_ids.update(row.hotel_id for row in rows)
+                if gone:
+                    #deleted rows are only known to the collection now, take their hotel from there
+                    indexed = self.vector_store._collection.get(where={"parent_id": {"$in": gone}}, include=["metadatas"])
+                    hotel_ids.update(metadata["hotel_id"] for metadata in indexed["metadatas"] if "hotel_id" in metadata)
+                with metrics.span("delete"):
+                    indexer.delete_parents(gone)
+                self._update_bm25(source, [f"{source}_{row.id}" for row in rows], gone)
+                logger.info("Flushed %d %s writes to vector store.", len(ids), source)
+            self._bm25_written()
+            self.cache.bump_version(sorted(hotel_ids)) #cached answers for these hotels may now be stale
 
     def get_retriever(self, k: int = 3, score_threshold: float=0.7, filter_dict: dict = None):
         """Create a LangChain retriever with specified search parameters."""
@@ -215,99 +668,419 @@ class RAGSystem:
             search_kwargs['filter'] = filter_dict
            
         return self.vector_store.as_retriever(
-            search_kwargs=search_kwargs, search_type="similarity_score_threshold"
+            search_kwargs=search_kwargs,
+            search_type="similarity_score_threshold" if score_threshold is not None else "similarity"
         )
 
-    def query_system(self, question: str, role: str="customer"):
-        """Full RAG pipeline using LangChain Expression Language(LCEL)
-        to handle custom prompts based on user role and return sources"""
-        # Load both FAQs and Reviews. Use full methods during query initialization.
-        #self._load_faqs_into_vectorstore()
-        #self._load_reviews_into_vectorstore()
-        #commented out the data loading calls here.
-        
+    def _build_chain(self, role: str, bounded: bool = False):
+        """Build the LCEL chain for a role once. Retrieval runs a single time per query
+        and the same documents feed both the prompt context and the returned sources.
+        bounded=True builds the variant used through ainvoke by aquery_system."""
         # based on role routing query to correct pipeline.
         if role == "property_owner":
             llm_for_query = self.llm_deterministic
         else:
             llm_for_query = self.llm_stochastic
-        # modify retriever for owners to focus on reviews
-        if role=="property_owner":
-            retriever=self.get_retriever(k=5, filter_dict={"source":"review"})
-        else:
-            retriever=self.get_retriever(k=3)    
-        
-        # Customize prompt based on user role
-        if role == "property_owner":
-            template = """
-            You are an expert travel business advisor analyzing a query from a property owner. 
-            The context provided below contains exclusively customer reviews about your property.
-            Carefully analyze these reviews to extract key feedback, recurring themes, and actionable insights that can help improve your property’s performance.
-            Use only the information provided in the context to base your analysis.
-            
-            Context: {context}
-            
-            Question: {question}
-            
-            Answer:
-            """
-        else:
-            template = """
-            You are a friendly and knowledgeable travel assistant. 
-            The context provided below includes both frequently asked questions and customer reviews related to the query.
-            Based solely on this context, provide a clear, concise, and helpful answer that addresses the customer's question. 
-            Ensure your response is supportive and actionable, highlighting relevant details from the context.
-            
-            Context: {context}
-            
-            Question: {question}
-            
-            Helpful Answer:
-            """
-        prompt = PromptTemplate(
-            template = template,
-            input_variables=["context", "question"]
-        )
-        #RAG Chain using LCEL.
-        #helper function to format retrieved documents into a single context string. 
-        def format_docs(docs: list[Document]) -> str:
-            if not docs:
-                return "No relevant documents found."
-            return "\n\n".join(doc.page_content for doc in docs)
-
-        #Define the core chain that generates the answer string.
+        prompt = PromptTemplate.from_template(PROMPT_TEMPLATES[role])
+        #Define the core chain that generates the answer string from already retrieved docs.
         rag_chain_core = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()} #pass the input to the next runnable or chain without any modification.
-            | prompt            # Feed context and question to the prompt
-            | llm_for_query          # Send formatted prompt to LLM
+            RunnableLambda(partial(self._prompt_inputs, role=role)) # context, question (and owner review stats)
+            | prompt            # Feed them to the prompt
+            | llm_for_query.with_config(callbacks=[self.generation_metrics]) # Send formatted prompt to LLM
             | StrOutputParser() # Get string output from LLM
         )
-        #Define a parallel chain to retrieve source documents alonside the answer.
-        rag_chain_with_source = RunnableParallel(
-            #retrieve documents first, pass them along as 'docs'
-            {"docs": retriever, "question": RunnablePassthrough()}
-        ) | RunnableParallel(
-            #run the core chain using retrieved docs and question and pass the raw 'docs' through to the final output.
-            {"answer": rag_chain_core, "documents": lambda x: x["docs"]}
-        )
+        #retrieve documents first, pass them along as 'docs' and add the answer next to them.
+        #input is {"question": ..., "hotel_ids": ...}, the hotel scope is applied per call.
+        if bounded:
+            return RunnablePassthrough.assign(
+                docs=RunnableLambda(partial(self._retrieve, role=role), afunc=partial(self._aretrieve, role=role))
+            ) | RunnablePassthrough.assign(
+                answer=RunnableLambda(rag_chain_core.invoke, afunc=partial(self._agenerate, core=rag_chain_core)))
+        return RunnablePassthrough.assign(
+            docs=RunnableLambda(partial(self._retrieve, role=role))
+        ) | RunnablePassthrough.assign(answer=rag_chain_core)
 
-        #Invoke the chain
+    def _retrieve_in_context(self, inputs: dict, role: str) -> list[Document]:
+        with self._app_context(): #the FULLTEXT backend needs the database session
+            return self._retrieve(inputs, role)
+
+    async def _aretrieve(self, inputs: dict, role: str) -> list[Document]:
+        """Embedding and Chroma search on the query thread pool, the event loop stays free"""
+        return await asyncio.wrap_future(self.query_executor.submit(metrics.in_context(self._retrieve_in_context), inputs, role))
+
+    async def _agenerate(self, inputs: dict, core) -> str:
+        """Generate on the query thread pool once a generation slot is free, waiting for one at
+        most QUERY_TIMEOUT_S. The slot is held until the generation thread finishes, so a timed
+        out request whose generation is already running keeps counting against capacity until it is done."""
+        waiting = self._slot_waiters.submit(self._generation_slots.acquire, True, QUERY_TIMEOUT_S)
+        try:
+            acquired = await asyncio.wrap_future(waiting)
+        except asyncio.CancelledError:
+            #a wait already blocked in acquire cannot be interrupted, give the slot back once it gets one
+            waiting.add_done_callback(lambda done: not done.cancelled() and done.result() and self._generation_slots.release())
+            raise
+        if not acquired:
+            raise TimeoutError(f"No generation slot free within {QUERY_TIMEOUT_S:.0f}s")
         try:
-            result  =  rag_chain_with_source.invoke(question)
+            future = self.query_executor.submit(metrics.in_context(core.invoke), inputs)
+        except BaseException:
+            self._generation_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._generation_slots.release())
+        #cancelling the wrapper cancels the pool future too if generation has not started yet
+        return await asyncio.wrap_future(future)
+
+    def _retrieve(self, inputs: dict, role: str) -> list[Document]:
+        """Retrieval for the role's retriever settings, pre-filtered to the hotel scope"""
+        hotel_ids = inputs.get("hotel_ids")
+        if hotel_ids is not None and not hotel_ids:
+            return [] #e.g. an owner without any hotels, nothing may be searched
+        k = RETRIEVER_PARAMS[role]["k"]
+        #with re-ranking on, the first stage returns a bigger pool and the cross-encoder picks the k
+        pool = max(RERANK_CANDIDATES, k) if RERANK_ENABLED else k
+        if RETRIEVAL_MODE == "hybrid":
+            docs, timings = self.hybrid_search(inputs["question"], role, hotel_ids, k=pool)
+            logger.debug("Hybrid retrieval timings: %s", timings)
+        else:
+            params = dict(RETRIEVER_PARAMS[role], k=pool)
+            params["filter_dict"] = build_filter(params.get("filter_dict"), hotel_ids)
+            # modify retriever for owners to focus on reviews
+            with metrics.span("vector_search"):
+                docs = self.get_retriever(**params).invoke(inputs["question"])
+        if RERANK_ENABLED:
+            with metrics.span("rerank"):
+                docs = self.reranker.rerank(inputs["question"], docs, k)
+        metrics.RETRIEVED_DOCS.observe(len(docs), role=role)
+        metrics.set_attribute("documents", len(docs))
+        return docs
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._init_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        return self._executor
+
+    def _lexical_backend(self) -> str:
+        if LEXICAL_BACKEND != "auto":
+            return LEXICAL_BACKEND
+        if self.db is not None and self.db.engine.dialect.name == "mysql":
+            return "fulltext"
+        return "bm25"
+
+    def _shared_index_version(self) -> int:
+        #read at most every LEXICAL_VERSION_CHECK_S, not on every query
+        checked_at, version = self._index_version_seen
+        if version is None or time.monotonic() - checked_at > LEXICAL_VERSION_CHECK_S:
+            version = self.cache.index_version()
+            self._index_version_seen = (time.monotonic(), version)
+        return version
+
+    def _read_bm25(self, source: str) -> BM25Index:
+        ids, documents, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = self.vector_store._collection.get(
+                where={"source": source}, include=["documents", "metadatas"],
+                limit=INDEX_BATCH_SIZE, offset=offset)
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            offset += len(page["ids"])
+        return BM25Index(ids, documents, metadatas)
+
+    def _bm25_index(self, source: str):
+        """BM25 over every chunk of `source` in the collection, or None until the first build
+        is done. Builds and rebuilds read the whole collection, so they run in the background
+        (started by warm_up or the first query) and never on the request thread. Our own flushes
+        keep the index current, writes from other workers trigger a rebuild that is swapped in
+        when done, queries use the previous index meanwhile."""
+        version = self._shared_index_version()
+        entry = self._bm25.get(source)
+        if entry is None or entry[0] < version:
+            self._rebuild_bm25(source, version)
+        return entry[1] if entry is not None else None
+
+    def _warm_bm25(self):
+        """Start the BM25 builds hybrid retrieval will need, so the first queries find them ready"""
+        if RETRIEVAL_MODE != "hybrid":
+            return
+        backend = self._lexical_backend()
+        for source in INDEX_SOURCES:
+            if not (source == "review" and backend == "fulltext"):
+                self._bm25_index(source)
+
+    def _rebuild_bm25(self, source: str, version: int):
+        with self._bm25_lock:
+            if source in self._bm25_building:
+                return
+            self._bm25_building.add(source)
+
+        def rebuild():
+            try:
+                index = self._read_bm25(source)
+                with self._bm25_lock:
+                    if self._bm25.get(source, (-1,))[0] < version:
+                        self._bm25[source] = (version, index)
+            except Exception as e:
+                logger.warning("BM25 rebuild for %s failed: %s", source, e)
+            finally:
+                with self._bm25_lock:
+                    self._bm25_building.discard(source)
+
+        threading.Thread(target=rebuild, name=f"bm25-{source}", daemon=True).start()
+
+    def _update_bm25(self, source: str, written: list, deleted: list):
+        """Apply one flush to the in-memory index, re-reading only the chunks just written"""
+        entry = self._bm25.get(source)
+        if entry is None:
+            return
+        index = entry[1]
+        index.remove(written + deleted)
+        if written:
+            found = self.vector_store._collection.get(where={"parent_id": {"$in": written}},
+                                                      include=["documents", "metadatas"])
+            index.add(found["ids"], found["documents"], found["metadatas"])
+
+    def _bm25_written(self):
+        """Tell other workers the collection moved on. Our indexes already hold the flush, they
+        stay current unless another worker wrote in between."""
+        version = self.cache.bump_index_version()
+        with self._bm25_lock:
+            for source, (seen, index) in list(self._bm25.items()):
+                if seen == version - 1:
+                    self._bm25[source] = (version, index)
+        self._index_version_seen = (time.monotonic(), version)
+
+    def _fulltext_review_docs(self, question: str, k: int, hotel_ids: list = None) -> list[Document]:
+        """Review chunks in the order MySQL's FULLTEXT index ranks their reviews"""
+        review_ids = fulltext_review_ids(self.db.session, question, k, hotel_ids)
+        if not review_ids:
+            return []
+        rank = {f"review_{review_id}": i for i, review_id in enumerate(review_ids)}
+        found = self.vector_store._collection.get(
+            where={"parent_id": {"$in": list(rank)}}, include=["documents", "metadatas"])
+        docs = [Document(page_content=text, metadata=metadata)
+                for text, metadata in zip(found["documents"], found["metadatas"])]
+        docs.sort(key=lambda doc: (rank[doc.metadata["parent_id"]], doc.metadata.get("chunk", 0)))
+        return docs[:k]
+
+    def _lexical_search(self, question: str, role: str, hotel_ids: list, k: int) -> list[list[Document]]:
+        """One ranked list per source the role may search"""
+        base = RETRIEVER_PARAMS[role].get("filter_dict") or {}
+        sources = [base["source"]] if "source" in base else list(INDEX_SOURCES)
+        where = build_filter(None, hotel_ids)
+        backend = self._lexical_backend()
+        results = []
+        for source in sources:
+            if source == "review" and backend == "fulltext":
+                results.append(self._fulltext_review_docs(question, k, hotel_ids))
+            else:
+                index = self._bm25_index(source)
+                if index is None:
+                    continue #first build still running, this source is served by vector search alone
+                results.append(index.search(question, k, where, min_match=LEXICAL_MIN_MATCH))
+        return results
+
+    def hybrid_search(self, question: str, role: str = "customer", hotel_ids: list = None, k: int = None):
+        """Vector and lexical search run in parallel, merged by reciprocal rank fusion and
+        cut to k (default: the role's k). Returns (docs, per-stage timings in seconds). Exact
+        terms like "airport shuttle" that embed poorly are ranked up through the lexical side,
+        but only for questions where vector search found something relevant at all."""
+        params = RETRIEVER_PARAMS[role]
+        k = k or params["k"]
+        pool = max(HYBRID_CANDIDATES, k)
+        timings = {}
+        start = time.perf_counter()
+
+        def vector_stage():
+            stage_start = time.perf_counter()
+            retriever = self.get_retriever(k=pool, score_threshold=params.get("score_threshold"),
+                                           filter_dict=build_filter(params.get("filter_dict"), hotel_ids))
+            docs = retriever.invoke(question)
+            timings["vector_s"] = time.perf_counter() - stage_start
+            return docs
+
+        vector_future = self.executor.submit(metrics.in_context(vector_stage))
+        #lexical search stays on this thread, it may need the request's database session
+        stage_start = time.perf_counter()
+        try:
+            lexical = self._lexical_search(question, role, hotel_ids, pool)
+        except Exception as e:
+            logger.warning("Lexical search failed, using vector results only: %s", e)
+            lexical = []
+        timings["lexical_s"] = time.perf_counter() - stage_start
+        vector_docs = vector_future.result()
+        stage_start = time.perf_counter()
+        #no chunk passed the similarity threshold: lexical overlap alone does not make the question answerable
+        docs = reciprocal_rank_fusion([vector_docs] + lexical)[:k] if vector_docs else []
+        timings["fusion_s"] = time.perf_counter() - stage_start
+        timings["total_s"] = time.perf_counter() - start
+        for stage in ("vector", "lexical", "fusion"):
+            metrics.record_stage(f"{stage}_search" if stage != "fusion" else stage, timings[f"{stage}_s"])
+        return docs, {stage: round(seconds, 4) for stage, seconds in timings.items()}
+
+    def _prepare_query(self, question: str, role: str, hotel_ids: list, read_your_writes: bool):
+        """Shared prelude of query_system and stream_query: (role, hotel_ids, cache key)"""
+        if role not in RETRIEVER_PARAMS:
+            role = "customer"
+        self.ensure_index()
+        if read_your_writes:
+            self.write_buffer.flush()
+        if hotel_ids is not None:
+            hotel_ids = sorted({int(hotel_id) for hotel_id in hotel_ids})
+        #owner answers also quote the hotels' review statistics, which change without the vector store changing
+        version = self.cache.scope_version(hotel_ids, with_stats=role == "property_owner")
+        cache_key = self.cache.make_key(question, role, dict(RETRIEVER_PARAMS[role], hotel_ids=hotel_ids, mode=RETRIEVAL_MODE, rerank=RERANK_ENABLED), version)
+        return role, hotel_ids, cache_key
+
+    def _semantic_get(self, question: str, role: str, hotel_ids: list):
+        """(lookup state for _semantic_set, answer of a close enough earlier question or None).
+        The question embedding is cached, so retrieval on a miss does not embed it again."""
+        if not SEMANTIC_CACHE_ENABLED:
+            return None, None
+        try:
+            vector = self.embeddings.embed_query(question)
+            with metrics.span("semantic_cache"):
+                version = self.cache.scope_version(hotel_ids, with_stats=role == "property_owner")
+                hit = self.semantic_cache.get(vector, role, hotel_ids, version)
+            metrics.CACHE_LOOKUPS.inc(cache="semantic", result="hit" if hit is not None else "miss")
+            return (vector, version), hit
         except Exception as e:
+            logger.warning("Semantic cache lookup failed: %s", e)
+            return None, None
+
+    def _cached_answer(self, question: str, role: str, hotel_ids: list, cache_key: str):
+        """(semantic cache state, cached answer or None): exact match first, then paraphrases"""
+        with metrics.span("answer_cache"):
+            cached = self.cache.get(cache_key)
+        metrics.CACHE_LOOKUPS.inc(cache="answer", result="hit" if cached is not None else "miss")
+        metrics.set_attribute("cache", "answer" if cached is not None else "miss")
+        if cached is not None:
+            return None, cached
+        semantic_state, cached = self._semantic_get(question, role, hotel_ids)
+        if cached is not None:
+            metrics.set_attribute("cache", "semantic")
+        return semantic_state, cached
+
+    def _semantic_set(self, state, role: str, hotel_ids: list, response: dict):
+        if state is not None:
+            self.semantic_cache.set(state[0], role, hotel_ids, state[1], response)
+
+    @staticmethod
+    def _sources(docs) -> list:
+        sources_metadata = []
+        if isinstance(docs, list):
+            #several chunks of the same FAQ/review show up as one source
+            for doc in docs:
+                source = { "source": doc.metadata.get("source", "unknown"), "db_id": doc.metadata.get("db_id", "N/A")}
+                if source not in sources_metadata:
+                    sources_metadata.append(source)
+        return sources_metadata
+
+    def query_system(self, question: str, role: str="customer", hotel_ids: list = None, read_your_writes: bool = False):
+        """Full RAG pipeline using LangChain Expression Language(LCEL)
+        to handle custom prompts based on user role and return sources.
+        hotel_ids limits retrieval to those hotels' FAQs and reviews (None searches every hotel).
+        read_your_writes flushes buffered vector store writes before answering."""
+        with metrics.trace("query"):
+            return self._query(question, role, hotel_ids, read_your_writes)
+
+    def _query(self, question: str, role: str, hotel_ids: list, read_your_writes: bool):
+        role, hotel_ids, cache_key = self._prepare_query(question, role, hotel_ids, read_your_writes)
+
+        #serve repeated (or paraphrased) questions straight from the answer caches
+        semantic_state, cached = self._cached_answer(question, role, hotel_ids, cache_key)
+        if cached is not None:
+            return cached
+
+        #Invoke the prebuilt chain
+        try:
+            result  =  self.chains[role].invoke({"question": question, "hotel_ids": hotel_ids})
+        except Exception as e:
+            logger.error("Query failed: %s", e, exc_info=True)
+            metrics.ERRORS.inc(operation="query")
             return {
                 "answer": "Sorry, an error occured while processing your request.",
                 "sources": []
             }
         #format and return the output.
-        answer = result.get("answer","Sorry, couldn't generate an answer")
-        sources_metadata = []
-        if "documents" in result and isinstance(result["documents"], list):
-            sources_metadata = [
-                { "source": doc.metadata.get("source", "unknown"), "db_id": doc.metadata.get("db_id", "N/A")}
-                for doc in result["documents"]
-            ]
-        return {
-            "answer" : answer,
-            "sources": sources_metadata
-        }
\ No newline at end of file
+        response = {
+            "answer" : result.get("answer","Sorry, couldn't generate an answer"),
+            "sources": self._sources(result.get("docs"))
+        }
+        self.cache.set(cache_key, response)
+        self._semantic_set(semantic_state, role, hotel_ids, response)
+        return response
+
+    async def aquery_system(self, question: str, role: str="customer", hotel_ids: list = None,
+                            timeout: float = QUERY_TIMEOUT_S):
+        """Async query_system built on the chains' ainvoke. Cache lookups, embedding and the
+        Chroma search run on a thread pool, generations are bounded by MAX_CONCURRENT_GENERATIONS
+        and the whole query is cancelled after `timeout` seconds."""
+        def prepare():
+            with self._app_context():
+                role_, hotel_ids_, cache_key = self._prepare_query(question, role, hotel_ids, False)
+                return (role_, hotel_ids_, cache_key) + self._cached_answer(question, role_, hotel_ids_, cache_key)
+
+        with metrics.trace("query"):
+            loop = asyncio.get_running_loop()
+            role, hotel_ids, cache_key, semantic_state, cached = await loop.run_in_executor(
+                self.query_executor, metrics.in_context(prepare))
+            if cached is not None:
+                return cached
+            return await self._agenerate_answer(question, role, hotel_ids, cache_key, semantic_state, timeout)
+
+    async def _agenerate_answer(self, question, role, hotel_ids, cache_key, semantic_state, timeout):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(
+                self.achains[role].ainvoke({"question": question, "hotel_ids": hotel_ids}), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Query timed out after %.1fs: %s", timeout, question[:80])
+            metrics.ERRORS.inc(operation="query_timeout")
+            return {
+                "answer": "Sorry, generating an answer took too long. Please try again.",
+                "sources": []
+            }
+        except Exception as e:
+            logger.error("Async query failed: %s", e, exc_info=True)
+            metrics.ERRORS.inc(operation="query")
+            return {
+                "answer": "Sorry, an error occured while processing your request.",
+                "sources": []
+            }
+        response = {
+            "answer" : result.get("answer","Sorry, couldn't generate an answer"),
+            "sources": self._sources(result.get("docs"))
+        }
+        await loop.run_in_executor(self.query_executor, self.cache.set, cache_key, response)
+        self._semantic_set(semantic_state, role, hotel_ids, response)
+        return response
+
+    def stream_query(self, question: str, role: str="customer", hotel_ids: list = None, read_your_writes: bool = False):
+        """Streaming variant of query_system built on the chain's .stream(). Yields
+        ("sources", [...]) as soon as retrieval is done, then ("token", text) pieces as the
+        LLM produces them (HuggingFacePipeline streams through a TextIteratorStreamer).
+        The full answer is cached once the stream completes, errors propagate to the caller."""
+        with metrics.trace("stream_query"):
+            role, hotel_ids, cache_key = self._prepare_query(question, role, hotel_ids, read_your_writes)
+            semantic_state, cached = self._cached_answer(question, role, hotel_ids, cache_key)
+            if cached is not None:
+                yield "sources", cached["sources"]
+                yield "token", cached["answer"]
+                return
+            sources, answer_parts = [], []
+            for chunk in self.chains[role].stream({"question": question, "hotel_ids": hotel_ids}):
+                if "docs" in chunk:
+                    sources = self._sources(chunk["docs"])
+                    yield "sources", sources
+                if chunk.get("answer"):
+                    answer_parts.append(chunk["answer"])
+                    yield "token", chunk["answer"]
+            response = {"answer": "".join(answer_parts), "sources": sources}
+            self.cache.set(cache_key, response)
+            self._semantic_set(semantic_state, role, hotel_ids, response)
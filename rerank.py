@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+LOAD_RETRY_S = 30.0 #wait after a failed background load before trying again
+
+
+class CrossEncoderReranker:
+    """Re-orders a retrieval candidate pool with a cross-encoder under a latency budget.
+
+    All (question, chunk) pairs are scored in one batch. The cost per pair is tracked
+    as a moving average, so before scoring the pool is shrunk to what fits in
+    `budget_ms`. When not even k candidates fit, or the model is not loaded yet,
+    re-ranking is skipped and the first-stage order is kept. A cold model is loaded
+    on a loader thread of its own instead of stalling the request, a failed load is
+    logged and retried after LOAD_RETRY_S.
+    """
+
+    def __init__(self, model_name: str, budget_ms: float, smoothing: float = 0.2):
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self.smoothing = smoothing
+        self._ms_per_pair = None
+        self._loading = False
+        self._retry_at = 0.0
+        self._load_error = None
+        self._lock = threading.Lock()
+        self._counters = {"reranked": 0, "skipped_budget": 0, "skipped_cold": 0, "load_failed": 0}
+        #a cold load can take minutes (download), keep it off the retrieval pool so it never holds a search worker
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker-load")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _model(self):
+        if registry.is_loaded(self.model_name):
+            return registry.get(self.model_name)
+        with self._lock:
+            if not self._loading and time.monotonic() >= self._retry_at:
+                self._loading = True
+                self._loader.submit(self.load)
+        return None
+
+    def load(self) -> bool:
+        """Load the model on the calling thread (warm-up, loader thread). A failure is logged
+        and counted instead of raised, re-ranking just stays off until a retry succeeds."""
+        try:
+            registry.get(self.model_name)
+        except Exception as error:
+            logger.error("Loading reranker %s failed, retrying in %.0fs: %s", self.model_name, LOAD_RETRY_S, error)
+            with self._lock:
+                self._loading = False
+                self._retry_at = time.monotonic() + LOAD_RETRY_S
+                self._load_error = f"{type(error).__name__}: {error}"
+                self._counters["load_failed"] += 1
+            return False
+        with self._lock:
+            self._loading = False
+            self._load_error = None
+        return True
+
+    def rerank(self, question: str, docs: list, k: int) -> list:
+        """Top k of `docs` by cross-encoder score, or the first k unchanged when skipped"""
+        if len(docs) <= 1:
+            return docs[:k]
+        model = self._model()
+        if model is None:
+            self._count("skipped_cold")
+            return docs[:k]
+        candidates = docs
+        if self._ms_per_pair:
+            fits = int(self.budget_ms / self._ms_per_pair)
+            if fits < min(k, len(docs)):
+                with self._lock:
+                    self._counters["skipped_budget"] += 1
+                    #decay the estimate so one slow batch does not disable re-ranking for good
+                    self._ms_per_pair *= 1 - self.smoothing
+                return docs[:k]
+            candidates = docs[:fits] #first-stage order decides who makes the cut
+        start = time.perf_counter()
+        scores = model.predict([(question, doc.page_content) for doc in candidates],
+                               batch_size=len(candidates), show_progress_bar=False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            observed = elapsed_ms / len(candidates)
+            self._ms_per_pair = observed if self._ms_per_pair is None else (
+                self.smoothing * observed + (1 - self.smoothing) * self._ms_per_pair)
+            self._counters["reranked"] += 1
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:k]]
+
+    def stats(self) -> dict:
+        """Re-rank counters plus the registry load stats and the last load error, if any"""
+        load = registry.stats().get(self.model_name, {})
+        with self._lock:
+            return dict(self._counters, **load, loaded=registry.is_loaded(self.model_name),
+                        load_error=self._load_error, budget_ms=self.budget_ms,
+                        ms_per_pair=round(self._ms_per_pair, 3) if self._ms_per_pair else None)
@@ -0,0 +1,223 @@
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import func, update
+
+from models import Hotel, HotelReviewStats, Review
+from review_themes import describe_themes, hotel_themes
+
+logger = logging.getLogger(__name__)
+
+#months of per-month buckets kept on each stats row, trends compare windows inside this range
+REVIEW_TREND_MONTHS = int(os.getenv("REVIEW_TREND_MONTHS", 24))
+TREND_WINDOW_MONTHS = int(os.getenv("REVIEW_TREND_WINDOW_MONTHS", 3))
+STATS_TOP_EMOTIONS = 3
+
+
+def month_key(when) -> str:
+    return (when or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+def _rating_key(rating) -> str:
+    return f"{float(rating):.1f}"
+
+def _bump(counts: dict, key, amount: int):
+    if key is None:
+        return
+    counts[key] = counts.get(key, 0) + amount
+    if counts[key] <= 0:
+        del counts[key]
+
+def _months_back(key: str, months: int) -> str:
+    year, month = map(int, key.split("-"))
+    month -= months
+    while month <= 0:
+        month += 12
+        year -= 1
+    return f"{year:04d}-{month:02d}"
+
+def _empty_month() -> dict:
+    return {"reviews": 0, "rating_sum": 0.0, "rating_count": 0, "positive": 0, "negative": 0, "neutral": 0}
+
+
+def _new_stats(hotel_id: int) -> HotelReviewStats:
+    return HotelReviewStats(hotel_id=hotel_id, review_count=0, rating_count=0, rating_sum=0.0,
+                            sentiment_counts={}, emotion_counts={}, rating_counts={}, monthly={})
+
+
+def record_review_labels(session, reviews, previous_labels):
+    """Fold freshly labelled reviews into their hotels' stats rows.
+
+    `reviews` are ORM objects or column rows with id, hotel_id, rating, created_at,
+    stats_counted plus the new sentiment/emotion, `previous_labels` the (sentiment, emotion)
+    each review had before. A review not counted yet is added whole and marked counted,
+    whatever labels it had before (those were never in the stats). For a counted review only
+    its label counts move from the previous labels to the new ones, so reprocessing a batch
+    never double counts. Returns the ids of the hotels touched. Commits the session."""
+    by_hotel = {}
+    for review, previous in zip(reviews, previous_labels):
+        by_hotel.setdefault(review.hotel_id, []).append((review, previous))
+    for hotel_id, items in by_hotel.items():
+        #row lock so concurrent workers serialise their read-modify-write of the JSON counters
+        stats = session.query(HotelReviewStats).filter_by(hotel_id=hotel_id).with_for_update().first()
+        if stats is None:
+            stats = _new_stats(hotel_id)
+            session.add(stats)
+        sentiments, emotions = dict(stats.sentiment_counts or {}), dict(stats.emotion_counts or {})
+        ratings = dict(stats.rating_counts or {})
+        monthly = {key: dict(value) for key, value in (stats.monthly or {}).items()}
+        for review, (old_sentiment, old_emotion) in items:
+            month = monthly.setdefault(month_key(review.created_at), _empty_month())
+            if not review.stats_counted:
+                stats.review_count += 1
+                month["reviews"] += 1
+                if review.rating is not None:
+                    stats.rating_count += 1
+                    stats.rating_sum += float(review.rating)
+                    month["rating_count"] += 1
+                    month["rating_sum"] += float(review.rating)
+                    _bump(ratings, _rating_key(review.rating), 1)
+            else:
+                _bump(sentiments, old_sentiment, -1)
+                _bump(emotions, old_emotion, -1)
+                if old_sentiment in month: #the month may have been trimmed since it was counted
+                    month[old_sentiment] = max(month[old_sentiment] - 1, 0)
+            _bump(sentiments, review.sentiment, 1)
+            _bump(emotions, review.emotion, 1)
+            if review.sentiment in month:
+                month[review.sentiment] += 1
+        oldest = _months_back(month_key(None), REVIEW_TREND_MONTHS - 1)
+        #new dict objects, in-place edits of a JSON column are not tracked
+        stats.sentiment_counts, stats.emotion_counts, stats.rating_counts = sentiments, emotions, ratings
+        stats.monthly = {key: value for key, value in monthly.items() if key >= oldest}
+        stats.updated_at = datetime.now(timezone.utc)
+    counted = [{"id": review.id, "stats_counted": True} for review in reviews if not review.stats_counted]
+    if counted:
+        session.execute(update(Review), counted)
+    session.commit()
+    return sorted(by_hotel)
+
+
+def rebuild_review_stats(session, hotel_ids=None) -> int:
+    """Recompute stats rows from the reviews table with GROUP BY queries, for a first fill
+    or after reviews were edited or deleted. Returns the number of hotels written."""
+    def grouped(*columns):
+        query = session.query(Review.hotel_id, *columns, func.count(Review.id)).filter(Review.sentiment.isnot(None))
+        if hotel_ids is not None:
+            query = query.filter(Review.hotel_id.in_(hotel_ids))
+        return query.group_by(Review.hotel_id, *columns).all()
+
+    rebuilt = {}
+    def stats_for(hotel_id):
+        if hotel_id not in rebuilt:
+            rebuilt[hotel_id] = _new_stats(hotel_id)
+        return rebuilt[hotel_id]
+
+    for hotel_id, sentiment, count in grouped(Review.sentiment):
+        stats = stats_for(hotel_id)
+        stats.review_count += count
+        stats.sentiment_counts[sentiment] = count
+    for hotel_id, emotion, count in grouped(Review.emotion):
+        if emotion is not None:
+            stats_for(hotel_id).emotion_counts[emotion] = count
+    for hotel_id, rating, count in grouped(Review.rating):
+        if rating is not None:
+            stats = stats_for(hotel_id)
+            stats.rating_counts[_rating_key(rating)] = count
+            stats.rating_count += count
+            stats.rating_sum += float(rating) * count
+    #per-month buckets, grouped in python since month extraction is dialect specific
+    oldest = _months_back(month_key(None), REVIEW_TREND_MONTHS - 1)
+    query = session.query(Review.hotel_id, Review.created_at, Review.rating, Review.sentiment).filter(
+        Review.sentiment.isnot(None))
+    if hotel_ids is not None:
+        query = query.filter(Review.hotel_id.in_(hotel_ids))
+    for row in query.yield_per(5000):
+        key = month_key(row.created_at)
+        if key < oldest:
+            continue
+        month = stats_for(row.hotel_id).monthly.setdefault(key, _empty_month())
+        month["reviews"] += 1
+        if row.sentiment in month:
+            month[row.sentiment] += 1
+        if row.rating is not None:
+            month["rating_count"] += 1
+            month["rating_sum"] += float(row.rating)
+
+    delete = session.query(HotelReviewStats)
+    if hotel_ids is not None:
+        delete = delete.filter(HotelReviewStats.hotel_id.in_(hotel_ids))
+    delete.delete(synchronize_session="fetch") #drops loaded rows from the identity map as well
+    for stats in rebuilt.values():
+        stats.updated_at = datetime.now(timezone.utc)
+        session.add(stats)
+    #exactly the labelled reviews are in the rebuilt stats, record_review_labels relies on the flag
+    counted = session.query(Review)
+    if hotel_ids is not None:
+        counted = counted.filter(Review.hotel_id.in_(hotel_ids))
+    counted.update({Review.stats_counted: Review.sentiment.isnot(None)}, synchronize_session=False)
+    session.commit()
+    logger.info("Rebuilt review stats for %d hotels", len(rebuilt))
+    return len(rebuilt)
+
+
+def _percentages(counts: dict, total: int, limit: int = None) -> str:
+    top = sorted(counts.items(), key=lambda item: -item[1])[:limit]
+    return ", ".join(f"{round(100 * count / total)}% {label}" for label, count in top)
+
+def _window(monthly: dict, newest: str, months: int) -> dict:
+    keys = {_months_back(newest, i) for i in range(months)}
+    window = _empty_month()
+    for key in keys & monthly.keys():
+        for field, value in monthly[key].items():
+            window[field] = window.get(field, 0) + value
+    return window
+
+def _describe_window(window: dict) -> str:
+    parts = [f"{window['reviews']} reviews"]
+    if window["rating_count"]:
+        parts.append(f"avg rating {window['rating_sum'] / window['rating_count']:.1f}")
+    if window["reviews"]:
+        parts.append(f"{round(100 * window['negative'] / window['reviews'])}% negative")
+    return ", ".join(parts)
+
+
+def summarize(stats: HotelReviewStats, hotel_name: str = None, now=None) -> str:
+    """A few sentences of review statistics for one hotel, small enough for the owner prompt"""
+    name = hotel_name or f"Hotel {stats.hotel_id}"
+    if not stats.review_count:
+        return f"{name}: no analysed reviews yet."
+    parts = [f"{name}: {stats.review_count} reviews"]
+    if stats.rating_count:
+        parts[0] += f", average rating {stats.rating_sum / stats.rating_count:.1f}/5"
+    parts.append("Sentiment: " + _percentages(stats.sentiment_counts, stats.review_count))
+    if stats.emotion_counts:
+        parts.append("Top emotions: " + _percentages(stats.emotion_counts, stats.review_count, STATS_TOP_EMOTIONS))
+    newest = month_key(now)
+    recent = _window(stats.monthly or {}, newest, TREND_WINDOW_MONTHS)
+    before = _window(stats.monthly or {}, _months_back(newest, TREND_WINDOW_MONTHS), TREND_WINDOW_MONTHS)
+    if recent["reviews"] or before["reviews"]:
+        parts.append(f"Last {TREND_WINDOW_MONTHS} months: {_describe_window(recent)} "
+                     f"(previous {TREND_WINDOW_MONTHS} months: {_describe_window(before)})")
+    return ". ".join(parts) + "."
+
+
+def owner_review_summary(session, hotel_ids) -> str:
+    """Statistics and clustered themes over every review of the given hotels, indexed lookups
+    per hotel whatever the review count"""
+    if not hotel_ids:
+        return ""
+    rows = (session.query(HotelReviewStats, Hotel.name)
+            .join(Hotel, Hotel.id == HotelReviewStats.hotel_id)
+            .filter(HotelReviewStats.hotel_id.in_(hotel_ids))
+            .order_by(HotelReviewStats.hotel_id)
+            .all())
+    if not rows:
+        return "No analysed reviews yet."
+    themes = hotel_themes(session, hotel_ids)
+    lines = []
+    for stats, name in rows:
+        summary = summarize(stats, name)
+        described = describe_themes(themes.get(stats.hotel_id, []))
+        lines.append(f"{summary} {described}." if described else summary)
+    return "\n".join(lines)
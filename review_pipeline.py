@@ -0,0 +1,285 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import update
+
+from models import db, Review
+from rag_handler import analyze_review
+from review_analytics import record_review_labels
+
+logger = logging.getLogger(__name__)
+
+REVIEW_QUEUE_BACKEND = os.getenv("REVIEW_QUEUE_BACKEND", "inprocess") #or "redis" for an out-of-process queue
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", 1))
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", 16))
+REVIEW_BATCH_WAIT = float(os.getenv("REVIEW_BATCH_WAIT", 0.5)) #seconds to wait for a batch to fill up
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_QUEUE_KEY = "travel_rag:review_queue"
+REDIS_RETRY_KEY = "travel_rag:review_retry" #sorted set, score is the time a retry becomes due
+REDIS_DEAD_LETTER_KEY = "travel_rag:review_dead_letter"
+#a failed batch is retried with exponential backoff, reviews still failing after the last attempt go to a dead-letter list
+REVIEW_MAX_ATTEMPTS = int(os.getenv("REVIEW_MAX_ATTEMPTS", 3))
+REVIEW_RETRY_BACKOFF = float(os.getenv("REVIEW_RETRY_BACKOFF", 2.0)) #seconds before the first retry, doubled per attempt
+DEAD_LETTER_LIMIT = 1000 #ids kept in memory for stats, the backfill command relabels them either way
+
+
+def retry_delay(attempt: int) -> float:
+    return REVIEW_RETRY_BACKOFF * 2 ** (attempt - 1)
+
+
+def process_review_batch(review_ids, rag):
+    """Run a batch of committed reviews through the classifiers together and write sentiment/emotion
+    back with one bulk UPDATE. The vector store already got the review from the commit hook
+    (labels are not part of the indexed document), the hotels' review stats are updated
+    incrementally. Needs an app context."""
+    reviews = Review.query.filter(Review.id.in_(review_ids)).order_by(Review.id).all()
+    if not reviews:
+        return 0
+    previous = [(review.sentiment, review.emotion) for review in reviews]
+    texts = [review.content for review in reviews]
+    sentiments, emotions = analyze_review(texts)
+    if None in sentiments or None in emotions:
+        #nothing written, the queue retries the batch and the reviews stay NULL meanwhile
+        raise RuntimeError(f"Classifiers failed for reviews {review_ids}")
+    #plain copies for the stats, the ORM objects expire on commit
+    labelled = [SimpleNamespace(id=review.id, hotel_id=review.hotel_id, rating=review.rating, created_at=review.created_at,
+                                stats_counted=review.stats_counted, sentiment=sentiment, emotion=emotion)
+                for review, sentiment, emotion in zip(reviews, sentiments, emotions)]
+    db.session.execute(update(Review), [
+        {"id": review.id, "sentiment": review.sentiment, "emotion": review.emotion} for review in labelled
+    ])
+    hotel_ids = record_review_labels(db.session, labelled, previous) #commits labels and stats together
+    rag.cache.bump_stats_version(hotel_ids) #owner answers quote these stats, nothing else changed
+    return len(reviews)
+
+
+def backfill_review_labels(chunk_size: int = 256, only_missing: bool = True):
+    """Classify existing reviews in keyset-paginated chunks and write sentiment/emotion back
+    with one bulk UPDATE per chunk, keeping the hotels' review stats in step. Yields the running
+    count after each chunk. Needs an app context."""
+    last_id = 0
+    done = 0
+    while True:
+        query = db.session.query(Review.id, Review.content, Review.hotel_id, Review.rating, Review.created_at,
+                                 Review.stats_counted, Review.sentiment, Review.emotion).filter(Review.id > last_id)
+        if only_missing:
+            query = query.filter((Review.sentiment.is_(None)) | (Review.emotion.is_(None)))
+        rows = query.order_by(Review.id).limit(chunk_size).all()
+        if not rows:
+            break
+        texts = [row.content for row in rows]
+        sentiments, emotions = analyze_review(texts)
+        #rows the classifiers failed on keep their labels, the next backfill picks them up again
+        results = [(row, sentiment, emotion) for row, sentiment, emotion in zip(rows, sentiments, emotions)
+                   if sentiment is not None and emotion is not None]
+        if len(results) < len(rows):
+            logger.warning("Classifiers failed for %d reviews, left unchanged", len(rows) - len(results))
+        if results:
+            db.session.execute(update(Review), [
+                {"id": row.id, "sentiment": sentiment, "emotion": emotion} for row, sentiment, emotion in results
+            ])
+            labelled = [SimpleNamespace(**dict(row._asdict(), sentiment=sentiment, emotion=emotion))
+                        for row, sentiment, emotion in results]
+            record_review_labels(db.session, labelled, [(row.sentiment, row.emotion) for row, _, _ in results])
+        last_id = rows[-1].id
+        done += len(results)
+        yield done
+
+
+class InProcessReviewQueue:
+    """Work queue plus worker thread pool living inside the web process.
+
+    submit_review only enqueues the review id after commit, workers drain the queue
+    in batches of up to `batch_size` ids (waiting at most `batch_wait` seconds for a
+    batch to fill) and hand them to process_review_batch. A failed batch is put back
+    after a backoff, up to REVIEW_MAX_ATTEMPTS tries, then its ids are dead-lettered
+    and reported by stats(). Reviews still queued or dead-lettered keep a NULL sentiment
+    and can be picked up by the backfill command.
+    """
+
+    def __init__(self, app, rag, workers: int = REVIEW_WORKERS, batch_size: int = REVIEW_BATCH_SIZE,
+                 batch_wait: float = REVIEW_BATCH_WAIT):
+        self.app = app
+        self.rag = rag
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._counters = {"processed": 0, "failed": 0, "retried": 0, "last_batch_s": 0.0}
+        self._dead_letter = []
+
+    def _ensure_started(self):
+        #threads start on first use so CLI commands and migrations never spin them up
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"review-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+
+    def enqueue(self, review_id: int, attempt: int = 1):
+        self._ensure_started()
+        self._queue.put((review_id, time.time(), attempt))
+
+    def _retry(self, batch):
+        """Put the reviews of a failed batch back after a backoff, dead-letter those out of attempts"""
+        by_attempt, dead = {}, []
+        for review_id, _, attempt in batch:
+            if attempt < REVIEW_MAX_ATTEMPTS:
+                by_attempt.setdefault(attempt + 1, []).append(review_id)
+            else:
+                dead.append(review_id)
+        with self._lock:
+            self._counters["retried"] += sum(len(ids) for ids in by_attempt.values())
+            self._dead_letter = (self._dead_letter + dead)[-DEAD_LETTER_LIMIT:]
+        if dead:
+            logger.error("Reviews %s failed %d times, left for the backfill command", dead, REVIEW_MAX_ATTEMPTS)
+        for attempt, ids in by_attempt.items():
+            timer = threading.Timer(retry_delay(attempt - 1), self._requeue, args=(ids, attempt))
+            timer.daemon = True
+            timer.start()
+
+    def _requeue(self, review_ids, attempt: int):
+        for review_id in review_ids:
+            self.enqueue(review_id, attempt)
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            review_ids = [review_id for review_id, _, _ in batch]
+            start = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    process_review_batch(review_ids, self.rag)
+                    with self._lock:
+                        self._counters["processed"] += len(review_ids)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Review batch %s failed: %s", review_ids, e, exc_info=True)
+                    with self._lock:
+                        self._counters["failed"] += len(review_ids)
+                    self._retry(batch)
+            with self._lock:
+                self._counters["last_batch_s"] = round(time.perf_counter() - start, 3)
+            for _ in batch:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        """Queue depth, lag (age of the oldest waiting review) and worker counters"""
+        with self._queue.mutex:
+            depth = len(self._queue.queue)
+            oldest = self._queue.queue[0][1] if depth else None
+        with self._lock:
+            counters = dict(self._counters)
+            dead_letter = list(self._dead_letter)
+        return dict(counters, backend="inprocess", depth=depth, dead_letter=len(dead_letter),
+                    dead_letter_ids=dead_letter[-20:],
+                    lag_s=round(time.time() - oldest, 3) if oldest else 0.0)
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stop accepting work and give the workers `timeout` seconds to drain the queue"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+
+class RedisReviewQueue:
+    """Out-of-process variant: ids go to a Redis list and `flask reviews worker` drains it.
+    Failed batches wait in a sorted set for their backoff, then go to a dead-letter list.
+    Requires the optional `redis` package."""
+
+    def __init__(self, app, rag, url: str = REDIS_URL, batch_size: int = REVIEW_BATCH_SIZE,
+                 batch_wait: float = REVIEW_BATCH_WAIT):
+        import redis
+        self.app = app
+        self.rag = rag
+        self.client = redis.Redis.from_url(url)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+    def enqueue(self, review_id: int, attempt: int = 1):
+        self.client.lpush(REDIS_QUEUE_KEY, json.dumps({"id": review_id, "enqueued_at": time.time(), "attempt": attempt}))
+
+    def stats(self) -> dict:
+        depth = self.client.llen(REDIS_QUEUE_KEY)
+        oldest = self.client.lindex(REDIS_QUEUE_KEY, -1)
+        lag = time.time() - json.loads(oldest)["enqueued_at"] if oldest else 0.0
+        return {"backend": "redis", "depth": depth, "lag_s": round(lag, 3),
+                "retrying": self.client.zcard(REDIS_RETRY_KEY), "dead_letter": self.client.llen(REDIS_DEAD_LETTER_KEY)}
+
+    def _promote_due_retries(self):
+        #retries wait in a sorted set until their backoff is over, then rejoin the queue
+        for raw in self.client.zrangebyscore(REDIS_RETRY_KEY, 0, time.time()):
+            if self.client.zrem(REDIS_RETRY_KEY, raw): #only the worker that removed it requeues it
+                self.client.lpush(REDIS_QUEUE_KEY, raw)
+
+    def _retry(self, items):
+        for item in items:
+            attempt = item.get("attempt", 1)
+            if attempt >= REVIEW_MAX_ATTEMPTS:
+                self.client.lpush(REDIS_DEAD_LETTER_KEY, json.dumps(dict(item, failed_at=time.time())))
+                logger.error("Review %s failed %d times, moved to the dead-letter list", item["id"], attempt)
+            else:
+                retry = dict(item, attempt=attempt + 1, enqueued_at=time.time())
+                self.client.zadd(REDIS_RETRY_KEY, {json.dumps(retry): time.time() + retry_delay(attempt)})
+
+    def run_worker(self):
+        """Blocking worker loop, batches up to batch_size ids per pass"""
+        while True:
+            self._promote_due_retries()
+            item = self.client.brpop(REDIS_QUEUE_KEY, timeout=5)
+            if item is None:
+                continue
+            items = [json.loads(item[1])]
+            deadline = time.time() + self.batch_wait
+            while len(items) < self.batch_size and time.time() < deadline:
+                raw = self.client.rpop(REDIS_QUEUE_KEY)
+                if raw is None:
+                    time.sleep(0.05)
+                    continue
+                items.append(json.loads(raw))
+            batch = [item["id"] for item in items]
+            with self.app.app_context():
+                try:
+                    process_review_batch(batch, self.rag)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error("Review batch %s failed: %s", batch, e, exc_info=True)
+                    self._retry(items)
+
+
+def create_review_queue(app, rag):
+    if REVIEW_QUEUE_BACKEND == "redis":
+        return RedisReviewQueue(app, rag)
+    return InProcessReviewQueue(app, rag)
@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import os
+import time
+from collections import Counter
+from itertools import groupby
+from datetime import datetime, timezone
+
+import numpy as np
+
+import metrics
+from lexical import STOPWORDS as LEXICAL_STOPWORDS, tokenize
+from models import HotelReviewTheme, HotelThemeRun, Review
+
+logger = logging.getLogger(__name__)
+
+THEME_MIN_REVIEWS = int(os.getenv("THEME_MIN_REVIEWS", 20)) #hotels with fewer reviews get no themes
+THEME_MAX_CLUSTERS = int(os.getenv("THEME_MAX_CLUSTERS", 8))
+THEME_MIN_SIZE = int(os.getenv("THEME_MIN_SIZE", 3)) #smaller clusters are outliers, not stored
+THEME_REDUCE_DIMS = int(os.getenv("THEME_REDUCE_DIMS", 32)) #PCA target before k-means, 0 keeps the full vectors
+THEME_KMEANS_RESTARTS = 3
+THEME_SILHOUETTE_SAMPLE = 1000 #reviews scored per candidate k, the pairwise distances grow quadratically
+THEME_MERGE_SIMILARITY = float(os.getenv("THEME_MERGE_SIMILARITY", 0.9)) #cosine of centroids above which two themes are one
+THEME_ALGORITHM = os.getenv("THEME_ALGORITHM", "kmeans") #or "hdbscan", needs scikit-learn
+THEME_TOP_TERMS = 5
+THEME_EXAMPLES = 5
+OWNER_THEMES = int(os.getenv("OWNER_THEMES", 4)) #themes per hotel quoted in the owner prompt
+PAGE_SIZE = 1000
+
+STOPWORDS = LEXICAL_STOPWORDS | frozenset("hotel stay stayed room rooms review one two went".split())
+
+
+def review_vectors(collection, hotel_id: int):
+    """(review ids, review texts, one row per review) for a hotel's indexed reviews. Reviews
+    split into several chunks get the normalised mean of their chunk vectors."""
+    chunks = {}
+    offset = 0
+    while True:
+        page = collection.get(where={"$and": [{"source": "review"}, {"hotel_id": hotel_id}]},
+                              include=["embeddings", "documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        for vector, text, metadata in zip(page["embeddings"], page["documents"], page["metadatas"]):
+            chunks.setdefault(metadata["db_id"], []).append((metadata.get("chunk", 0), text, vector))
+        offset += len(page["ids"])
+    review_ids = sorted(chunks)
+    if not review_ids:
+        return [], [], np.empty((0, 0), dtype=np.float32)
+    texts, rows = [], []
+    for review_id in review_ids:
+        parts = sorted(chunks[review_id], key=lambda part: part[0])
+        texts.append(" ".join(text for _, text, _ in parts))
+        rows.append(np.mean([vector for _, _, vector in parts], axis=0))
+    matrix = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return review_ids, texts, matrix / np.where(norms > 0, norms, 1.0)
+
+
+def reduce_dimensions(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """PCA onto the top `dims` components, through the d x d covariance so cost grows linearly with reviews"""
+    if not dims or matrix.shape[1] <= dims or len(matrix) <= dims:
+        return matrix
+    centered = matrix - matrix.mean(axis=0)
+    _, vectors = np.linalg.eigh(centered.T @ centered)
+    return centered @ vectors[:, ::-1][:, :dims] #eigh sorts ascending
+
+
+def kmeans(matrix: np.ndarray, k: int, iterations: int = 50, seed: int = 0):
+    """Lloyd's k-means with k-means++ seeding, every step a matrix op over all points.
+    Returns (labels, centroids, squared distance of each point to its centroid)."""
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    centroids = np.empty((k, matrix.shape[1]), dtype=matrix.dtype)
+    centroids[0] = matrix[rng.integers(n)]
+    closest = ((matrix - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        centroids[i] = matrix[rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)]
+        closest = np.minimum(closest, ((matrix - centroids[i]) ** 2).sum(axis=1))
+    squared = (matrix ** 2).sum(axis=1)
+
+    def distances():
+        #|x - c|^2 = |x|^2 - 2x.c + |c|^2 for all pairs at once
+        return np.maximum(squared[:, None] - 2 * matrix @ centroids.T + (centroids ** 2).sum(axis=1), 0)
+
+    labels = None
+    for _ in range(iterations):
+        current = distances()
+        assigned = current.argmin(axis=1)
+        if labels is not None and np.array_equal(assigned, labels):
+            break
+        labels = assigned
+        onehot = np.zeros((n, k), dtype=matrix.dtype)
+        onehot[np.arange(n), labels] = 1
+        counts = onehot.sum(axis=0)
+        empty = counts == 0
+        centroids[~empty] = (onehot.T @ matrix)[~empty] / counts[~empty, None]
+        if empty.any(): #restart empty clusters on the points furthest from their centroid
+            furthest = current[np.arange(n), labels].argsort()[::-1][:int(empty.sum())]
+            centroids[empty] = matrix[furthest]
+    current = distances()
+    labels = current.argmin(axis=1)
+    return labels, centroids, current[np.arange(n), labels]
+
+
+def silhouette(matrix: np.ndarray, labels: np.ndarray) -> float:
+    """Mean silhouette coefficient, (b - a) / max(a, b) per point with a the mean distance to its
+    own cluster and b to the nearest other one. Close to 1 for well separated clusters, around 0
+    when clusters are cut out of one blob. Points alone in their cluster score 0."""
+    ids, labels = np.unique(labels, return_inverse=True)
+    if len(ids) < 2:
+        return 0.0
+    squared = (matrix ** 2).sum(axis=1)
+    pairwise = np.sqrt(np.maximum(squared[:, None] - 2 * matrix @ matrix.T + squared, 0))
+    onehot = np.zeros((len(matrix), len(ids)), dtype=matrix.dtype)
+    onehot[np.arange(len(matrix)), labels] = 1
+    counts = onehot.sum(axis=0)
+    sums = pairwise @ onehot #summed distance of every point to every cluster
+    own = np.arange(len(matrix)), labels
+    a = sums[own] / np.maximum(counts[labels] - 1, 1)
+    means = sums / counts
+    means[own] = np.inf
+    b = means.min(axis=1)
+    scores = np.where(counts[labels] > 1, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0.0)
+    return float(scores.mean())
+
+
+def kmeans_themes(matrix: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Labels of the best k-means clustering for k = 2..THEME_MAX_CLUSTERS, each k the best of a
+    few restarts by inertia, k picked by silhouette on a sample of the reviews"""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(matrix), min(len(matrix), THEME_SILHOUETTE_SAMPLE), replace=False)
+    best_labels, best_score = np.zeros(len(matrix), dtype=int), -np.inf
+    for k in range(2, min(THEME_MAX_CLUSTERS, len(matrix) - 1) + 1):
+        labels, _, _ = min((kmeans(matrix, k, seed=seed + restart) for restart in range(THEME_KMEANS_RESTARTS)),
+                           key=lambda result: result[2].sum())
+        score = silhouette(matrix[sample], labels[sample])
+        if score > best_score:
+            best_labels, best_score = labels, score
+    return best_labels
+
+
+def hdbscan_themes(matrix: np.ndarray) -> np.ndarray:
+    """HDBSCAN labels (-1 for noise), it finds the number of themes itself and leaves reviews
+    that fit none out. Falls back to kmeans_themes without scikit-learn."""
+    try:
+        from sklearn.cluster import HDBSCAN
+    except ImportError:
+        logger.warning("THEME_ALGORITHM=hdbscan needs scikit-learn >= 1.3, clustering with k-means")
+        return kmeans_themes(matrix)
+    return HDBSCAN(min_cluster_size=max(THEME_MIN_SIZE, 2), copy=True).fit_predict(matrix)
+
+
+def merge_similar(matrix: np.ndarray, labels: np.ndarray, texts: list[str], threshold: float = THEME_MERGE_SIMILARITY) -> np.ndarray:
+    """Merge clusters that describe the same theme: centroid cosine similarity of at least
+    `threshold` on the normalised review vectors, or the same three top terms. Most similar
+    pair first, until no pair qualifies. Noise (-1) is left alone."""
+    labels = labels.copy()
+    while True:
+        ids = [cluster for cluster in np.unique(labels) if cluster >= 0]
+        if len(ids) < 2:
+            return labels
+        centroids = np.stack([matrix[labels == cluster].mean(axis=0) for cluster in ids])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        similarity = centroids @ centroids.T
+        np.fill_diagonal(similarity, -1)
+        i, j = np.unravel_index(similarity.argmax(), similarity.shape)
+        if similarity[i, j] < threshold:
+            terms = [frozenset(cluster_terms) for cluster_terms in top_terms(
+                [[texts[index] for index in np.flatnonzero(labels == cluster)] for cluster in ids], limit=3)]
+            same = [(i, j) for i in range(len(ids)) for j in range(i + 1, len(ids)) if terms[i] and terms[i] == terms[j]]
+            if not same:
+                return labels
+            i, j = same[0]
+        labels[labels == ids[j]] = ids[i]
+
+
+def top_terms(cluster_texts: list[list[str]], limit: int = THEME_TOP_TERMS) -> list[list[str]]:
+    """Most distinctive terms per cluster, class-based TF-IDF over the number of reviews using
+    each term, so a word every cluster shares ("staff", "great") ranks below one that sets it apart"""
+    frequencies = []
+    for texts in cluster_texts:
+        counts = Counter()
+        for text in texts:
+            counts.update({token for token in tokenize(text)
+                           if len(token) > 2 and not token.isdigit() and token not in STOPWORDS})
+        frequencies.append(counts)
+    overall = Counter()
+    for counts in frequencies:
+        overall.update(counts)
+    average = sum(len(texts) for texts in cluster_texts) / max(len(cluster_texts), 1)
+    terms = []
+    for texts, counts in zip(cluster_texts, frequencies):
+        scores = {term: count / len(texts) * np.log(1 + average / overall[term])
+                  for term, count in counts.items() if count > 1 or len(texts) < 4}
+        terms.append(sorted(scores, key=lambda term: (-scores[term], term))[:limit])
+    return terms
+
+
+def llm_labels(examples: list[list[str]]) -> list[str]:
+    """A short flan-t5 topic per cluster from its most central reviews, one batched generate
+    call per hotel. Falls back to the term label (None) where the answer is empty."""
+    from model_registry import registry
+    from generation_batcher import generate_batch
+    prompts = ["What topic do these hotel reviews have in common? Answer with a few words.\n\n"
+               + "\n".join(f"- {text[:300]}" for text in texts) for texts in examples]
+    answers = generate_batch(registry.get("llm"), prompts, {"max_new_tokens": 12})
+    return [answer.strip()[:200] or None for answer in answers]
+
+
+def cluster_hotel(session, collection, hotel_id: int, label_fn=None) -> list[HotelReviewTheme]:
+    """Cluster one hotel's review vectors into themes, largest first. `label_fn(examples)` may
+    name the clusters (see llm_labels), by default a theme is labelled with its top terms."""
+    review_ids, texts, matrix = review_vectors(collection, hotel_id)
+    if len(review_ids) < THEME_MIN_REVIEWS:
+        return []
+    with metrics.span("cluster", operation="themes"):
+        reduced = reduce_dimensions(matrix, THEME_REDUCE_DIMS)
+        labels = hdbscan_themes(reduced) if THEME_ALGORITHM == "hdbscan" else kmeans_themes(reduced)
+        labels = merge_similar(matrix, labels, texts)
+    clusters = [np.flatnonzero(labels == cluster) for cluster in np.unique(labels) if cluster >= 0]
+    clusters = sorted((members for members in clusters if len(members) >= THEME_MIN_SIZE), key=len, reverse=True)
+    if not clusters:
+        return []
+    terms = top_terms([[texts[i] for i in members] for members in clusters])
+    #most central reviews by cosine to the cluster's mean vector
+    central = [members[np.argsort(-(matrix[members] @ matrix[members].mean(axis=0)))][:THEME_EXAMPLES] for members in clusters]
+    names = label_fn([[texts[i] for i in members] for members in central]) if label_fn else [None] * len(clusters)
+
+    rows = session.query(Review.id, Review.sentiment, Review.rating).filter(Review.id.in_(review_ids)).all()
+    labelled = {row.id: row for row in rows}
+    themes = []
+    for rank, (members, cluster_terms, examples, name) in enumerate(zip(clusters, terms, central, names)):
+        sentiments, ratings = Counter(), []
+        for i in members:
+            row = labelled.get(review_ids[i])
+            if row is not None and row.sentiment:
+                sentiments[row.sentiment] += 1
+            if row is not None and row.rating is not None:
+                ratings.append(float(row.rating))
+        themes.append(HotelReviewTheme(
+            hotel_id=hotel_id, rank=rank, label=name or ", ".join(cluster_terms[:3]) or f"theme {rank + 1}",
+            terms=cluster_terms, review_count=len(members), share=round(len(members) / len(review_ids), 4),
+            sentiment_counts=dict(sentiments), avg_rating=round(sum(ratings) / len(ratings), 2) if ratings else None,
+            example_review_ids=[review_ids[i] for i in examples]))
+    return themes
+
+
+def review_fingerprints(session, hotel_ids=None) -> dict:
+    """hotel id -> (review count, newest review id, sha256 over every review's id and embedding
+    hash), one ordered pass over two narrow columns. The embedding hash changes when an edited
+    review is re-indexed, so edits change the fingerprint along with new and deleted reviews."""
+    query = session.query(Review.hotel_id, Review.id, Review.embedding_hash)
+    if hotel_ids is not None:
+        query = query.filter(Review.hotel_id.in_(hotel_ids))
+    fingerprints = {}
+    rows = query.order_by(Review.hotel_id, Review.id).yield_per(5000)
+    for hotel_id, reviews in groupby(rows, key=lambda row: row.hotel_id):
+        digest, count, max_id = hashlib.sha256(), 0, None
+        for review in reviews:
+            digest.update(f"{review.id}:{review.embedding_hash}\n".encode("utf-8"))
+            count, max_id = count + 1, review.id
+        fingerprints[hotel_id] = (count, max_id, digest.hexdigest())
+    return fingerprints
+
+
+def stale_hotels(session, hotel_ids=None, force: bool = False) -> list[tuple]:
+    """(hotel id, review count, newest review id, content hash) of hotels whose reviews were
+    added, edited or deleted since their last clustering run"""
+    runs = {run.hotel_id: (run.review_count, run.max_review_id, run.content_hash) for run in session.query(HotelThemeRun)}
+    return [(hotel_id,) + fingerprint for hotel_id, fingerprint in review_fingerprints(session, hotel_ids).items()
+            if force or runs.get(hotel_id) != fingerprint]
+
+
+def refresh_themes(session, collection, hotel_ids=None, force: bool = False, label_fn=None) -> list[int]:
+    """Re-cluster hotels with new, edited or deleted reviews since the last run (all of
+    `hotel_ids` with force) and replace their theme rows. Commits per hotel, so an interrupted
+    run resumes where it stopped. Returns the ids of the hotels re-clustered."""
+    refreshed = []
+    for hotel_id, count, max_id, reviews_hash in stale_hotels(session, hotel_ids, force):
+        start = time.perf_counter()
+        themes = cluster_hotel(session, collection, hotel_id, label_fn)
+        session.query(HotelReviewTheme).filter_by(hotel_id=hotel_id).delete(synchronize_session="fetch") #drops replaced rows from the identity map
+        session.add_all(themes)
+        session.merge(HotelThemeRun(hotel_id=hotel_id, review_count=count, max_review_id=max_id,
+                                    content_hash=reviews_hash, clustered_at=datetime.now(timezone.utc)))
+        session.commit()
+        refreshed.append(hotel_id)
+        logger.info("Hotel %s: %d reviews -> %d themes in %.2fs", hotel_id, count, len(themes), time.perf_counter() - start)
+    return refreshed
+
+
+def hotel_themes(session, hotel_ids) -> dict:
+    """hotel id -> its stored themes, largest first"""
+    themes = {}
+    rows = (session.query(HotelReviewTheme).filter(HotelReviewTheme.hotel_id.in_(hotel_ids))
+            .order_by(HotelReviewTheme.hotel_id, HotelReviewTheme.rank).all())
+    for theme in rows:
+        themes.setdefault(theme.hotel_id, []).append(theme)
+    return themes
+
+
+def describe_themes(themes, limit: int = OWNER_THEMES) -> str:
+    """One line for the owner prompt, e.g. "Themes: breakfast, buffet, coffee (31% of reviews, 60% negative); ..." """
+    parts = []
+    for theme in themes[:limit]:
+        detail = f"{round(100 * theme.share)}% of reviews"
+        labelled = sum(theme.sentiment_counts.values())
+        if labelled:
+            detail += f", {round(100 * theme.sentiment_counts.get('negative', 0) / labelled)}% negative"
+        parts.append(f"{theme.label} ({detail})")
+    return "Themes: " + "; ".join(parts) if parts else ""
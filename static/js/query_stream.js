@@ -0,0 +1,86 @@
+// Streams AI assistant answers into the query modal over Server-Sent Events.
+// Without fetch streaming support, or if the stream fails before anything arrived,
+// the form is submitted normally and the answer page renders as before.
+(function () {
+    const form = document.getElementById('queryForm');
+    if (!form || !window.fetch || !window.ReadableStream || !window.TextDecoder) {
+        return;
+    }
+    const result = document.getElementById('queryStreamResult');
+    const answer = document.getElementById('queryStreamAnswer');
+    const sourceList = document.getElementById('queryStreamSources');
+    const submitButton = form.querySelector('button[type="submit"]');
+
+    function showSources(sources) {
+        sourceList.innerHTML = '';
+        sources.forEach(function (src) {
+            const item = document.createElement('li');
+            item.className = 'list-group-item';
+            item.textContent = 'Source Type: ' + src.source.charAt(0).toUpperCase() + src.source.slice(1);
+            sourceList.appendChild(item);
+        });
+    }
+
+    function handleEvent(block, state) {
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach(function (line) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            else if (line.startsWith('data: ')) data += line.slice(6);
+        });
+        if (!data) return;
+        const payload = JSON.parse(data);
+        if (event === 'sources') {
+            showSources(payload);
+        } else if (event === 'token') {
+            answer.textContent += payload;
+            state.received = true;
+        } else if (event === 'error') {
+            answer.textContent = payload;
+            state.received = true;
+        } else if (event === 'done') {
+            state.timings = payload;
+        }
+    }
+
+    form.addEventListener('submit', async function (e) {
+        e.preventDefault();
+        const state = { received: false, timings: null };
+        const started = performance.now();
+        answer.textContent = '';
+        sourceList.innerHTML = '';
+        result.classList.remove('d-none');
+        submitButton.disabled = true;
+        try {
+            const response = await fetch(form.dataset.streamUrl, {
+                method: 'POST',
+                body: new FormData(form),
+                headers: { 'X-CSRFToken': form.dataset.csrfToken, 'Accept': 'text/event-stream' },
+            });
+            if (!response.ok || !response.body) throw new Error('stream unavailable: ' + response.status);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let firstByteMs = null;
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                if (firstByteMs === null) firstByteMs = performance.now() - started;
+                buffer += decoder.decode(value, { stream: true });
+                const blocks = buffer.split('\n\n');
+                buffer = blocks.pop();
+                blocks.forEach(function (block) { handleEvent(block, state); });
+            }
+            console.debug('query stream: first byte ' + Math.round(firstByteMs) + ' ms, total ' +
+                Math.round(performance.now() - started) + ' ms', state.timings);
+        } catch (err) {
+            if (!state.received) {
+                form.submit(); // fall back to the regular form post
+                return;
+            }
+            answer.textContent += '\n[connection lost]';
+        } finally {
+            submitButton.disabled = false;
+        }
+    });
+})();
@@ -0,0 +1,42 @@
+import os
+import sys
+import uuid
+
+import pytest
+from flask import Flask
+
+#the modules live flat in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def session(tmp_path):
+    """SQLAlchemy session on a fresh SQLite database. A file rather than :memory:, sessions
+    must get connections of their own as they would on MySQL."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def embeddings():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=16)
+
+
+@pytest.fixture
+def vector_store(embeddings):
+    """In-memory Chroma collection of its own"""
+    from langchain_chroma import Chroma
+    store = Chroma(collection_name=f"test_{uuid.uuid4().hex}", embedding_function=embeddings)
+    yield store
+    store.delete_collection()
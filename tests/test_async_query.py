@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rag_handler
+from rag_handler import RAGSystem
+
+
+class Core:
+    """Stands in for a role's generation chain, counts how many run at once"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def invoke(self, inputs):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        return inputs["question"].upper()
+
+
+@pytest.fixture
+def rag():
+    #only the parts _agenerate touches, a full RAGSystem needs models and a vector store
+    rag = RAGSystem.__new__(RAGSystem)
+    rag._generation_slots = threading.BoundedSemaphore(2)
+    rag._slot_waiters = ThreadPoolExecutor(max_workers=8)
+    rag._query_executor = ThreadPoolExecutor(max_workers=8)
+    yield rag
+    rag._slot_waiters.shutdown(wait=False)
+    rag._query_executor.shutdown(wait=False)
+
+
+def free_slots(rag):
+    return rag._generation_slots._value
+
+
+def test_generations_are_capped_at_the_slot_count(rag):
+    core = Core()
+
+    async def run():
+        tasks = [asyncio.ensure_future(rag._agenerate({"question": f"q{i}"}, core)) for i in range(5)]
+        await asyncio.sleep(0.2)
+        assert core.running == 2
+        core.release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [f"Q{i}" for i in range(5)]
+    assert core.peak == 2
+    time.sleep(0.05) #slots are released by the generation threads' done callbacks
+    assert free_slots(rag) == 2
+
+
+def test_cancelled_waiter_does_not_keep_a_slot(rag):
+    core = Core()
+
+    async def run():
+        holders = [asyncio.ensure_future(rag._agenerate({"question": f"q{i}"}, core)) for i in range(2)]
+        await asyncio.sleep(0.1)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(rag._agenerate({"question": "late"}, core), 0.1)
+        core.release.set()
+        await asyncio.gather(*holders)
+
+    asyncio.run(run())
+    time.sleep(0.1)
+    assert free_slots(rag) == 2 and core.peak == 2
+
+
+def test_gives_up_when_no_slot_frees_up(rag, monkeypatch):
+    monkeypatch.setattr(rag_handler, "QUERY_TIMEOUT_S", 0.1)
+    rag._generation_slots.acquire()
+    rag._generation_slots.acquire()
+    with pytest.raises(TimeoutError):
+        asyncio.run(rag._agenerate({"question": "q"}, Core()))
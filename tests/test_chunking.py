@@ -0,0 +1,57 @@
+import re
+
+from langchain_core.documents import Document
+
+from chunking import NO_CONTEXT, chunk_text, count_tokens, pack_context, truncate_to_tokens
+
+
+def tokenizer(text, add_special_tokens=False, return_offsets_mapping=False):
+    """Stands in for a HF tokenizer, one token per word"""
+    offsets = [match.span() for match in re.finditer(r"\S+", text)]
+    encoded = {"input_ids": list(range(len(offsets)))}
+    if return_offsets_mapping:
+        encoded["offset_mapping"] = offsets
+    return encoded
+
+
+def words(n, start=0):
+    return " ".join(f"w{i}" for i in range(start, start + n))
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("a b c", tokenizer, chunk_size=5, overlap=2) == ["a b c"]
+
+
+def test_windows_overlap_and_cover_the_text():
+    chunks = chunk_text(words(10), tokenizer, chunk_size=4, overlap=1)
+    assert chunks == [words(4), words(4, 3), words(4, 6)]
+    assert all(count_tokens(chunk, tokenizer) <= 4 for chunk in chunks)
+
+
+def test_chunks_are_slices_of_the_original_text():
+    text = "Pool  opens\nat eight,   closes at ten."
+    for chunk in chunk_text(text, tokenizer, chunk_size=3, overlap=1):
+        assert chunk in text
+
+
+def test_truncate_cuts_at_a_token_boundary():
+    assert truncate_to_tokens(words(5), tokenizer, 2) == "w0 w1"
+    assert truncate_to_tokens(words(5), tokenizer, 0) == ""
+    assert truncate_to_tokens(words(2), tokenizer, 5) == words(2)
+
+
+def test_pack_context_keeps_rank_order_within_budget():
+    docs = [Document(page_content=words(3)), Document(page_content=words(3, 10)), Document(page_content=words(3, 20))]
+    #3 tokens + 2 for the separator + 3: the third doc does not fit and too little is left for a partial
+    assert pack_context(docs, prompt_overhead=2, tokenizer=tokenizer, max_tokens=12, min_partial_tokens=4) == \
+        words(3) + "\n\n" + words(3, 10)
+
+
+def test_pack_context_skips_duplicates_and_cuts_the_last_doc():
+    docs = [Document(page_content=words(3)), Document(page_content=words(3)), Document(page_content=words(20, 10))]
+    packed = pack_context(docs, prompt_overhead=0, tokenizer=tokenizer, max_tokens=10, min_partial_tokens=2)
+    assert packed == words(3) + "\n\n" + words(5, 10)
+
+
+def test_pack_context_without_docs():
+    assert pack_context([], 0, tokenizer, 100) == NO_CONTEXT
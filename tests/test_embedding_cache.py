@@ -0,0 +1,111 @@
+import sqlite3
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import rag_cache
+from rag_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    """Embeds a text as [len(text), 1.0] and records every batch it is asked for"""
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        self.now += 1 #every call is later than the last, so LRU order is well defined
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rag_cache, "time", clock)
+    return clock
+
+
+def disk_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+
+def test_only_misses_reach_the_model_in_one_batch():
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "fake")
+    cache.embed_documents(["a", "bb"])
+    assert cache.embed_documents(["bb", "ccc", "ccc", "a"]) == [[2.0, 1.0], [3.0, 1.0], [3.0, 1.0], [1.0, 1.0]]
+    assert inner.batches == [["a", "bb"], ["ccc"]]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 4 #a repeated miss counts twice, embeds once
+
+
+def test_whitespace_variants_share_an_entry():
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "fake")
+    cache.embed_documents(["free  parking\n"])
+    cache.embed_documents(["free parking"])
+    assert len(inner.batches) == 1
+
+
+def test_memory_is_an_lru():
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "fake", max_memory_entries=2)
+    cache.embed_documents(["a", "bb"])
+    cache.embed_documents(["a"]) #"bb" is now least recently used
+    cache.embed_documents(["ccc"])
+    assert cache.stats()["memory_entries"] == 2
+    cache.embed_documents(["a"])
+    cache.embed_documents(["bb"])
+    assert inner.batches[-1] == ["bb"]
+
+
+def test_documents_persist_across_instances(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    CachedEmbeddings(CountingEmbeddings(), "fake", path).embed_documents(["a", "bb"])
+    inner = CountingEmbeddings()
+    assert CachedEmbeddings(inner, "fake", path).embed_documents(["bb", "a"]) == [[2.0, 1.0], [1.0, 1.0]]
+    assert inner.batches == []
+    #vectors of another model are never reused
+    other = CountingEmbeddings()
+    CachedEmbeddings(other, "other", path).embed_documents(["a"])
+    assert other.batches == [["a"]]
+
+
+def test_questions_stay_in_memory(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "fake", path)
+    cache.embed_query("is there parking?")
+    cache.embed_query("is there parking?")
+    assert len(inner.batches) == 1
+    assert disk_rows(path) == 0
+    #but a question matching a stored document reuses its vector
+    cache.embed_documents(["pool hours"])
+    fresh = CountingEmbeddings()
+    CachedEmbeddings(fresh, "fake", path).embed_query("pool hours")
+    assert fresh.batches == []
+
+
+def test_disk_is_trimmed_least_recently_used_first(tmp_path, clock):
+    path = str(tmp_path / "embeddings.db")
+    CachedEmbeddings(CountingEmbeddings(), "fake", path, max_disk_entries=2).embed_documents(["a"])
+    cache = CachedEmbeddings(CountingEmbeddings(), "fake", path, max_memory_entries=1, max_disk_entries=2)
+    cache.embed_documents(["bb"])
+    cache.embed_documents(["a"]) #read back from disk, "bb" is now the oldest
+    cache.embed_documents(["ccc"])
+    assert disk_rows(path) == 2
+    inner = CountingEmbeddings()
+    CachedEmbeddings(inner, "fake", path).embed_documents(["a", "bb", "ccc"])
+    assert inner.batches == [["bb"]]
@@ -0,0 +1,58 @@
+import threading
+from concurrent.futures import wait
+
+import pytest
+
+from generation_batcher import GenerationBatcher
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+def make_batcher(calls, generate=None, **kwargs):
+    def generate_fn(prompts, generation_kwargs):
+        calls.append((list(prompts), generation_kwargs))
+        return generate(prompts) if generate else [prompt.upper() for prompt in prompts]
+    return GenerationBatcher(generate_fn, **kwargs)
+
+
+def test_each_caller_gets_its_own_result(calls):
+    batcher = make_batcher(calls, max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit(f"q{i}") for i in range(5)]
+    assert [future.result(timeout=5) for future in futures] == [f"Q{i}" for i in range(5)]
+    assert sum(len(prompts) for prompts, _ in calls) == 5
+    assert len(calls) < 5 #batched
+    batcher.shutdown()
+
+
+def test_different_generation_kwargs_are_not_mixed(calls):
+    batcher = make_batcher(calls, max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit("a", {"do_sample": False}), batcher.submit("b", {"do_sample": True}),
+               batcher.submit("c", {"do_sample": False})]
+    assert [future.result(timeout=5) for future in futures] == ["A", "B", "C"]
+    for prompts, kwargs in calls:
+        assert prompts == (["a", "c"] if not kwargs["do_sample"] else ["b"])
+    batcher.shutdown()
+
+
+def test_batch_is_capped_at_max_batch(calls):
+    gate = threading.Event()
+    batcher = make_batcher(calls, generate=lambda prompts: gate.wait(5) and list(prompts), max_batch=2, max_wait_ms=200)
+    futures = [batcher.submit(str(i)) for i in range(5)]
+    gate.set()
+    assert [future.result(timeout=5) for future in futures] == [str(i) for i in range(5)]
+    assert max(len(prompts) for prompts, _ in calls) <= 2
+    batcher.shutdown()
+
+
+def test_failure_and_short_result_fail_every_caller(calls):
+    batcher = make_batcher(calls, generate=lambda prompts: list(prompts)[:-1], max_batch=8, max_wait_ms=200)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+    wait(futures, timeout=5)
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=0)
+    assert batcher.stats()["failed"] == 2
+    batcher.shutdown()
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from indexer import BulkIndexer, WriteBehindBuffer, decode_embedding, encode_embedding
+from models import FAQ
+
+
+def test_embedding_round_trip_keeps_its_dtype():
+    vector = [0.1, -0.25, 0.3333]
+    assert decode_embedding(encode_embedding([vector], "float32")) == [np.float32(vector).tolist()]
+    half = encode_embedding([vector], "float16")
+    assert len(half) == 1 + 2 * len(vector) #dtype tag plus 2 bytes per value
+    assert np.allclose(decode_embedding(half)[0], vector, atol=1e-3)
+
+
+def test_decoded_embedding_splits_into_one_vector_per_chunk():
+    vectors = [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    assert decode_embedding(encode_embedding(vectors, "float32"), chunks=3) == vectors
+
+
+class Recorder:
+    """Calls flush_fn receives, failing the first `failures` of them"""
+
+    def __init__(self, failures=0):
+        self.calls = []
+        self.failures = failures
+        self.flushed = threading.Event()
+
+    def __call__(self, pending):
+        self.calls.append((time.monotonic(), {source: sorted(ids) for source, ids in pending.items()}))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("chroma down")
+        self.flushed.set()
+
+
+def test_writes_to_the_same_row_coalesce():
+    flush_fn = Recorder()
+    buffer = WriteBehindBuffer(flush_fn, max_docs=100, max_delay=60)
+    for row_id in (1, 2, 1, 1):
+        buffer.add("faq", row_id)
+    buffer.add("review", 7)
+    assert buffer.flush() == 3
+    assert [pending for _, pending in flush_fn.calls] == [{"faq": [1, 2], "review": [7]}]
+    assert buffer.flush() == 0
+    buffer.shutdown()
+
+
+def test_full_buffer_flushes_in_the_background():
+    flush_fn = Recorder()
+    buffer = WriteBehindBuffer(flush_fn, max_docs=3, max_delay=60)
+    for row_id in range(3):
+        buffer.add("faq", row_id)
+    assert flush_fn.flushed.wait(2)
+    assert buffer.pending_count() == 0
+    buffer.shutdown()
+
+
+def test_failed_flush_requeues_its_rows():
+    flush_fn = Recorder(failures=1)
+    buffer = WriteBehindBuffer(flush_fn, max_docs=100, max_delay=60)
+    buffer.add("faq", 1)
+    buffer.add("faq", 2)
+    assert buffer.flush() == 0
+    assert buffer.pending_count() == 2
+    buffer.add("faq", 3) #newer writes are flushed together with the retried ones
+    assert buffer.flush() == 3
+    assert flush_fn.calls[-1][1] == {"faq": [1, 2, 3]}
+    buffer.shutdown()
+
+
+def test_retry_waits_for_the_backoff():
+    flush_fn = Recorder(failures=1)
+    buffer = WriteBehindBuffer(flush_fn, max_docs=100, max_delay=0.05)
+    buffer.add("faq", 1)
+    assert flush_fn.flushed.wait(3)
+    (failed_at, _), (retried_at, pending) = flush_fn.calls
+    assert pending == {"faq": [1]}
+    assert retried_at - failed_at >= 0.1 #max_delay * 2 after the first failure
+    buffer.shutdown()
+
+
+def test_rows_are_dropped_after_max_retries():
+    flush_fn = Recorder(failures=10)
+    buffer = WriteBehindBuffer(flush_fn, max_docs=100, max_delay=60, max_retries=2)
+    buffer.add("faq", 1)
+    buffer.flush()
+    assert buffer.pending_count() == 1
+    buffer.flush()
+    assert buffer.pending_count() == 0 #left to reconcile
+    buffer._stopping = True
+
+
+def split_chunker(source, text):
+    return text.split("|")
+
+
+@pytest.fixture
+def indexer(session, vector_store, embeddings, tmp_path):
+    return BulkIndexer(session, vector_store, embeddings, str(tmp_path / "checkpoint.json"), "fake-model", split_chunker)
+
+
+def chunk_ids(vector_store, parent_id):
+    return sorted(vector_store._collection.get(where={"parent_id": parent_id}, include=[])["ids"])
+
+
+def test_reindexing_replaces_the_chunks_of_a_row(session, vector_store, indexer):
+    faq = FAQ(hotel_id=1, question="Parking?", answer="yes|garage|free")
+    session.add(faq)
+    session.commit()
+    assert indexer.index_rows("faq", [faq]) == 1
+    assert chunk_ids(vector_store, f"faq_{faq.id}") == [f"faq_{faq.id}#0", f"faq_{faq.id}#1", f"faq_{faq.id}#2"]
+    faq.answer = "no"
+    session.commit()
+    indexer.index_rows("faq", [faq])
+    assert chunk_ids(vector_store, f"faq_{faq.id}") == [f"faq_{faq.id}#0"]
+    session.expire(faq) #the embedding was stored through the indexer's own session
+    assert indexer.index_rows("faq", [faq]) == 0 #stored embedding reused
+
+
+def test_reindexing_upserts_before_deleting(session, vector_store, indexer):
+    faq = FAQ(hotel_id=1, question="Pool?", answer="heated|open late")
+    session.add(faq)
+    session.commit()
+    indexer.index_rows("faq", [faq])
+    calls = []
+    collection = vector_store._collection
+    for name in ("upsert", "delete"):
+        original = getattr(collection, name)
+        object.__setattr__(collection, name, lambda *args, _name=name, _original=original, **kwargs:
+                           calls.append(_name) or _original(*args, **kwargs))
+    faq.answer = "heated"
+    session.commit()
+    indexer.index_rows("faq", [faq])
+    assert calls == ["upsert", "delete"] #the row always has chunks
+
+
+def test_embeddings_are_stored_without_committing_the_callers_session(session, indexer):
+    faq = FAQ(hotel_id=1, question="Pets?", answer="dogs only")
+    session.add(faq)
+    session.commit()
+    session.add(FAQ(hotel_id=1, question="Unsaved?", answer="the caller may still roll this back"))
+    indexer.index_rows("faq", [faq])
+    session.rollback()
+    assert session.query(FAQ).count() == 1
+    assert session.get(FAQ, faq.id).embedding_model == "fake-model"
@@ -0,0 +1,92 @@
+import threading
+
+from langchain_core.documents import Document
+
+from lexical import BM25Index, matches_filter, reciprocal_rank_fusion
+from rag_cache import AnswerCache
+from rag_handler import RAGSystem
+
+
+def doc(parent_id, chunk=0):
+    return Document(page_content=f"{parent_id}/{chunk}", metadata={"parent_id": parent_id, "chunk": chunk})
+
+
+def test_rrf_rewards_documents_in_both_lists():
+    a, b, c = doc("faq:1"), doc("faq:2"), doc("review:3")
+    fused = reciprocal_rank_fusion([[a, b], [c, b]])
+    assert [d.metadata["parent_id"] for d in fused] == ["faq:2", "faq:1", "review:3"]
+
+
+def test_rrf_tells_chunks_of_one_parent_apart():
+    fused = reciprocal_rank_fusion([[doc("faq:1", 0), doc("faq:1", 1)], [doc("faq:1", 0)]])
+    assert [d.metadata["chunk"] for d in fused] == [0, 1]
+
+
+def test_rrf_of_nothing():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_matches_filter():
+    metadata = {"source": "review", "hotel_id": 3}
+    assert matches_filter(metadata, None)
+    assert matches_filter(metadata, {"source": "review"})
+    assert not matches_filter(metadata, {"source": "faq"})
+    assert matches_filter(metadata, {"hotel_id": {"$in": [1, 3]}})
+    assert not matches_filter(metadata, {"hotel_id": {"$in": [1, 2]}})
+    assert matches_filter(metadata, {"$and": [{"source": "review"}, {"hotel_id": {"$in": [3]}}]})
+    assert not matches_filter(metadata, {"$and": [{"source": "review"}, {"hotel_id": 4}]})
+    assert not matches_filter({"source": "review"}, {"hotel_id": 3}) #missing key
+
+
+def bm25(*texts, hotel_id=1):
+    ids = [f"faq_{i}" for i in range(len(texts))]
+    return BM25Index(ids, list(texts), [{"parent_id": i, "source": "faq", "hotel_id": hotel_id} for i in ids])
+
+
+def test_bm25_ranks_exact_terms():
+    index = bm25("free airport shuttle every hour", "breakfast is served until ten", "the pool opens at eight")
+    assert [d.page_content for d in index.search("airport shuttle", 3)] == ["free airport shuttle every hour"]
+
+
+def test_bm25_add_replaces_and_remove_drops():
+    index = bm25("free airport shuttle", "late checkout on request")
+    index.add(["faq_0"], ["rooftop bar"], [{"parent_id": "faq_0", "source": "faq"}])
+    assert index.search("airport shuttle", 3) == []
+    assert len(index) == 2
+    index.remove(["faq_1"])
+    assert index.search("late checkout", 3) == [] and len(index) == 1
+
+
+def test_bm25_filters_by_metadata():
+    index = bm25("free airport shuttle", hotel_id=2)
+    assert index.search("airport shuttle", 3, {"hotel_id": 1}) == []
+    assert len(index.search("airport shuttle", 3, {"hotel_id": {"$in": [1, 2]}})) == 1
+
+
+def rag_with(vector_store, tmp_path):
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.db = None
+    rag._vector_store = vector_store
+    rag.cache = AnswerCache(str(tmp_path / "cache.db"))
+    rag._bm25 = {}
+    rag._bm25_lock = threading.Lock()
+    rag._bm25_building = set()
+    rag._index_version_seen = (0.0, None)
+    return rag
+
+
+def test_first_bm25_build_runs_in_the_background(vector_store, tmp_path):
+    vector_store._collection.add(ids=["faq_1"], embeddings=[[0.0] * 16], documents=["free airport shuttle every hour"],
+                                 metadatas=[{"parent_id": "faq_1", "source": "faq"}])
+    rag = rag_with(vector_store, tmp_path)
+    release, read = threading.Event(), rag._read_bm25
+    rag._read_bm25 = lambda source: release.wait(5) and read(source)
+    #nothing is read on the request thread, the lexical side is skipped until the build is done
+    assert rag._bm25_index("faq") is None
+    assert rag._lexical_search("airport shuttle", "customer", None, 5) == []
+    assert rag._bm25_building == {"faq", "review"}
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name.startswith("bm25-"):
+            thread.join(5)
+    assert [d.page_content for d in rag._bm25_index("faq").search("airport shuttle", 3)] == ["free airport shuttle every hour"]
@@ -0,0 +1,44 @@
+from rag_cache import AnswerCache
+
+ANSWER = {"answer": "Yes, free parking.", "sources": []}
+
+
+def test_write_to_one_hotel_keeps_other_hotels_answers(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.db"))
+
+    def key(hotel_ids):
+        return cache.make_key("Is there parking?", "customer", {"hotel_ids": hotel_ids}, cache.scope_version(hotel_ids))
+
+    for hotel_ids in ([1], [2], None):
+        cache.set(key(hotel_ids), ANSWER)
+    cache.bump_version([1])
+    assert cache.get(key([1])) is None
+    assert cache.get(key([2])) == ANSWER
+    assert cache.get(key(None)) is None #unscoped answers may quote any hotel
+    cache.set(key([1]), ANSWER)
+    cache.bump_version() #may touch any hotel
+    assert cache.get(key([1])) is None and cache.get(key([2])) is None
+
+
+def test_empty_scope_is_unscoped(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.db"))
+    assert cache.scope_version([]) == cache.scope_version(None)
+
+
+def test_stats_bump_only_invalidates_owner_answers(tmp_path):
+    cache = AnswerCache(str(tmp_path / "cache.db"))
+
+    def owner_key():
+        return cache.make_key("How are reviews?", "property_owner", {}, cache.scope_version([1], with_stats=True))
+
+    def customer_key():
+        return cache.make_key("How are reviews?", "customer", {}, cache.scope_version([1]))
+
+    owner = owner_key()
+    cache.set(customer_key(), ANSWER)
+    cache.set(owner, ANSWER)
+    customer_version = cache.scope_version([1])
+    cache.bump_stats_version([1])
+    assert owner_key() != owner
+    assert cache.get(customer_key()) == ANSWER
+    assert cache.scope_version([1]) == customer_version
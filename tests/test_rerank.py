@@ -0,0 +1,122 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+from langchain_core.documents import Document
+
+from model_registry import registry
+from rerank import CrossEncoderReranker
+
+
+class FakeCrossEncoder:
+    """Scores a pair by the number in the chunk text and sleeps ms_per_pair per pair"""
+
+    def __init__(self, ms_per_pair=0.0):
+        self.ms_per_pair = ms_per_pair
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append(len(pairs))
+        time.sleep(self.ms_per_pair * len(pairs) / 1000)
+        return [float(text) for _, text in pairs]
+
+
+def docs(n):
+    return [Document(page_content=str(i)) for i in range(n)]
+
+
+def loaded_reranker(model, budget_ms=1000.0):
+    name = f"reranker_{uuid4().hex}"
+    registry.register(name, lambda: model)
+    registry.get(name)
+    return CrossEncoderReranker(name, budget_ms)
+
+
+def test_reranks_by_score():
+    reranker = loaded_reranker(FakeCrossEncoder())
+    assert [d.page_content for d in reranker.rerank("q", docs(5), 3)] == ["4", "3", "2"]
+    assert reranker.stats()["reranked"] == 1
+
+
+def test_pool_shrinks_to_the_budget():
+    model = FakeCrossEncoder()
+    reranker = loaded_reranker(model, budget_ms=10.0)
+    reranker._ms_per_pair = 1.0 #10 pairs fit in the budget
+    result = reranker.rerank("q", docs(30), 3)
+    assert model.batches == [10]
+    #only the first-stage top 10 compete
+    assert [d.page_content for d in result] == ["9", "8", "7"]
+
+
+def test_budget_too_small_for_k_keeps_first_stage_order():
+    model = FakeCrossEncoder()
+    reranker = loaded_reranker(model, budget_ms=2.0)
+    reranker._ms_per_pair = 1.0
+    assert reranker.rerank("q", docs(10), 5) == docs(10)[:5]
+    assert model.batches == []
+    assert reranker.stats()["skipped_budget"] == 1
+    #the estimate decays, so re-ranking comes back once it fits again
+    assert reranker._ms_per_pair < 1.0
+
+
+def test_cost_estimate_follows_observed_latency():
+    reranker = loaded_reranker(FakeCrossEncoder(ms_per_pair=2.0))
+    reranker.rerank("q", docs(10), 3)
+    assert reranker._ms_per_pair >= 2.0
+
+
+def test_cold_model_loads_on_its_own_thread():
+    release = threading.Event()
+    threads = []
+
+    def load():
+        threads.append(threading.current_thread().name)
+        release.wait(5)
+        return FakeCrossEncoder()
+
+    name = f"reranker_{uuid4().hex}"
+    registry.register(name, load)
+    reranker = CrossEncoderReranker(name, 1000.0)
+    #the request is not held up by the load
+    assert reranker.rerank("q", docs(5), 3) == docs(5)[:3]
+    assert reranker.stats()["skipped_cold"] == 1
+    release.set()
+    reranker._loader.shutdown(wait=True)
+    assert threads[0].startswith("reranker-load")
+    assert [d.page_content for d in reranker.rerank("q", docs(5), 3)] == ["4", "3", "2"]
+    stats = reranker.stats()
+    assert stats["loaded"] and stats["load_error"] is None and "load_s" in stats
+
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("model not found")
+        return FakeCrossEncoder()
+
+    name = f"reranker_{uuid4().hex}"
+    registry.register(name, load)
+    reranker = CrossEncoderReranker(name, 1000.0)
+    assert reranker.load() is False
+    stats = reranker.stats()
+    assert stats["load_failed"] == 1 and stats["load_error"] == "OSError: model not found"
+    assert not stats["loaded"]
+    #no new attempt before the retry delay
+    reranker.rerank("q", docs(5), 3)
+    reranker._loader.submit(lambda: None).result()
+    assert len(attempts) == 1
+    reranker._retry_at = 0.0 #retry delay over
+    reranker.rerank("q", docs(5), 3)
+    reranker._loader.submit(lambda: None).result() #wait for the queued load
+    assert len(attempts) == 2
+    assert reranker.stats()["load_error"] is None
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_nothing_to_rerank(n):
+    reranker = CrossEncoderReranker(f"reranker_{uuid4().hex}", 1000.0)
+    assert reranker.rerank("q", docs(n), 3) == docs(n)
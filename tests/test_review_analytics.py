@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from models import HotelReviewStats, Review
+from review_analytics import rebuild_review_stats, record_review_labels
+
+NOW = datetime.now(timezone.utc)
+
+REVIEWS = [
+    (1, "Lovely staff.", 5.0, NOW, "positive", "joy"),
+    (1, "Noisy at night.", 2.0, NOW - timedelta(days=40), "negative", "anger"),
+    (1, "Fine.", None, NOW - timedelta(days=40), "neutral", "neutral"),
+    (2, "Great pool.", 4.5, NOW - timedelta(days=70), "positive", "joy"),
+]
+
+
+def add_reviews(session):
+    reviews = [Review(hotel_id=hotel_id, user_id=1, content=content, rating=rating, created_at=created_at)
+               for hotel_id, content, rating, created_at, _, _ in REVIEWS]
+    session.add_all(reviews)
+    session.commit()
+    return reviews
+
+
+def label(session, reviews, labels):
+    """What process_review_batch does: write the labels, then fold them into the stats"""
+    previous = [(review.sentiment, review.emotion) for review in reviews]
+    labelled = [SimpleNamespace(id=review.id, hotel_id=review.hotel_id, rating=review.rating, created_at=review.created_at,
+                                stats_counted=review.stats_counted, sentiment=sentiment, emotion=emotion)
+                for review, (sentiment, emotion) in zip(reviews, labels)]
+    for review, (sentiment, emotion) in zip(reviews, labels):
+        review.sentiment, review.emotion = sentiment, emotion
+    return record_review_labels(session, labelled, previous)
+
+
+def snapshot(session):
+    session.expire_all()
+    return {stats.hotel_id: (stats.review_count, stats.rating_count, round(stats.rating_sum, 3),
+                             stats.sentiment_counts, stats.emotion_counts, stats.rating_counts, stats.monthly)
+            for stats in session.query(HotelReviewStats)}
+
+
+def test_incremental_stats_match_rebuild(session):
+    reviews = add_reviews(session)
+    assert label(session, reviews, [(sentiment, emotion) for *_, sentiment, emotion in REVIEWS]) == [1, 2]
+    incremental = snapshot(session)
+    rebuild_review_stats(session)
+    assert snapshot(session) == incremental
+    assert incremental[1][:3] == (3, 2, 7.0)
+    assert incremental[1][3] == {"positive": 1, "negative": 1, "neutral": 1}
+
+
+def test_relabel_moves_counts_without_double_counting(session):
+    reviews = add_reviews(session)
+    label(session, reviews, [(sentiment, emotion) for *_, sentiment, emotion in REVIEWS])
+    reviews = session.query(Review).filter(Review.hotel_id == 1).order_by(Review.id).all()
+    label(session, reviews[:2], [("negative", "sadness"), ("negative", "anger")])
+    incremental = snapshot(session)
+    rebuild_review_stats(session)
+    assert snapshot(session) == incremental
+    assert incremental[1][0] == 3
+    assert incremental[1][3] == {"negative": 2, "neutral": 1}
+    assert incremental[1][4] == {"sadness": 1, "anger": 1, "neutral": 1}
+
+
+def test_reviews_labelled_before_the_stats_are_counted_once(session):
+    #labels written before the stats existed (or by an older backfill) were never counted
+    reviews = add_reviews(session)
+    for review, (*_, sentiment, _emotion) in zip(reviews, REVIEWS):
+        review.sentiment = sentiment #emotion left NULL
+    session.commit()
+    label(session, reviews, [(sentiment, emotion) for *_, sentiment, emotion in REVIEWS])
+    incremental = snapshot(session)
+    rebuild_review_stats(session)
+    assert snapshot(session) == incremental
+    assert incremental[1][0] == 3 and incremental[1][3] == {"positive": 1, "negative": 1, "neutral": 1}
+    assert all(review.stats_counted for review in session.query(Review))
+
+
+def test_relabel_after_rebuild_does_not_double_count(session):
+    reviews = add_reviews(session)
+    for review, (*_, sentiment, emotion) in zip(reviews, REVIEWS):
+        review.sentiment, review.emotion = sentiment, emotion
+    session.commit()
+    rebuild_review_stats(session)
+    reviews = session.query(Review).order_by(Review.id).all()
+    label(session, reviews, [("negative", "anger")] * len(reviews))
+    incremental = snapshot(session)
+    rebuild_review_stats(session)
+    assert snapshot(session) == incremental
+    assert incremental[1][0] == 3 and incremental[1][3] == {"negative": 3}
+
+
+def test_month_counters_never_go_negative(session):
+    reviews = add_reviews(session)[:1]
+    label(session, reviews, [("positive", "joy")])
+    stats = session.query(HotelReviewStats).filter_by(hotel_id=1).one()
+    stats.monthly = {} #the month was trimmed after the review was counted
+    session.commit()
+    label(session, session.query(Review).filter_by(id=reviews[0].id).all(), [("negative", "anger")])
+    month = session.query(HotelReviewStats).filter_by(hotel_id=1).one().monthly
+    assert min(value for counts in month.values() for value in counts.values()) >= 0
@@ -0,0 +1,84 @@
+import numpy as np
+
+from models import HotelThemeRun, Review
+from review_themes import kmeans, kmeans_themes, merge_similar, silhouette, stale_hotels, top_terms
+
+
+def blobs(centres, per_cluster=20, noise=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.concatenate([centre + noise * rng.standard_normal((per_cluster, len(centre))) for centre in centres])
+    return points.astype(np.float32), np.repeat(np.arange(len(centres)), per_cluster)
+
+
+def same_partition(labels, truth):
+    #cluster numbers are arbitrary, every true group must map to exactly one label and back
+    pairs = set(zip(labels.tolist(), truth.tolist()))
+    return len(pairs) == len(set(labels.tolist())) == len(set(truth.tolist()))
+
+
+def test_kmeans_recovers_separated_blobs():
+    matrix, truth = blobs(np.eye(3) * 5)
+    labels, centroids, distances = kmeans(matrix, 3, seed=1)
+    assert same_partition(labels, truth)
+    assert centroids.shape == (3, 3)
+    assert distances.shape == (len(matrix),) and (distances >= 0).all()
+    assert np.allclose(distances, ((matrix - centroids[labels]) ** 2).sum(axis=1), atol=1e-4)
+
+
+def test_kmeans_handles_duplicate_points():
+    matrix = np.zeros((6, 2), dtype=np.float32)
+    labels, _, distances = kmeans(matrix, 3)
+    assert len(labels) == 6 and np.allclose(distances, 0)
+
+
+def test_top_terms_prefers_distinctive_words():
+    breakfast = ["Breakfast buffet was cold, great staff", "Cold breakfast buffet, great staff",
+                 "Breakfast coffee awful, staff great"]
+    parking = ["Parking garage expensive, staff great", "Great staff but parking costs a fortune",
+               "Parking garage was full, great staff"]
+    terms = top_terms([breakfast, parking])
+    assert terms[0][0] == "breakfast" and terms[1][0] == "parking"
+    assert "great" not in terms[0][:2] and "staff" not in terms[1][:2]
+    assert "the" not in terms[0] + terms[1] and "was" not in terms[0] + terms[1]
+
+
+def test_silhouette():
+    matrix, truth = blobs(np.eye(2) * 10, per_cluster=10)
+    assert silhouette(matrix, truth) > 0.9
+    assert silhouette(matrix, np.arange(len(matrix)) % 2) < 0.1 #both clusters span both blobs
+    assert silhouette(matrix, np.zeros(len(matrix), dtype=int)) == 0.0
+
+
+def test_kmeans_themes_picks_k_by_silhouette():
+    matrix, truth = blobs(np.eye(6)[:4] * 5, per_cluster=15)
+    assert same_partition(kmeans_themes(matrix), truth)
+
+
+def test_merge_similar_joins_a_split_theme():
+    matrix, truth = blobs(np.eye(3)[:2], per_cluster=10, noise=0.01)
+    split = truth.copy()
+    split[:5] = 2 #first blob cut in two
+    texts = [f"breakfast {i}" if label == 0 else f"parking {i}" for i, label in enumerate(truth)]
+    assert same_partition(merge_similar(matrix, split, texts), truth)
+    assert same_partition(merge_similar(matrix, truth, texts), truth) #distinct themes stay apart
+
+
+def test_merge_similar_joins_clusters_with_the_same_terms():
+    matrix, truth = blobs(np.eye(3)[:2], per_cluster=10, noise=0.01)
+    texts = ["noisy street traffic at night"] * len(truth)
+    assert len(np.unique(merge_similar(matrix, truth, texts))) == 1
+
+
+def test_edited_review_marks_its_hotel_stale(session):
+    session.add_all([Review(hotel_id=hotel_id, user_id=1, content=f"review {i}", embedding_hash=f"hash{i}")
+                     for i, hotel_id in enumerate([1, 1, 2])])
+    session.commit()
+    for hotel_id, count, max_id, reviews_hash in stale_hotels(session):
+        session.add(HotelThemeRun(hotel_id=hotel_id, review_count=count, max_review_id=max_id, content_hash=reviews_hash))
+    session.commit()
+    assert stale_hotels(session) == []
+    review = session.query(Review).filter_by(hotel_id=1).first()
+    review.content, review.embedding_hash = "edited", "rehashed" #re-indexed after the edit
+    session.commit()
+    assert [row[0] for row in stale_hotels(session)] == [1]
+    assert [row[0] for row in stale_hotels(session, force=True)] == [1, 2]
@@ -0,0 +1,81 @@
+import pytest
+
+import rag_cache
+from rag_cache import AnswerCache, SemanticAnswerCache
+
+ANSWER = {"answer": "Yes, free parking.", "sources": []}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rag_cache, "time", clock)
+    return clock
+
+
+def test_semantic_hit_on_close_vector_only():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.set([1.0, 0.0], "customer", None, 1, ANSWER)
+    assert cache.get([0.99, 0.05], "customer", None, 1) == ANSWER
+    assert cache.get([0.0, 1.0], "customer", None, 1) is None
+    assert cache.get([1.0, 0.0], "property_owner", None, 1) is None #other role
+    assert cache.get([1.0, 0.0], "customer", [3], 1) is None #other hotel scope
+
+
+def test_semantic_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(ttl=60)
+    cache.set([1.0, 0.0], "customer", None, 1, ANSWER)
+    clock.now += 59
+    assert cache.get([1.0, 0.0], "customer", None, 1) == ANSWER
+    clock.now += 2
+    assert cache.get([1.0, 0.0], "customer", None, 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_semantic_evicts_least_recently_used():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.set([1.0, 0.0, 0.0], "customer", None, 1, {"answer": "a", "sources": []})
+    cache.set([0.0, 1.0, 0.0], "customer", None, 1, {"answer": "b", "sources": []})
+    assert cache.get([1.0, 0.0, 0.0], "customer", None, 1)["answer"] == "a" #a is now the most recent
+    cache.set([0.0, 0.0, 1.0], "customer", None, 1, {"answer": "c", "sources": []})
+    assert cache.get([0.0, 1.0, 0.0], "customer", None, 1) is None
+    assert cache.get([1.0, 0.0, 0.0], "customer", None, 1)["answer"] == "a"
+
+
+def test_semantic_entry_dropped_when_scope_version_moves(tmp_path):
+    versions = AnswerCache(str(tmp_path / "cache.db"))
+    cache = SemanticAnswerCache()
+    cache.set([1.0, 0.0], "customer", [1], versions.scope_version([1]), ANSWER)
+    cache.set([1.0, 0.0], "customer", [2], versions.scope_version([2]), ANSWER)
+    versions.bump_version([2])
+    assert cache.get([1.0, 0.0], "customer", [1], versions.scope_version([1])) == ANSWER
+    assert cache.get([1.0, 0.0], "customer", [2], versions.scope_version([2])) is None
+    versions.bump_version() #may touch any hotel
+    assert cache.get([1.0, 0.0], "customer", [1], versions.scope_version([1])) is None
+
+
+
+def test_semantic_stale_slots_are_reused():
+    cache = SemanticAnswerCache(max_entries=2)
+    for version in range(10):
+        cache.set([1.0, 0.0], "customer", [1], version, {"answer": str(version), "sources": []})
+        assert cache.get([1.0, 0.0], "customer", [1], version)["answer"] == str(version)
+    assert cache.stats()["entries"] == 1
+    assert len(cache._ids) <= 4 * cache.max_entries
+
+
+def test_semantic_embedder_change_starts_over():
+    cache = SemanticAnswerCache()
+    cache.set([1.0, 0.0], "customer", None, 1, ANSWER)
+    assert cache.get([1.0, 0.0, 0.0], "customer", None, 1) is None
+    cache.set([1.0, 0.0, 0.0], "customer", None, 1, ANSWER)
+    assert cache.get([1.0, 0.0, 0.0], "customer", None, 1) == ANSWER
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from indexer import BulkIndexer
+from models import FAQ
+from rag_cache import AnswerCache
+from vector_sync import VectorSync
+
+
+def parent_ids(vector_store):
+    metadatas = vector_store._collection.get(include=["metadatas"])["metadatas"]
+    return sorted({metadata["parent_id"] for metadata in metadatas})
+
+
+def test_reconcile_repairs_only_what_changed(session, vector_store, embeddings, tmp_path):
+    indexer = BulkIndexer(session, vector_store, embeddings, str(tmp_path / "checkpoint.json"), "fake-model",
+                          lambda source, text: [text])
+    cache = AnswerCache(str(tmp_path / "cache.db"))
+    rag = SimpleNamespace(write_buffer=SimpleNamespace(flush=lambda: None), _bulk_indexer=lambda: indexer,
+                          db=SimpleNamespace(session=session), vector_store=vector_store, cache=cache)
+    kept, edited, deleted = (FAQ(hotel_id=1, question=q, answer="yes") for q in ("Parking?", "Pool?", "Gym?"))
+    session.add_all([kept, edited, deleted])
+    session.commit()
+    indexer.index_rows("faq", [kept, edited, deleted])
+    #changes made behind the commit hooks' back, e.g. while the worker was down
+    edited.answer = "closed for repairs"
+    session.delete(deleted)
+    added = FAQ(hotel_id=2, question="Spa?", answer="from 9am")
+    session.add(added)
+    session.commit()
+    version = cache.content_version()
+
+    report = VectorSync(rag).reconcile()
+    assert report["faq"] == {"checked": 3, "upserted": 2, "embedded": 2, "deleted": 1}
+    assert parent_ids(vector_store) == sorted(f"faq_{faq.id}" for faq in (kept, edited, added))
+    stored = vector_store._collection.get(ids=[f"faq_{edited.id}#0"], include=["documents"])["documents"]
+    assert "closed for repairs" in stored[0]
+    assert cache.content_version() > version
+
+    #in step now: nothing is written and cached answers stay valid
+    version = cache.content_version()
+    report = VectorSync(rag).reconcile()
+    assert report["faq"] == {"checked": 3, "upserted": 0, "embedded": 0, "deleted": 0}
+    assert cache.content_version() == version
+
+
+def test_reconcile_reindexes_rows_embedded_by_another_model(session, vector_store, embeddings, tmp_path):
+    chunker = lambda source, text: [text]
+    faq = FAQ(hotel_id=1, question="Parking?", answer="yes")
+    session.add(faq)
+    session.commit()
+    BulkIndexer(session, vector_store, embeddings, str(tmp_path / "old.json"), "old-model", chunker).index_rows("faq", [faq])
+    indexer = BulkIndexer(session, vector_store, embeddings, str(tmp_path / "new.json"), "new-model", chunker)
+    rag = SimpleNamespace(write_buffer=SimpleNamespace(flush=lambda: None), _bulk_indexer=lambda: indexer,
+                          db=SimpleNamespace(session=session), vector_store=vector_store,
+                          cache=AnswerCache(str(tmp_path / "cache.db")))
+    assert VectorSync(rag).reconcile()["faq"]["upserted"] == 1
+    metadata = vector_store._collection.get(where={"parent_id": f"faq_{faq.id}"}, include=["metadatas"])["metadatas"]
+    assert [m["embedding_model"] for m in metadata] == ["new-model"]
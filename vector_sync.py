@@ -0,0 +1,120 @@
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from indexer import INDEX_SOURCES, INDEX_BATCH_SIZE
+from models import FAQ, Review
+
+logger = logging.getLogger(__name__)
+
+#columns that end up in a row's document text or metadata, other changes need no re-index
+SYNCED_COLUMNS = {
+    "faq": ("question", "answer", "hotel_id"),
+    "review": ("content", "user_id", "hotel_id"),
+}
+SOURCE_BY_MODEL = {FAQ: "faq", Review: "review"}
+PENDING_KEY = "rag_sync_pending"
+
+
+class VectorSync:
+    """Keeps the Chroma collection in step with the faqs and reviews tables.
+
+    register_events() queues every committed insert, content update and delete of a FAQ
+    or review on the RAG write-behind buffer. reconcile() is the periodic repair job: it
+    compares each SQL row's content hash and the current embedding model tag with those
+    stored in the collection metadata, batch-upserts rows that are missing, changed or
+    embedded by another model/backend and batch-deletes chunks whose row is gone. Unchanged rows are never touched and changed rows reuse their stored embedding
+    when it is still current, so neither path re-embeds unchanged content.
+    """
+
+    def __init__(self, rag, batch_size: int = INDEX_BATCH_SIZE):
+        self.rag = rag
+        self.batch_size = batch_size
+
+    def register_events(self):
+        for model in SOURCE_BY_MODEL:
+            event.listen(model, "after_insert", self._on_change)
+            event.listen(model, "after_update", self._on_update)
+            event.listen(model, "after_delete", self._on_change)
+        event.listen(Session, "after_commit", self._on_commit)
+        event.listen(Session, "after_rollback", self._on_rollback)
+
+    @staticmethod
+    def _queue(target):
+        #collect on the session and only hand over after commit, a rollback discards them
+        session = Session.object_session(target)
+        if session is not None:
+            session.info.setdefault(PENDING_KEY, set()).add((SOURCE_BY_MODEL[type(target)], target.id))
+
+    def _on_change(self, mapper, connection, target):
+        self._queue(target)
+
+    def _on_update(self, mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[column].history.has_changes() for column in SYNCED_COLUMNS[SOURCE_BY_MODEL[type(target)]]):
+            self._queue(target)
+
+    def _on_commit(self, session):
+        for source, row_id in session.info.pop(PENDING_KEY, ()):
+            self.rag.write_buffer.add(source, row_id)
+
+    def _on_rollback(self, session):
+        session.info.pop(PENDING_KEY, None)
+
+    def _indexed_hashes(self, source: str) -> dict:
+        """parent id -> (content hash, embedding model tag) for everything of `source` in the
+        collection, read page by page"""
+        collection = self.rag.vector_store._collection
+        hashes = {}
+        offset = 0
+        while True:
+            page = collection.get(where={"source": source}, include=["metadatas"],
+                                  limit=self.batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            for doc_id, metadata in zip(page["ids"], page["metadatas"]):
+                #documents from before chunking have no parent_id or hash and always count as changed
+                parent_id = metadata.get("parent_id", doc_id)
+                doc_hash = (metadata.get("content_hash"), metadata.get("embedding_model"))
+                #chunks of one row disagreeing means a half-written row, re-index it
+                hashes[parent_id] = doc_hash if hashes.get(parent_id, doc_hash) == doc_hash else None
+            offset += len(page["ids"])
+        return hashes
+
+    def reconcile(self) -> dict:
+        """Bring the collection in line with SQL, returns per-source counts. Needs an app context."""
+        self.rag.write_buffer.flush() #settle pending incremental writes first
+        indexer = self.rag._bulk_indexer()
+        session = self.rag.db.session
+        report = {}
+        for source, (model, columns, _, _) in INDEX_SOURCES.items():
+            indexed = self._indexed_hashes(source)
+            stats = {"checked": 0, "upserted": 0, "embedded": 0, "deleted": 0}
+            last_id = 0
+            while True:
+                rows = (session.query(*columns).filter(model.id > last_id)
+                        .order_by(model.id).limit(self.batch_size).all())
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                chunked, hashes = indexer.chunk_rows(source, rows)
+                changed = [i for i, (row, doc_hash) in enumerate(zip(rows, hashes))
+                           if indexed.pop(f"{source}_{row.id}", None) != (doc_hash, indexer.model_name)]
+                stats["checked"] += len(rows)
+                if changed:
+                    stats["embedded"] += indexer.index_rows(
+                        source, [rows[i] for i in changed],
+                        chunked=[chunked[i] for i in changed], hashes=[hashes[i] for i in changed])
+                    stats["upserted"] += len(changed)
+            #whatever is left in the collection has no row in SQL anymore
+            orphans = list(indexed)
+            for start in range(0, len(orphans), self.batch_size):
+                indexer.delete_parents(orphans[start:start + self.batch_size])
+            stats["deleted"] = len(orphans)
+            report[source] = stats
+            logger.info("Reconciled %s: %s", source, stats)
+        if any(stats["upserted"] or stats["deleted"] for stats in report.values()):
+            self.rag.cache.bump_index_version()
+            self.rag.cache.bump_version()
+        return report